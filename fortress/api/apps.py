@@ -5,6 +5,4 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
-        pass
-        # место для сигналов, если понадобится
-        # from . import signals  # noqa: F401
+        from . import signals  # noqa: F401
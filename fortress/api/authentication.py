@@ -0,0 +1,195 @@
+# api/authentication.py
+"""
+JWT-аутентификация без SELECT пользователя на каждый запрос.
+
+- при выдаче токенов (auth/token/, auth/token/refresh/) в них кладутся
+  claims role, username, is_staff — всё, что читают права доступа и виды;
+- ClaimsJWTAuthentication строит пользователя из claims: экземпляр User
+  с заполненными id/username/role/is_staff/is_active, остальные поля
+  отложены (deferred) и догрузятся одним запросом, только если их прочитать;
+- если claims нет (токен выдан до этой схемы) или пользователь менялся
+  после выдачи токена — пользователь читается из БД через короткий кэш
+  в памяти процесса (USER_CACHE_TTL), который сбрасывается при сохранении User.
+
+Смена роли или блокировка в другом процессе вступят в силу не позже,
+чем истечёт access-токен (ACCESS_TOKEN_LIFETIME): при обновлении по
+refresh claims перечитываются из БД.
+"""
+import copy
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+CLAIM_FIELDS = ('username', 'role', 'is_staff')
+
+
+# -----------------------------
+# Пользователи в памяти процесса
+# -----------------------------
+
+class UserCache:
+    """
+    Пользователи по id на ttl секунд. invalidate() (сигнал post_save/post_delete User)
+    удаляет запись и запоминает время изменения: claims токенов, выданных раньше,
+    этому процессу больше не верим.
+    """
+
+    def __init__(self, ttl: float = 30.0, remember_changes: float = 3600.0):
+        self.ttl = ttl
+        self.remember_changes = remember_changes
+        self._lock = threading.Lock()
+        self._users: Dict[int, Tuple[float, User]] = {}
+        self._changed: Dict[int, float] = {}   # user_id -> время изменения (unix)
+
+    def get(self, user_id) -> Optional[User]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._users[user_id]
+                return None
+            # Копия: запрос может менять свой request.user, общий экземпляр — нет
+            return copy.copy(entry[1])
+
+    def put(self, user: User):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._users[user.pk] = (time.monotonic() + self.ttl, copy.copy(user))
+
+    def invalidate(self, user_id):
+        now = time.time()
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._changed[user_id] = now
+            # Токены старше remember_changes всё равно истекли
+            if len(self._changed) > 1000:
+                deadline = now - self.remember_changes
+                self._changed = {uid: t for uid, t in self._changed.items() if t >= deadline}
+
+    def changed_since(self, user_id, timestamp: float) -> bool:
+        changed = self._changed.get(user_id)
+        return changed is not None and changed >= timestamp
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._changed.clear()
+
+
+_config = getattr(settings, 'JWT_AUTH', {})
+user_cache = UserCache(
+    ttl=_config.get('USER_CACHE_TTL', 30.0),
+    remember_changes=api_settings.ACCESS_TOKEN_LIFETIME.total_seconds(),
+)
+
+
+def _user_id(token):
+    # simplejwt пишет id строкой; в приложении он сравнивается с целыми
+    try:
+        return User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+    except KeyError:
+        raise InvalidToken('В токене нет идентификатора пользователя')
+    except ValidationError:
+        raise InvalidToken('Некорректный идентификатор пользователя в токене')
+
+
+def user_from_claims(token) -> User:
+    """Пользователь из claims токена, без обращения к БД."""
+    known = {name: token[name] for name in CLAIM_FIELDS}
+    known.update(id=_user_id(token), is_active=True)
+    # from_db ждёт значения в порядке полей модели; прочие поля станут отложенными
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in known]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [known[name] for name in fields])
+
+
+def has_user_claims(token) -> bool:
+    return all(name in token for name in CLAIM_FIELDS)
+
+
+def get_token_user(token) -> User:
+    """
+    Пользователь проверенного токена: из claims, если им можно верить,
+    иначе из БД (через user_cache). AuthenticationFailed — нет или заблокирован.
+    """
+    user_id = _user_id(token)
+    if (_config.get('TRUST_CLAIMS', True) and has_user_claims(token)
+            and not user_cache.changed_since(user_id, token.get('iat', 0))):
+        return user_from_claims(token)
+
+    user = user_cache.get(user_id)
+    if user is None:
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('Пользователь заблокирован', code='user_inactive')
+        user_cache.put(user)
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, которая не читает пользователя из БД, если хватает claims."""
+
+    def get_user(self, validated_token):
+        return get_token_user(validated_token)
+
+
+# -----------------------------
+# Выдача токенов с claims
+# -----------------------------
+
+def add_user_claims(token, user: User):
+    for name in CLAIM_FIELDS:
+        token[name] = getattr(user, name)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh-токен с claims пользователя. Access-токен при обновлении получает
+    claims, перечитанные из БД, — роль, сменённая после входа, не живёт до
+    истечения refresh-токена.
+    """
+    _user: Optional[User] = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        add_user_claims(token, user)
+        token._user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        access.set_iat()  # иначе iat копируется из refresh-токена
+        user = self._user
+        if user is None:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: self.get(api_settings.USER_ID_CLAIM)}).first()
+        if user is not None:
+            add_user_claims(access, user)
+        return access
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
@@ -0,0 +1,325 @@
+# api/battle_state.py
+"""
+Живое состояние битв: счёт участников в памяти процесса.
+
+- по каждой идущей битве — очки, верные ответы и попытки участников и их
+  порядок (больше очков; при равенстве — больше верных; затем кто раньше
+  набрал последнее очко; затем меньший id);
+- принимает ли битва ответы, решает БД (check_accepts_answers), память —
+  только для таблицы счёта;
+- состояние загружается одним запросом по Submission при первом обращении
+  и перечитывается не реже max_age секунд (страховка от ответов,
+  принятых другими процессами), ответы этого процесса применяются сразу
+  после коммита — по id ответа, так что ответ, уже прочитанный из БД при
+  перечитывании, дельтой не задваивается;
+- сокет при подключении получает снимок (battle_snapshot), дальше — дельты
+  (battle_standing) по изменившимся участникам с номером версии: дельты с
+  версией не новее снимка клиент пропускает. Дельта — кадр-состояние с ключом
+  standing:{student_id}, так что неотправленная устаревшая дельта заменяется свежей;
+- при закрытии битвы (close_battle) итоговая таблица считается по БД и
+  сохраняется в Battle.standings, сокеты получают battle_closed; ответ,
+  допроверенный уже после закрытия (отложенная проверка), пересчитывает её
+  (refresh_final_standings) и рассылает battle_closed ещё раз — дельт живого
+  счёта закрытая битва не получает.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .broadcast import battle_group, broadcaster
+from .models import Battle, Submission, TeamMembership
+
+
+class BattleClosed(APIException):
+    """Ответ на задание битвы, которая уже не принимает ответы."""
+    status_code = 409
+    default_detail = 'Битва завершена: ответы больше не принимаются'
+    default_code = 'battle_closed'
+
+
+class BattleStateError(ValueError):
+    """Недопустимый переход состояния битвы."""
+
+
+def _ts(value) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+# -----------------------------
+# Счёт одной битвы
+# -----------------------------
+
+class LiveBattle:
+    """
+    Участники битвы: student_id → [очки, верных, попыток, время последнего очка],
+    отсортированный список ключей порядка (поиск места — бинарный) и id учтённых ответов.
+    """
+
+    def __init__(self, battle: Battle, roster: Iterable[int], submissions, version: int = 0):
+        self.battle_id = battle.id
+        self.status = battle.status
+        self.ends_at = battle.ends_at
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.stats: Dict[int, list] = {sid: [0, 0, 0, None] for sid in roster}
+        self.applied: Set[int] = set()
+        for submission_id, sid, points, is_correct, checked_at in submissions:
+            self._add(sid, points, is_correct, checked_at)
+            self.applied.add(submission_id)
+        self.order: List[tuple] = sorted(self._key(sid) for sid in self.stats)
+
+    def _key(self, student_id: int) -> tuple:
+        points, correct, _, last_scored = self.stats[student_id]
+        return (-points, -correct, last_scored if last_scored is not None else float('inf'), student_id)
+
+    def _add(self, student_id: int, points: int, is_correct: bool, checked_at):
+        stats = self.stats.setdefault(student_id, [0, 0, 0, None])
+        stats[0] += points or 0
+        stats[1] += int(bool(is_correct))
+        stats[2] += 1
+        if points:
+            scored = _ts(checked_at)
+            if stats[3] is None or scored > stats[3]:
+                stats[3] = scored
+
+    def apply(self, student_id: int, points: int, is_correct: bool, checked_at,
+              submission_id: Optional[int] = None) -> bool:
+        """Учесть проверенный ответ; False — ответ с этим id уже учтён."""
+        if submission_id is not None:
+            if submission_id in self.applied:
+                return False
+            self.applied.add(submission_id)
+        if student_id in self.stats:
+            del self.order[bisect_left(self.order, self._key(student_id))]
+        self._add(student_id, points, is_correct, checked_at)
+        insort(self.order, self._key(student_id))
+        self.version += 1
+        return True
+
+    def rank(self, student_id: int) -> int:
+        return bisect_left(self.order, self._key(student_id)) + 1
+
+    def row(self, student_id: int, rank: Optional[int] = None) -> dict:
+        points, correct, attempts, _ = self.stats[student_id]
+        return {
+            "rank": rank or self.rank(student_id),
+            "student_id": student_id,
+            "points": points,
+            "correct": correct,
+            "attempts": attempts,
+        }
+
+    def standings(self) -> List[dict]:
+        return [self.row(key[-1], rank) for rank, key in enumerate(self.order, start=1)]
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "battle_snapshot",
+            "battle": self.battle_id,
+            "status": self.status,
+            "version": self.version,
+            "standings": self.standings(),
+        }
+
+    def delta(self, student_id: int) -> dict:
+        return dict(self.row(student_id), type="battle_standing", battle=self.battle_id, version=self.version)
+
+
+# -----------------------------
+# Все битвы процесса
+# -----------------------------
+
+def _load_submissions(battle_id: int):
+    # По строке на проверенный ответ: счёт складывается в памяти, а id ответов
+    # запоминаются, чтобы не применить их ещё раз дельтой после коммита
+    return (
+        Submission.objects.filter(assignment__battle_id=battle_id, checked_at__isnull=False)
+        .order_by()
+        .values_list('id', 'student_id', 'points_awarded', 'is_correct', 'checked_at')
+        .iterator()
+    )
+
+
+class LiveBattleRegistry:
+    """Живые битвы в памяти процесса (по образцу MemoryLeaderboard)."""
+
+    def __init__(self, max_age: float = 300.0):
+        self.max_age = max_age
+        self._battles: Dict[int, LiveBattle] = {}
+        self._lock = threading.RLock()
+
+    def _load(self, battle: Battle, version: int = 0) -> LiveBattle:
+        roster = TeamMembership.objects.filter(team_id=battle.team_id).values_list('student_id', flat=True)
+        live = LiveBattle(battle, roster, _load_submissions(battle.id), version)
+        if battle.status == Battle.Status.LIVE:
+            self._battles[battle.id] = live
+        return live
+
+    def get(self, battle_id: int, battle: Optional[Battle] = None) -> Tuple[Optional[LiveBattle], bool]:
+        """(состояние битвы, только что загружено из БД); (None, False) — битвы нет."""
+        with self._lock:
+            live = self._battles.get(battle_id)
+            if live is not None and time.monotonic() - live.loaded_at <= self.max_age:
+                return live, False
+            if battle is None:
+                battle = Battle.objects.filter(id=battle_id).first()
+                if battle is None:
+                    return None, False
+            # Версия не откатывается при перечитывании: клиенты сравнивают её со снимком
+            return self._load(battle, live.version + 1 if live else 0), True
+
+    def snapshot(self, battle: Battle) -> dict:
+        if battle.status != Battle.Status.LIVE:
+            return {
+                "type": "battle_snapshot",
+                "battle": battle.id,
+                "status": battle.status,
+                "version": 0,
+                "standings": battle.standings,
+            }
+        with self._lock:
+            live, _ = self.get(battle.id, battle)
+            return live.snapshot()
+
+    def apply(self, submissions: Iterable[Submission]) -> Dict[int, List[dict]]:
+        """Учесть проверенные ответы; вернуть дельты по битвам: {battle_id: [delta, ...]}."""
+        by_battle: Dict[int, List[Submission]] = {}
+        for s in submissions:
+            if s.assignment.battle_id and s.checked_at is not None:
+                by_battle.setdefault(s.assignment.battle_id, []).append(s)
+
+        deltas: Dict[int, List[dict]] = {}
+        with self._lock:
+            for battle_id, items in by_battle.items():
+                live, _ = self.get(battle_id)
+                if live is None or live.status != Battle.Status.LIVE:
+                    continue  # закрытой битве дельты не нужны: итог придёт в battle_closed
+                # Ответ мог попасть в состояние при перечитывании из БД (здесь или в другом
+                # запросе после коммита) — такой пропускается по id
+                for s in items:
+                    live.apply(s.student_id, s.points_awarded, s.is_correct, s.checked_at, s.id)
+                deltas[battle_id] = [live.delta(sid) for sid in dict.fromkeys(s.student_id for s in items)]
+        return deltas
+
+    def discard(self, battle_id: int):
+        with self._lock:
+            self._battles.pop(battle_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._battles.clear()
+
+
+_config = getattr(settings, 'BATTLE_LIVE', {})
+live_battles = LiveBattleRegistry(max_age=_config.get('MAX_AGE', 300.0))
+
+
+# -----------------------------
+# Приём ответов и закрытие битвы
+# -----------------------------
+
+def check_accepts_answers(assignments: Iterable) -> None:
+    """
+    BattleClosed, если хоть одно задание из битвы, которая уже не принимает ответы.
+
+    Решение — по БД, не по живому счёту: закрытие в другом процессе этот процесс
+    узнаёт не сразу. Строки битв блокируются до конца транзакции приёма ответа,
+    так что close_battle ждёт её и итоговая таблица учитывает принятые ответы.
+    Вызывать внутри transaction.atomic.
+    """
+    battle_ids = {a.battle_id for a in assignments if a.battle_id}
+    if not battle_ids:
+        return
+    now = timezone.now()
+    battles = Battle.objects.select_for_update().only('id', 'status', 'ends_at').filter(id__in=battle_ids)
+    if not all(b.accepts_answers(now) for b in battles):
+        raise BattleClosed()
+
+
+def publish_graded(submissions: Iterable[Submission]):
+    """
+    После коммита: учесть ответы в живом счёте и разослать участникам идущей
+    битвы события ответов и дельты счёта. assignment у ответов должен быть загружен.
+    """
+    submissions = [s for s in submissions if s.assignment.battle_id]
+    if not submissions:
+        return
+
+    def send():
+        deltas = live_battles.apply(submissions)
+        frames: Dict[int, list] = {}
+        for s in submissions:
+            if s.assignment.battle_id not in deltas:
+                continue
+            frames.setdefault(s.assignment.battle_id, []).append((None, {
+                "student_id": s.student_id,
+                "points": s.points_awarded,
+                "is_correct": s.is_correct,
+                "feedback": s.feedback,
+            }))
+        for battle_id, items in deltas.items():
+            frames[battle_id].extend((f"standing:{d['student_id']}", d) for d in items)
+        for battle_id, items in frames.items():
+            broadcaster.enqueue(battle_group(battle_id), items)
+
+    transaction.on_commit(send)
+
+
+def lock_battle(battle_id: Optional[int]) -> Optional[Battle]:
+    """
+    Заблокировать строку битвы до конца транзакции (None — задание не из битвы).
+    Запись вердикта отложенной проверки делает это раньше, чем меняет счёт:
+    close_battle либо ждёт её, либо уже закрыл битву — тогда нужен refresh_final_standings.
+    """
+    if not battle_id:
+        return None
+    return Battle.objects.select_for_update().filter(id=battle_id).first()
+
+
+def final_standings(battle: Battle) -> List[dict]:
+    """Итоговая таблица по БД (не по памяти: учтены ответы всех процессов)."""
+    roster = TeamMembership.objects.filter(team_id=battle.team_id).values_list('student_id', flat=True)
+    return LiveBattle(battle, roster, _load_submissions(battle.id)).standings()
+
+
+@transaction.atomic
+def close_battle(battle_id: int, status: str) -> Battle:
+    """
+    Перевести битву в FINISHED или CANCELLED и сохранить итоговую таблицу.
+    BattleStateError — если переход не разрешён (битва уже закрыта).
+    """
+    battle = Battle.objects.select_for_update().get(id=battle_id)
+    if not battle.can_transition_to(status):
+        raise BattleStateError(f'Битву в состоянии {battle.status} нельзя перевести в {status}')
+    battle.status = status
+    battle.finished_at = timezone.now()
+    battle.standings = final_standings(battle)
+    battle.save(update_fields=['status', 'finished_at', 'standings'])
+    transaction.on_commit(lambda: _announce_closed(battle))
+    return battle
+
+
+def refresh_final_standings(battle: Battle):
+    """
+    Ответ битвы допроверен после её закрытия: пересчитать сохранённую итоговую
+    таблицу и разослать её заново. battle заблокирована lock_battle.
+    """
+    battle.standings = final_standings(battle)
+    battle.save(update_fields=['standings'])
+    transaction.on_commit(lambda: _announce_closed(battle))
+
+
+def _announce_closed(battle: Battle):
+    live_battles.discard(battle.id)
+    broadcaster.enqueue(battle_group(battle.id), [("status", {
+        "type": "battle_closed",
+        "battle": battle.id,
+        "status": battle.status,
+        "standings": battle.standings,
+    })])
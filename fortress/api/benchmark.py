@@ -0,0 +1,470 @@
+# api/benchmark.py
+"""
+Нагрузочный прогон «живой битвы» (manage.py benchmark).
+
+Всё выполняется в одном процессе на отдельной тестовой БД (SQLite-файл во
+временном каталоге; рабочая БД не затрагивается) и внутрипроцессном channel
+layer (api/channel_layers.py):
+
+1. заполняем N классов с командами, учениками и банком задач L1..L5;
+2. учитель каждого класса запускает битву через POST /api/battles/launch;
+3. ученики параллельно (пул потоков) отправляют ответы через POST /api/submissions/;
+4. ученики отвечают через сокет битвы, а все сокеты команды ловят рассылку —
+   измеряем задержку доставки обновления остальным участникам (fan-out);
+5. учитель и ученики открывают отчёты класса и ученика и таблицу битвы;
+6. учителя завершают битвы (итоговая таблица сохраняется).
+
+По каждому сценарию — пропускная способность, p50/p95/p99 задержки и число
+SQL-запросов (по api/metrics.py); результат — JSON, который можно сохранить
+как базовую линию и сравнить с прогоном на другой ветке (--compare).
+"""
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import django
+from channels.layers import DEFAULT_CHANNEL_LAYER, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.test import APIClient
+
+from .authentication import ClaimsRefreshToken
+from .channel_layers import LocalChannelLayer
+from .metrics import metrics
+from .models import Assignment, ClassMembership, Classroom, Task, Team, TeamMembership, User
+from .score_ledger import score_buffer
+from .task_index import task_index
+
+LEVELS = range(1, 6)
+
+
+# -----------------------------
+# Статистика
+# -----------------------------
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга (значения уже отсортированы)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p * len(sorted_values) / 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyStats:
+    """Задержки одного сценария (секунды), ошибки и число SQL-запросов на операцию."""
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.queries: List[int] = []
+        self.errors = 0
+        self.wall = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, queries: Optional[int] = None, ok: bool = True):
+        with self._lock:
+            if not ok:
+                self.errors += 1
+                return
+            self.samples.append(seconds)
+            if queries is not None:
+                self.queries.append(queries)
+
+    def summary(self) -> dict:
+        values = sorted(self.samples)
+        ms = [v * 1000 for v in values]
+        result = {
+            'count': len(values),
+            'errors': self.errors,
+            'throughput_rps': round(len(values) / self.wall, 2) if self.wall else 0.0,
+            'p50_ms': round(percentile(ms, 50), 3),
+            'p95_ms': round(percentile(ms, 95), 3),
+            'p99_ms': round(percentile(ms, 99), 3),
+            'mean_ms': round(sum(ms) / len(ms), 3) if ms else 0.0,
+            'max_ms': round(ms[-1], 3) if ms else 0.0,
+        }
+        if self.queries:
+            result['queries_avg'] = round(sum(self.queries) / len(self.queries), 2)
+            result['queries_max'] = max(self.queries)
+        return result
+
+
+# -----------------------------
+# Отдельная БД и channel layer
+# -----------------------------
+
+@contextmanager
+def bench_environment(db_path: Optional[str] = None, keep_db: bool = False):
+    """
+    Тестовая БД вместо рабочей (как у test runner'а) и внутрипроцессный channel layer.
+    Для SQLite — файл с WAL и BEGIN IMMEDIATE: параллельные писатели ждут блокировку,
+    а не падают с «database is locked».
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(
+            db_path or Path(tempfile.gettempdir()) / 'fortress_benchmark.sqlite3'
+        )
+        connection.settings_dict.setdefault('OPTIONS', {}).update(
+            timeout=30, transaction_mode='IMMEDIATE', init_command='PRAGMA journal_mode=WAL;'
+        )
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    channel_layers.set(DEFAULT_CHANNEL_LAYER, LocalChannelLayer())
+    try:
+        yield connection.settings_dict['NAME']
+    finally:
+        connections.close_all()
+        if not keep_db:
+            test_name = connection.settings_dict['NAME']
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if connection.vendor == 'sqlite':
+                for suffix in ('-wal', '-shm'):
+                    Path(f'{test_name}{suffix}').unlink(missing_ok=True)
+
+
+# -----------------------------
+# Прогон
+# -----------------------------
+
+class BattleBenchmark:
+
+    def __init__(self, classes: int = 2, teams_per_class: int = 4, students_per_team: int = 5,
+                 tasks_per_level: int = 10, rounds: int = 3, ws_rounds: int = 3, dashboard_requests: int = 50,
+                 concurrency: int = 8, wrong_ratio: float = 0.3, seed: int = 1):
+        self.params = {
+            'classes': classes, 'teams_per_class': teams_per_class, 'students_per_team': students_per_team,
+            'tasks_per_level': tasks_per_level, 'rounds': rounds, 'ws_rounds': ws_rounds,
+            'dashboard_requests': dashboard_requests, 'concurrency': concurrency,
+            'wrong_ratio': wrong_ratio, 'seed': seed,
+        }
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        self.teachers: Dict[int, User] = {}                   # classroom_id -> учитель
+        self.students: Dict[int, User] = {}
+        self.team_members: Dict[int, List[int]] = {}          # team_id -> [student_id]
+        self.student_class: Dict[int, int] = {}
+        self.assignment_of: Dict[int, Assignment] = {}        # student_id -> задание его команды
+        self.scenarios: Dict[str, LatencyStats] = {}
+        self._tokens: Dict[int, str] = {}
+        self.fanout = LatencyStats()
+
+    def run(self, progress=None) -> dict:
+        progress = progress or (lambda message: None)
+        metrics.reset()
+
+        started = time.perf_counter()
+        self.seed()
+        seed_seconds = time.perf_counter() - started
+        progress(f'Классов: {len(self.teachers)}, учеников: {len(self.students)} ({seed_seconds:.1f} с)')
+
+        self.launch_battles()
+        progress('Битвы запущены')
+        self.http_submissions()
+        progress('HTTP-ответы отправлены')
+        asyncio.run(self.ws_submissions())
+        progress('Ответы через сокет отправлены')
+        self.dashboards()
+        progress('Отчёты открыты')
+        self.close_battles()
+        progress('Битвы завершены')
+
+        endpoints = metrics.snapshot()
+        scenarios = {name: stats.summary() for name, stats in self.scenarios.items()}
+        # SQL на сообщение сокета видит только metrics.track() внутри consumer'а
+        ws = endpoints.get('ws BattleConsumer.submit_answer')
+        if ws and 'ws_submit' in scenarios:
+            scenarios['ws_submit']['queries_avg'] = ws['queries_avg']
+        fanout = self.fanout.summary()
+        fanout.pop('throughput_rps')
+        return {
+            'meta': self._meta(),
+            'params': self.params,
+            'seed_seconds': round(seed_seconds, 3),
+            'scenarios': scenarios,
+            'fanout': fanout,
+            'endpoints': endpoints,
+        }
+
+    # --- данные ---
+
+    def seed(self):
+        password = make_password(None)
+        p = self.params
+        Task.objects.bulk_create([
+            Task(title=f'L{level}-{i}', body_md='bench', tags=[f'L{level}', 'bench'], level=level,
+                 expected_answer=str(level * 100 + i))
+            for level in LEVELS for i in range(p['tasks_per_level'])
+        ])
+        task_index.invalidate()  # bulk_create не шлёт сигналы
+
+        for c in range(p['classes']):
+            teacher = User.objects.create(username=f'bench_t{c}', role=User.Role.TEACHER, password=password)
+            classroom = Classroom.objects.create(name=f'Bench {c}', teacher=teacher, code=f'BENCH{c:05d}')
+            self.teachers[classroom.id] = teacher
+            for t in range(p['teams_per_class']):
+                team = Team.objects.create(classroom=classroom, name=f'Team {c}-{t}')
+                users = User.objects.bulk_create([
+                    User(username=f'bench_s{c}_{t}_{s}', role=User.Role.STUDENT, password=password)
+                    for s in range(p['students_per_team'])
+                ])
+                ClassMembership.objects.bulk_create([ClassMembership(classroom=classroom, student=u) for u in users])
+                TeamMembership.objects.bulk_create([TeamMembership(team=team, student=u) for u in users])
+                self.team_members[team.id] = [u.id for u in users]
+                for u in users:
+                    self.students[u.id] = u
+                    self.student_class[u.id] = classroom.id
+
+    # --- сценарии ---
+
+    def _token(self, user) -> str:
+        token = self._tokens.get(user.id)
+        if token is None:
+            token = self._tokens[user.id] = str(ClaimsRefreshToken.for_user(user).access_token)
+        return token
+
+    def _client(self, user) -> APIClient:
+        # Настоящий access-токен, а не force_authenticate: аутентификация входит в замер
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self._token(user)}')
+        return client
+
+    def _request(self, stats: LatencyStats, user, method: str, url: str, data=None, ok=(200, 201, 202)):
+        started = time.perf_counter()
+        try:
+            client = self._client(user)
+            if method == 'post':
+                response = client.post(url, data, format='json')
+            else:
+                response = client.get(url, data)
+            elapsed = time.perf_counter() - started
+            measurement = getattr(getattr(response, 'wsgi_request', None), '_metrics', None)
+            stats.add(elapsed, measurement.queries if measurement else None, ok=response.status_code in ok)
+            return response
+        except Exception:
+            stats.add(time.perf_counter() - started, ok=False)
+            return None
+
+    def _run_parallel(self, name: str, jobs):
+        stats = self.scenarios.setdefault(name, LatencyStats())
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'bench-{name}') as pool:
+            results = list(pool.map(lambda job: job(stats), jobs))
+        stats.wall += time.perf_counter() - started
+        return results
+
+    def launch_battles(self):
+        jobs = [
+            (lambda stats, cid=cid, teacher=teacher:
+                self._request(stats, teacher, 'post', '/api/battles/launch', {'classId': cid}))
+            for cid, teacher in self.teachers.items()
+        ]
+        assignment_ids = []
+        for response in self._run_parallel('battle_launch', jobs):
+            if response is not None and response.status_code == 201:
+                assignment_ids += response.data['assignments']
+
+        # У Assignment нет ученика: раздаём задания команды её участникам по порядку
+        by_team: Dict[int, List[Assignment]] = {}
+        for a in Assignment.objects.filter(id__in=assignment_ids).select_related('task').order_by('id'):
+            by_team.setdefault(a.team_id, []).append(a)
+        for team_id, members in self.team_members.items():
+            for student_id, assignment in zip(members, by_team.get(team_id, [])):
+                self.assignment_of[student_id] = assignment
+
+    def _answer(self, student_id: int) -> str:
+        if self.random.random() < self.params['wrong_ratio']:
+            return 'wrong'
+        return self.assignment_of[student_id].task.expected_answer
+
+    def http_submissions(self):
+        jobs = []
+        for attempt in range(1, self.params['rounds'] + 1):
+            for student_id, assignment in self.assignment_of.items():
+                body = {'assignment': assignment.id, 'student': student_id,
+                        'answer_payload': {'answer': self._answer(student_id)}, 'attempt_no': attempt}
+                jobs.append(lambda stats, sid=student_id, body=body:
+                            self._request(stats, self.students[sid], 'post', '/api/submissions/', body))
+        self._run_parallel('http_submit', jobs)
+        if score_buffer is not None:
+            score_buffer.flush()
+
+    async def ws_submissions(self):
+        from fortress.routing import application
+
+        stats = self.scenarios.setdefault('ws_submit', LatencyStats())
+        sent_at: Dict[tuple, float] = {}     # (battle_id, student_id) -> время отправки ответа
+        pending: Dict[str, asyncio.Future] = {}
+        sockets = []
+
+        async def reader(comm, battle_id):
+            while True:
+                try:
+                    message = json.loads(await comm.receive_from(timeout=3600))
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    return
+                except Exception:
+                    return
+                kind = message.get('type')
+                if kind == 'answer_result':
+                    future = pending.pop(message.get('requestId'), None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                elif kind in ('battle.update', 'battle_batch'):
+                    now = time.perf_counter()
+                    updates = [message['message']] if kind == 'battle.update' else message.get('messages', [])
+                    for update in updates:
+                        # Дельты счёта (battle_standing) идут вместе с событием ответа — считаем только события
+                        if not isinstance(update, dict) or 'type' in update:
+                            continue
+                        origin = sent_at.get((battle_id, update.get('student_id')))
+                        if origin is not None:
+                            self.fanout.add(now - origin)
+
+        for team_id, members in self.team_members.items():
+            for student_id in members:
+                if student_id not in self.assignment_of:
+                    continue
+                # Полный ASGI-стек: аутентификация по токену и проверка доступа к битве входят в замер
+                token = self._token(self.students[student_id])
+                battle_id = self.assignment_of[student_id].battle_id
+                comm = WebsocketCommunicator(application, f'/ws/battle/{battle_id}/?token={token}')
+                connected, _ = await comm.connect()
+                if not connected:
+                    stats.add(0, ok=False)
+                    continue
+                await comm.receive_from()  # connection_success
+                await comm.receive_from()  # battle_snapshot
+                sockets.append((comm, team_id, student_id, asyncio.ensure_future(reader(comm, team_id))))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def submit(comm, team_id, student_id, attempt):
+            async with semaphore:
+                request_id = f'{student_id}:{attempt}'
+                future = pending[request_id] = loop.create_future()
+                started = time.perf_counter()
+                sent_at[(team_id, student_id)] = started
+                await comm.send_json_to({
+                    'action': 'submit_answer', 'assignment': self.assignment_of[student_id].id,
+                    'answer': self._answer(student_id), 'attempt_no': 100 + attempt, 'requestId': request_id,
+                })
+                try:
+                    await asyncio.wait_for(future, 30)
+                    stats.add(time.perf_counter() - started)
+                except asyncio.TimeoutError:
+                    pending.pop(request_id, None)
+                    stats.add(0, ok=False)
+
+        # Раунды по очереди: рассылку раунда дожидаемся до следующего,
+        # чтобы задержку доставки считать от своей отправки
+        settle = (settings.BATTLE_BROADCAST.get('FLUSH_INTERVAL_MS', 50)
+                  + settings.BATTLE_SOCKET.get('FLUSH_INTERVAL_MS', 100)) / 1000 * 3
+        for attempt in range(1, self.params['ws_rounds'] + 1):
+            started = time.perf_counter()
+            await asyncio.gather(*(submit(comm, tid, sid, attempt) for comm, tid, sid, _ in sockets))
+            stats.wall += time.perf_counter() - started
+            await asyncio.sleep(settle)
+
+        for comm, _, _, task in sockets:
+            task.cancel()
+            await comm.disconnect()
+        if score_buffer is not None:
+            await asyncio.to_thread(score_buffer.flush)
+
+    def dashboards(self):
+        n = self.params['dashboard_requests']
+        class_ids = list(self.teachers)
+        student_ids = list(self.students)
+        overview = [
+            (lambda stats, cid=self.random.choice(class_ids):
+                self._request(stats, self.teachers[cid], 'get', f'/api/reports/class/{cid}/overview'))
+            for _ in range(n)
+        ]
+        student = [
+            (lambda stats, sid=self.random.choice(student_ids):
+                self._request(stats, self.students[sid], 'get', f'/api/reports/student/{sid}',
+                              {'classId': self.student_class[sid]}))
+            for _ in range(n)
+        ]
+        leaderboard = [
+            (lambda stats, cid=self.random.choice(class_ids):
+                self._request(stats, self.teachers[cid], 'get', '/api/leaderboard', {'classId': cid, 'top': 10}))
+            for _ in range(n)
+        ]
+        battle = [
+            (lambda stats, sid=self.random.choice(student_ids):
+                self._request(stats, self.students[sid], 'get', f'/api/battles/{self.assignment_of[sid].battle_id}'))
+            for _ in range(n) if self.assignment_of
+        ]
+        self._run_parallel('dashboard_overview', overview)
+        self._run_parallel('dashboard_student', student)
+        self._run_parallel('dashboard_leaderboard', leaderboard)
+        self._run_parallel('dashboard_battle', battle)
+
+    def close_battles(self):
+        teacher_of = {}
+        for sid, assignment in self.assignment_of.items():
+            teacher_of[assignment.battle_id] = self.teachers[self.student_class[sid]]
+        jobs = [
+            (lambda stats, bid=bid, teacher=teacher:
+                self._request(stats, teacher, 'post', f'/api/battles/{bid}/finish'))
+            for bid, teacher in teacher_of.items()
+        ]
+        self._run_parallel('battle_finish', jobs)
+
+    def _meta(self) -> dict:
+        try:
+            revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                      text=True, timeout=5, cwd=settings.BASE_DIR).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            revision = ''
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': revision,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'db': connections[DEFAULT_DB_ALIAS].vendor,
+            'settings': {
+                'SCORE_LEDGER': getattr(settings, 'SCORE_LEDGER', {}).get('MODE', 'sync'),
+                'LEADERBOARD_BACKEND': getattr(settings, 'LEADERBOARD_BACKEND', ''),
+                'REPORT_AGGREGATION': getattr(settings, 'REPORT_AGGREGATION', ''),
+                'GRADING_POOL': getattr(settings, 'GRADING_POOL', {}).get('ENABLED', False),
+            },
+        }
+
+
+# -----------------------------
+# Сравнение с базовой линией
+# -----------------------------
+
+COMPARED_METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_avg')
+
+
+def compare(baseline: dict, current: dict) -> List[dict]:
+    """Изменения ключевых метрик: [{"scenario", "metric", "baseline", "current", "change_pct"}]."""
+    rows = []
+    sections = dict(current.get('scenarios', {}), fanout=current.get('fanout', {}))
+    base_sections = dict(baseline.get('scenarios', {}), fanout=baseline.get('fanout', {}))
+    for name, values in sections.items():
+        base = base_sections.get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in values or metric not in base:
+                continue
+            old, new = base[metric], values[metric]
+            change = round((new - old) / old * 100, 1) if old else None
+            rows.append({'scenario': name, 'metric': metric, 'baseline': old, 'current': new, 'change_pct': change})
+    return rows
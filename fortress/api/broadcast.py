@@ -0,0 +1,151 @@
+# api/broadcast.py
+import asyncio
+import atexit
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def battle_group(battle_id) -> str:
+    """Имя группы channels для битвы."""
+    return f"battle_{battle_id}"
+
+
+class BattleBroadcaster:
+    """
+    Outbox для рассылки обновлений битв.
+
+    - publish() ставит событие в очередь только после коммита транзакции
+      (transaction.on_commit), поэтому запрос не держит транзакцию открытой,
+      пока ждёт channel layer, а откатанные ответы никуда не уходят;
+    - фоновый поток со своим event loop раз в flush_interval забирает накопленное,
+      сворачивает события по группам battle_{id} и отправляет их пачками:
+      один group_send на группу вместо одного на каждый ответ;
+    - каждое сообщение сериализуется в JSON здесь, один раз на группу, а
+      BattleConsumer лишь склеивает готовые кадры для своего сокета.
+
+    У сообщения может быть ключ (key): это «состояние», а не событие, и
+    более свежий кадр с тем же ключом заменяет ещё не отправленный старый.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, max_batch: int = 200):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: Dict[str, List[Tuple[Optional[str], dict]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # --- публичный API ---
+
+    def publish(self, battle_id, message: dict, key: Optional[str] = None):
+        """Отправить одно обновление битвы после коммита текущей транзакции."""
+        group = battle_group(battle_id)
+        transaction.on_commit(lambda: self.enqueue(group, [(key, message)]))
+
+    def publish_many(self, battle_id, messages: Iterable[dict]):
+        """Отправить несколько обновлений одной битвы после коммита."""
+        group = battle_group(battle_id)
+        items = [(None, m) for m in messages]
+        if items:
+            transaction.on_commit(lambda: self.enqueue(group, items))
+
+    def enqueue(self, group: str, messages: List[Tuple[Optional[str], dict]]):
+        """Положить пары (key, message) в очередь немедленно (без привязки к транзакции)."""
+        with self._lock:
+            self._pending[group].extend(messages)
+        loop = self._ensure_started()
+        loop.call_soon_threadsafe(self._schedule_flush)
+
+    def flush(self, timeout: float = 5.0):
+        """Синхронно отправить всё накопленное (при остановке процесса)."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._drain(), loop)
+        try:
+            future.result(timeout)
+        except Exception:
+            logger.exception("Не удалось отправить накопленные обновления битв")
+
+    # --- фоновый диспетчер ---
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='battle-broadcast', daemon=True)
+                thread.start()
+                atexit.register(self.flush)
+                self._loop = loop
+        return self._loop
+
+    def _schedule_flush(self):
+        # Выполняется в потоке диспетчера: одна отложенная отправка на окно
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._drain()
+            with self._lock:
+                if not self._pending:
+                    return
+
+    def _take_pending(self) -> Dict[str, List[Tuple[Optional[str], dict]]]:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+        return pending
+
+    async def _drain(self):
+        pending = self._take_pending()
+        if not pending:
+            return
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            logger.warning("CHANNEL_LAYERS не настроен: %d групп(ы) обновлений битв отброшено", len(pending))
+            return
+
+        sends = []
+        for group, messages in pending.items():
+            messages = self._coalesce(messages)
+            for i in range(0, len(messages), self.max_batch):
+                sends.append(channel_layer.group_send(group, self._make_event(messages[i:i + self.max_batch])))
+
+        for result in await asyncio.gather(*sends, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Ошибка рассылки обновления битвы: %r", result)
+
+    @staticmethod
+    def _coalesce(messages: List[Tuple[Optional[str], dict]]) -> List[Tuple[Optional[str], dict]]:
+        # Из кадров-состояний с одинаковым ключом оставляем только последний
+        latest = {key: i for i, (key, _) in enumerate(messages) if key is not None}
+        return [m for i, m in enumerate(messages) if m[0] is None or latest[m[0]] == i]
+
+    @staticmethod
+    def _make_event(messages: List[Tuple[Optional[str], dict]]) -> dict:
+        # Готовые JSON-кадры: сокеты группы не сериализуют их повторно
+        return {
+            "type": "battle.frames",
+            "frames": [[key, json.dumps(message)] for key, message in messages],
+        }
+
+
+_config = getattr(settings, 'BATTLE_BROADCAST', {})
+broadcaster = BattleBroadcaster(
+    flush_interval=_config.get('FLUSH_INTERVAL_MS', 50) / 1000,
+    max_batch=_config.get('MAX_BATCH', 200),
+)
@@ -0,0 +1,37 @@
+# api/channel_layers.py
+import asyncio
+
+from channels.layers import InMemoryChannelLayer
+
+
+class LocalChannelLayer(InMemoryChannelLayer):
+    """
+    Внутрипроцессный channel layer — запасной вариант, когда Redis не настроен.
+    Стандартный InMemoryChannelLayer работает, только если отправитель и получатель
+    живут в одном event loop. Рассылка битв (api/broadcast.py) шлёт из своего потока,
+    поэтому запоминаем loop получателя и выполняем put() в нём.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._receiver_loops = {}
+
+    async def receive(self, channel):
+        self._receiver_loops[channel] = asyncio.get_running_loop()
+        return await super().receive(channel)
+
+    async def send(self, channel, message):
+        loop = self._receiver_loops.get(channel)
+        if loop is None or loop.is_closed() or loop is asyncio.get_running_loop():
+            return await super().send(channel, message)
+        # Получатель в другом loop: кладём сообщение в очередь его же потоком
+        future = asyncio.run_coroutine_threadsafe(super().send(channel, message), loop)
+        await asyncio.wrap_future(future)
+
+    async def flush(self):
+        await super().flush()
+        self._receiver_loops = {}
+
+    def _remove_from_groups(self, channel):
+        super()._remove_from_groups(channel)
+        self._receiver_loops.pop(channel, None)
@@ -0,0 +1,428 @@
+# api/checkers.py
+"""
+Проверщики ответов, собираемые из Task.solution_spec.
+
+Формат solution_spec (поле "answer" можно опустить — тогда берётся expected_answer):
+  {}                                                     — точное совпадение с expected_answer
+  {"type": "exact", "ignore_case": true}
+  {"type": "numeric", "answer": "3/4", "tolerance": 0.001, "relative": 0}
+                                                         — число: целое, десятичное (точка или запятая),
+                                                           дробь "a/b", смешанное "1 1/2", проценты "75%"
+  {"type": "set", "answer": ["1", "-2"], "ordered": false, "separator": ";"}
+                                                         — набор ответов; элементы сравниваются как числа,
+                                                           если оба — числа, иначе как строки
+  {"type": "regex", "pattern": "^x\\s*=\\s*5$", "ignore_case": true}
+  {"type": "expression", "answer": "(x+1)^2", "variables": ["x"]}
+                                                         — равенство выражений (sympy, если установлен,
+                                                           иначе сравнение значений в случайных точках)
+Необязательное "display" — что показать в подсказке при неверном ответе,
+"sandbox": true/false — принудительно проверять в пуле процессов или в потоке запроса.
+"""
+import ast
+import math
+import random
+import re
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional
+
+try:
+    import sympy
+except ImportError:  # sympy необязателен: без него выражения сравниваются численно
+    sympy = None
+
+
+class CheckerSpecError(ValueError):
+    """Некорректный solution_spec."""
+
+
+def answer_value(payload):
+    """Значение ответа из answer_payload ({"answer": ...} или «сырое» значение)."""
+    if isinstance(payload, dict) and 'answer' in payload:
+        return payload['answer']
+    return payload
+
+
+def _norm_text(value) -> str:
+    return re.sub(r'\s+', ' ', str(value)).strip()
+
+
+# -----------------------------
+# Числа
+# -----------------------------
+_MIXED_RE = re.compile(r'^([+-]?\d+)\s+(\d+)\s*/\s*(\d+)$')
+_FRACTION_RE = re.compile(r'^([+-]?\d+)\s*/\s*([+-]?\d+)$')
+# Длинные строки и огромные порядки (1e999999) не превращаем в точные дроби
+MAX_NUMBER_LEN = 100
+
+
+def parse_number(value) -> Optional[Fraction]:
+    """
+    Число как точная дробь: 42, -0.75, 0,75, 3/4, 1 1/2, 1e-3, 75%.
+    None — если это не число.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return Fraction(value)
+    if isinstance(value, float):
+        return Fraction(value) if math.isfinite(value) else None
+    text = _norm_text(value).replace('−', '-')
+    if not text or len(text) > MAX_NUMBER_LEN:
+        return None
+    percent = text.endswith('%')
+    if percent:
+        text = text[:-1].strip()
+
+    m = _MIXED_RE.match(text)
+    if m:
+        whole, num, den = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        if den == 0:
+            return None
+        frac = abs(whole) + Fraction(num, den)
+        result = -frac if m.group(1).startswith('-') else frac
+    else:
+        m = _FRACTION_RE.match(text)
+        if m:
+            if int(m.group(2)) == 0:
+                return None
+            result = Fraction(int(m.group(1)), int(m.group(2)))
+        else:
+            # Десятичная запятая: "0,75" (но не "1,000,000" — это не число)
+            if text.count(',') == 1 and '.' not in text:
+                text = text.replace(',', '.')
+            try:
+                dec = Decimal(text.replace(' ', ''))
+            except InvalidOperation:
+                return None
+            if not dec.is_finite() or abs(dec.adjusted()) > MAX_NUMBER_LEN:
+                return None
+            result = Fraction(dec)
+    return result / 100 if percent else result
+
+
+# -----------------------------
+# Проверщики
+# -----------------------------
+class Checker:
+    """
+    Скомпилированная проверка: check(payload) -> bool; display — ожидаемый ответ для подсказки.
+    expensive — проверка может быть долгой и выполняется в пуле процессов (api/grading_pool.py).
+    """
+    display = ''
+    expensive = False
+
+    def check(self, payload) -> bool:
+        raise NotImplementedError
+
+
+class ExactChecker(Checker):
+    def __init__(self, expected: str, ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.expected = self._norm(expected)
+        self.display = str(expected).strip()
+
+    def _norm(self, value) -> str:
+        value = str(value).strip()
+        return value.casefold() if self.ignore_case else value
+
+    def check(self, payload) -> bool:
+        return self._norm(answer_value(payload)) == self.expected
+
+
+class NumericChecker(Checker):
+    def __init__(self, expected, tolerance: float = 0.0, relative: float = 0.0):
+        value = parse_number(expected)
+        if value is None:
+            raise CheckerSpecError(f'numeric: ответ "{expected}" не является числом')
+        self.expected = value
+        self.tolerance = float(tolerance)
+        self.relative = float(relative)
+        self.display = str(expected).strip()
+
+    def matches(self, value: Fraction) -> bool:
+        if not self.tolerance and not self.relative:
+            return value == self.expected
+        diff = abs(float(value - self.expected))
+        return diff <= max(self.tolerance, self.relative * abs(float(self.expected)))
+
+    def check(self, payload) -> bool:
+        value = parse_number(answer_value(payload))
+        return value is not None and self.matches(value)
+
+
+class SetChecker(Checker):
+    def __init__(self, expected, ordered: bool = False, separator: str = ';', ignore_case: bool = False):
+        self.ordered = ordered
+        self.separator = separator
+        self.ignore_case = ignore_case
+        items = self._split(expected)
+        if not items:
+            raise CheckerSpecError('set: пустой список ответов')
+        self.expected = [self._key(i) for i in items]
+        if not ordered:
+            self.expected.sort(key=repr)
+        self.display = f'{separator} '.join(str(i).strip() for i in items)
+
+    def _split(self, value) -> List:
+        if isinstance(value, (list, tuple)):
+            return [v for v in value if _norm_text(v)]
+        return [part for part in str(value).split(self.separator) if part.strip()]
+
+    def _key(self, item):
+        # Числа сравниваем по значению (0,5 == 1/2), остальное — как нормализованный текст
+        number = parse_number(item)
+        if number is not None:
+            return ('n', number)
+        text = _norm_text(item)
+        return ('s', text.casefold() if self.ignore_case else text)
+
+    def check(self, payload) -> bool:
+        got = [self._key(i) for i in self._split(answer_value(payload))]
+        if not self.ordered:
+            got.sort(key=repr)
+        return got == self.expected
+
+
+class RegexChecker(Checker):
+    def __init__(self, pattern: str, ignore_case: bool = False, display: str = ''):
+        try:
+            self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            raise CheckerSpecError(f'regex: {e}')
+        self.display = display
+
+    def check(self, payload) -> bool:
+        return self.regex.fullmatch(str(answer_value(payload)).strip()) is not None
+
+
+# -----------------------------
+# Выражения: безопасный разбор без eval
+# -----------------------------
+_FUNCTIONS: Dict[str, Callable] = {
+    'sin': math.sin, 'cos': math.cos, 'tan': math.tan,
+    'asin': math.asin, 'acos': math.acos, 'atan': math.atan,
+    'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'ln': math.log, 'abs': abs,
+}
+_CONSTANTS = {'pi': math.pi, 'e': math.e}
+_BINOPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.Pow: lambda a, b: a ** b,
+}
+_UNARYOPS = {ast.USub: lambda a: -a, ast.UAdd: lambda a: a}
+_IMPLICIT_MUL_RE = re.compile(r'(?<=[\d)])\s*(?=[a-zA-Z(])|(?<=[a-zA-Z)])\s*(?=\d)')
+MAX_EXPRESSION_LEN = 500
+
+
+def parse_expression(text: str, variables: List[str]) -> ast.AST:
+    """
+    Разобрать выражение в AST, разрешив только числа, переменные, константы,
+    + - * / ^ и функции из _FUNCTIONS. "2x" и "(x+1)(x-1)" — неявное умножение.
+    """
+    text = str(text).strip().replace('^', '**').replace('−', '-').replace(',', '.')
+    if not text or len(text) > MAX_EXPRESSION_LEN:
+        raise CheckerSpecError('expression: пустое или слишком длинное выражение')
+    # Неявное умножение не должно разрывать имена функций: "sin(x)" остаётся вызовом
+    text = _IMPLICIT_MUL_RE.sub('*', text)
+    text = re.sub(r'\)\s*\(', ')*(', text)
+    text = re.sub(r'\b([a-zA-Z_]\w*)\s*\(', lambda m: m.group(0) if m.group(1) in _FUNCTIONS else m.group(1) + '*(', text)
+    try:
+        tree = ast.parse(text, mode='eval').body
+    except SyntaxError:
+        raise CheckerSpecError(f'expression: не удалось разобрать "{text}"')
+    _validate(tree, set(variables))
+    return tree
+
+
+def _validate(node, variables):
+    if isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            raise CheckerSpecError('expression: допустимы только числа')
+    elif isinstance(node, ast.Name):
+        if node.id not in variables and node.id not in _CONSTANTS:
+            raise CheckerSpecError(f'expression: неизвестное имя "{node.id}"')
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+        _validate(node.left, variables)
+        _validate(node.right, variables)
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARYOPS:
+        _validate(node.operand, variables)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS \
+            and len(node.args) == 1 and not node.keywords:
+        _validate(node.args[0], variables)
+    else:
+        raise CheckerSpecError('expression: недопустимая конструкция')
+
+
+def _evaluate(node, env: Dict[str, float]) -> float:
+    # Считаем во float: огромные степени дают OverflowError, а не долгие вычисления
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.Name):
+        return env[node.id] if node.id in env else _CONSTANTS[node.id]
+    if isinstance(node, ast.BinOp):
+        return _BINOPS[type(node.op)](_evaluate(node.left, env), _evaluate(node.right, env))
+    if isinstance(node, ast.UnaryOp):
+        return _UNARYOPS[type(node.op)](_evaluate(node.operand, env))
+    return _FUNCTIONS[node.func.id](_evaluate(node.args[0], env))
+
+
+def _to_sympy(node, symbols):
+    if isinstance(node, ast.Constant):
+        return sympy.nsimplify(node.value)
+    if isinstance(node, ast.Name):
+        return symbols[node.id] if node.id in symbols else {'pi': sympy.pi, 'e': sympy.E}[node.id]
+    if isinstance(node, ast.BinOp):
+        return _BINOPS[type(node.op)](_to_sympy(node.left, symbols), _to_sympy(node.right, symbols))
+    if isinstance(node, ast.UnaryOp):
+        return _UNARYOPS[type(node.op)](_to_sympy(node.operand, symbols))
+    name = {'ln': 'log', 'abs': 'Abs'}.get(node.func.id, node.func.id)
+    return getattr(sympy, name)(_to_sympy(node.args[0], symbols))
+
+
+class ExpressionChecker(Checker):
+    """
+    Равенство выражений. С sympy — simplify(a - b) == 0; если sympy нет или он
+    не справился — сравнение значений в фиксированном наборе случайных точек.
+    """
+    SAMPLES = 12
+    MIN_VALID = 5
+    expensive = True
+
+    def __init__(self, expected: str, variables: List[str] = (), tolerance: float = 1e-9):
+        self.variables = list(variables) or ['x']
+        self.tree = parse_expression(expected, self.variables)
+        self.tolerance = tolerance
+        self.display = str(expected).strip()
+        rnd = random.Random(0)
+        self.points = [{v: rnd.uniform(-3.0, 3.0) for v in self.variables} for _ in range(self.SAMPLES)]
+        # Значения эталона в точках считаем один раз при компиляции
+        self.expected_values = [self._safe_eval(self.tree, p) for p in self.points]
+        if sum(v is not None for v in self.expected_values) < self.MIN_VALID:
+            raise CheckerSpecError('expression: эталон не вычисляется в достаточном числе точек')
+        self._sympy_expected = None
+        if sympy is not None:
+            self._symbols = {v: sympy.Symbol(v) for v in self.variables}
+            self._sympy_expected = _to_sympy(self.tree, self._symbols)
+
+    @staticmethod
+    def _safe_eval(tree, point) -> Optional[float]:
+        try:
+            value = _evaluate(tree, point)
+        except (ArithmeticError, ValueError, TypeError):
+            return None
+        if isinstance(value, complex) or not math.isfinite(value):
+            return None
+        return value
+
+    def check(self, payload) -> bool:
+        try:
+            tree = parse_expression(answer_value(payload), self.variables)
+        except CheckerSpecError:
+            return False
+
+        if self._sympy_expected is not None:
+            try:
+                if sympy.simplify(_to_sympy(tree, self._symbols) - self._sympy_expected) == 0:
+                    return True
+            except Exception:
+                pass
+
+        valid = 0
+        for point, expected in zip(self.points, self.expected_values):
+            got = self._safe_eval(tree, point)
+            if expected is None or got is None:
+                if (expected is None) != (got is None):
+                    return False
+                continue
+            if not math.isclose(got, expected, rel_tol=1e-7, abs_tol=self.tolerance):
+                return False
+            valid += 1
+        return valid >= self.MIN_VALID
+
+
+# -----------------------------
+# Сборка проверщика из задачи
+# -----------------------------
+
+def compile_checker(spec: Optional[dict], expected_answer: str = '') -> Optional[Checker]:
+    """
+    Собрать проверщик из solution_spec (+ expected_answer как ответ по умолчанию).
+    None — проверка не настроена. Некорректная спецификация — CheckerSpecError.
+    """
+    spec = spec or {}
+    if not isinstance(spec, dict):
+        raise CheckerSpecError('solution_spec должен быть объектом')
+    kind = spec.get('type', 'exact')
+    answer = spec.get('answer', expected_answer)
+    display = spec.get('display')
+
+    if kind == 'regex':
+        if not spec.get('pattern'):
+            raise CheckerSpecError('regex: нужен pattern')
+        checker = RegexChecker(spec['pattern'], bool(spec.get('ignore_case')), display or '')
+    elif answer in (None, '', []):
+        if spec.get('type'):
+            raise CheckerSpecError(f'{kind}: нужен answer или expected_answer')
+        return None
+    elif kind == 'exact':
+        checker = ExactChecker(answer, bool(spec.get('ignore_case')))
+    elif kind in ('numeric', 'fraction', 'decimal'):
+        checker = NumericChecker(answer, spec.get('tolerance', 0.0), spec.get('relative', 0.0))
+    elif kind == 'set':
+        checker = SetChecker(answer, bool(spec.get('ordered')), spec.get('separator', ';'),
+                             bool(spec.get('ignore_case')))
+    elif kind == 'expression':
+        checker = ExpressionChecker(answer, spec.get('variables') or ['x'], spec.get('tolerance', 1e-9))
+    else:
+        raise CheckerSpecError(f'Неизвестный тип проверки: {kind}')
+
+    if display:
+        checker.display = display
+    if 'sandbox' in spec:
+        checker.expensive = bool(spec['sandbox'])
+    return checker
+
+
+class CheckerCache:
+    """
+    LRU-кэш скомпилированных проверщиков по (task.id, task.updated_at):
+    правка задачи меняет updated_at, и старая запись просто вытесняется.
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple, Optional[Checker]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, task) -> Optional[Checker]:
+        if task.pk is None:
+            return compile_checker(task.solution_spec, task.expected_answer)
+        return self.get_or_compile((task.pk, task.updated_at), task.solution_spec, task.expected_answer)
+
+    def get_or_compile(self, key: tuple, spec: Optional[dict], expected_answer: str) -> Optional[Checker]:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        checker = compile_checker(spec, expected_answer)
+        with self._lock:
+            self._items[key] = checker
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return checker
+
+    def invalidate(self, task_id):
+        """Выбросить все версии проверщика задачи (после сохранения/удаления Task)."""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == task_id]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,285 @@
+# api/data_export.py
+"""
+Выгрузка сырых данных для аналитики: отправки, очки, выдачи.
+
+- CSV пишется построчно из queryset.iterator() — можно отдавать
+  StreamingHttpResponse, память постоянна при любом объёме;
+- Arrow (IPC file) и Parquet пишутся пакетами (RecordBatch) по chunk_size
+  строк; для них нужен pyarrow (необязательная зависимость).
+
+Фильтры: класс (выдачи самого класса и его команд) и диапазон дат
+(created_at, для очков — last_update).
+"""
+from __future__ import annotations
+
+import csv
+import json
+import tempfile
+from datetime import datetime, time
+from typing import IO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, Q, QuerySet, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Assignment, Score, Submission
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pyarrow необязателен: без него доступен только CSV
+    pyarrow = None
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+# Строк в одном запросе к БД и в одном RecordBatch
+EXPORT_CHUNK_SIZE = 5000
+
+# Примерный размер куска потокового CSV, символов
+CSV_FLUSH_SIZE = 64 * 1024
+
+# Parquet/Arrow до этого размера собираются в памяти, больше — во временном файле
+SPOOL_MAX_SIZE = getattr(settings, 'REPORT_EXPORT_SPOOL_MB', 8) * 1024 * 1024
+
+
+class DataExportError(ValueError):
+    """Неверные параметры выгрузки или недоступный формат."""
+
+
+class Dataset(NamedTuple):
+    # (имя колонки, поле для values_list, тип Arrow: 'int' | 'bool' | 'str' | 'ts' | 'json')
+    columns: List[Tuple[str, str, str]]
+    queryset: Callable[[], QuerySet]
+    class_filter: Callable[[int], Q]
+    date_field: str
+
+
+def _class_assignments(prefix: str) -> Callable[[int], Q]:
+    return lambda class_id: Q(**{f'{prefix}classroom_id': class_id}) | Q(**{f'{prefix}team__classroom_id': class_id})
+
+
+DATASETS: Dict[str, Dataset] = {
+    'submissions': Dataset(
+        columns=[
+            ('id', 'id', 'int'),
+            ('assignment_id', 'assignment_id', 'int'),
+            ('task_id', 'assignment__task_id', 'int'),
+            ('classroom_id', 'class_id', 'int'),
+            ('team_id', 'assignment__team_id', 'int'),
+            ('student_id', 'student_id', 'int'),
+            ('attempt_no', 'attempt_no', 'int'),
+            ('is_correct', 'verdict', 'bool'),
+            ('points_awarded', 'points_awarded', 'int'),
+            ('answer', 'answer_payload', 'json'),
+            ('created_at', 'created_at', 'ts'),
+            ('checked_at', 'checked_at', 'ts'),
+        ],
+        queryset=lambda: Submission.objects.annotate(
+            class_id=Coalesce('assignment__classroom_id', 'assignment__team__classroom_id'),
+            # Пока проверка отложена (checked_at пуст), вердикта нет: пустое значение, а не False
+            verdict=Case(When(checked_at__isnull=False, then='is_correct'), output_field=BooleanField()),
+        ),
+        class_filter=_class_assignments('assignment__'),
+        date_field='created_at',
+    ),
+    'scores': Dataset(
+        columns=[
+            ('id', 'id', 'int'),
+            ('student_id', 'student_id', 'int'),
+            ('classroom_id', 'classroom_id', 'int'),
+            ('team_id', 'team_id', 'int'),
+            ('total_points', 'total_points', 'int'),
+            ('last_update', 'last_update', 'ts'),
+        ],
+        queryset=lambda: Score.objects.all(),
+        class_filter=_class_assignments(''),
+        date_field='last_update',
+    ),
+    'assignments': Dataset(
+        columns=[
+            ('id', 'id', 'int'),
+            ('task_id', 'task_id', 'int'),
+            ('classroom_id', 'classroom_id', 'int'),
+            ('team_id', 'team_id', 'int'),
+            ('assigned_by_id', 'assigned_by_id', 'int'),
+            ('due_at', 'due_at', 'ts'),
+            ('created_at', 'created_at', 'ts'),
+        ],
+        queryset=lambda: Assignment.objects.all(),
+        class_filter=_class_assignments(''),
+        date_field='created_at',
+    ),
+}
+
+
+def get_dataset(name: str) -> Dataset:
+    try:
+        return DATASETS[name]
+    except KeyError:
+        raise DataExportError(f"Неизвестный набор данных: {name}. Доступны: {', '.join(DATASETS)}")
+
+
+def check_format(fmt: str) -> str:
+    fmt = (fmt or 'csv').lower()
+    if fmt not in FORMATS:
+        raise DataExportError(f"Неизвестный формат: {fmt}. Доступны: {', '.join(FORMATS)}")
+    if fmt != 'csv' and pyarrow is None:
+        raise DataExportError(f"Формат {fmt} недоступен: не установлен pyarrow")
+    return fmt
+
+
+def parse_bound(value: Optional[str], name: str) -> Optional[datetime]:
+    """Граница диапазона: ISO-дата (начало дня) или дата-время; без зоны — в TIME_ZONE проекта."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise DataExportError(f"{name}: ожидается дата YYYY-MM-DD или дата-время ISO 8601")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+# -----------------------------
+# Чтение строк
+# -----------------------------
+
+def iter_rows(dataset: Dataset, class_id: Optional[int] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[tuple]:
+    """Строки набора (кортежи в порядке columns) по возрастанию id, порциями из БД."""
+    qs = dataset.queryset()
+    if class_id is not None:
+        qs = qs.filter(dataset.class_filter(class_id))
+    if since is not None:
+        qs = qs.filter(**{f'{dataset.date_field}__gte': since})
+    if until is not None:
+        qs = qs.filter(**{f'{dataset.date_field}__lt': until})
+    fields = [field for _, field, _ in dataset.columns]
+    return qs.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _json_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+# -----------------------------
+# CSV
+# -----------------------------
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(dataset: Dataset, rows: Iterator[tuple]) -> Iterator[bytes]:
+    """CSV построчно (для StreamingHttpResponse); UTF-8 с BOM — Excel откроет кириллицу."""
+    writer = csv.writer(_Echo())
+    json_cols = [i for i, (_, _, kind) in enumerate(dataset.columns) if kind == 'json']
+    ts_cols = [i for i, (_, _, kind) in enumerate(dataset.columns) if kind == 'ts']
+    buf = ['\ufeff' + writer.writerow([name for name, _, _ in dataset.columns])]
+    size = 0
+    for row in rows:
+        row = list(row)
+        for i in json_cols:
+            row[i] = _json_text(row[i])
+        for i in ts_cols:
+            row[i] = row[i].isoformat() if row[i] else None
+        line = writer.writerow(row)
+        buf.append(line)
+        size += len(line)
+        # Отдаём кусками ~64 КБ, а не по строке: меньше накладных расходов на запись в сокет
+        if size >= CSV_FLUSH_SIZE:
+            yield ''.join(buf).encode('utf-8')
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
+
+
+# -----------------------------
+# Arrow / Parquet
+# -----------------------------
+
+def _arrow_schema(dataset: Dataset):
+    types = {
+        'int': pyarrow.int64(),
+        'bool': pyarrow.bool_(),
+        'str': pyarrow.string(),
+        'json': pyarrow.string(),
+        'ts': pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([(name, types[kind]) for name, _, kind in dataset.columns])
+
+
+def _record_batches(dataset: Dataset, rows: Iterator[tuple], schema, batch_size: int):
+    json_cols = {i for i, (_, _, kind) in enumerate(dataset.columns) if kind == 'json'}
+    batch: List[tuple] = []
+
+    def to_batch():
+        columns = list(zip(*batch))
+        arrays = [
+            pyarrow.array([_json_text(v) for v in col] if i in json_cols else col, type=schema.field(i).type)
+            for i, col in enumerate(columns)
+        ]
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield to_batch()
+            batch = []
+    if batch:
+        yield to_batch()
+
+
+def write_columnar(dataset: Dataset, rows: Iterator[tuple], fileobj: IO[bytes], fmt: str,
+                   batch_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Записать строки в Parquet или Arrow IPC пакетами по batch_size; вернуть число строк."""
+    schema = _arrow_schema(dataset)
+    total = 0
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(fileobj, schema)
+    else:
+        writer = pyarrow.ipc.new_file(fileobj, schema)
+    try:
+        for batch in _record_batches(dataset, rows, schema, batch_size):
+            if fmt == 'parquet':
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+            total += batch.num_rows
+    finally:
+        writer.close()
+    return total
+
+
+def build_columnar(dataset: Dataset, rows: Iterator[tuple], fmt: str) -> IO[bytes]:
+    """Parquet/Arrow во временном файле, перемотанном в начало (закрывает его тот, кто читает)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        write_columnar(dataset, rows, spool, fmt)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
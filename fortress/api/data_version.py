@@ -0,0 +1,123 @@
+# api/data_version.py
+"""
+Версии данных для условных GET и кэша отчётов.
+
+У каждого класса свой счётчик ('class:{id}'), у банка задач — общий ('tasks').
+Счётчик увеличивается в той же транзакции, что и запись данных:
+
+- обычные save()/delete() выдач, команд, составов и классов — сигналами (api/signals.py);
+- пути в обход сигналов — явным вызовом bump_classes(): проверка ответов
+  (record_graded, в том числе пакетная), слив буфера очков write-behind,
+  сверка Score (rebuild_scores), запуск битвы, перезапись состава команды.
+
+Отчёт и ETag вычисляются от версий: пока версия та же, клиент получает 304,
+а сервер отдаёт ответ из кэша без пересчёта.
+"""
+import hashlib
+from typing import Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+
+from .models import DataVersion, Team
+
+TASKS_KEY = 'tasks'
+
+# Сколько держать посчитанный отчёт в кэше: ключ включает версию, так что это лишь предел памяти
+REPORT_CACHE_TIMEOUT = getattr(settings, 'REPORT_CACHE_TIMEOUT', 600)
+
+
+def class_key(class_id: int) -> str:
+    return f'class:{class_id}'
+
+
+# -----------------------------
+# Счётчики
+# -----------------------------
+
+def bump(keys: Iterable[str]):
+    """Увеличить версии по ключам (одним INSERT ... ON CONFLICT, где он есть)."""
+    keys = sorted(set(keys))  # одинаковый порядок блокировок в параллельных транзакциях
+    if not keys:
+        return
+    now = timezone.now()
+    if connection.vendor in ('sqlite', 'postgresql'):
+        qn = connection.ops.quote_name
+        table = qn(DataVersion._meta.db_table)
+        values = ', '.join(['(%s, 1, %s)'] * len(keys))
+        params = [p for key in keys for p in (key, now)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({qn("key")}, version, updated_at) VALUES {values} '
+                f'ON CONFLICT ({qn("key")}) DO UPDATE SET version = {table}.version + 1, '
+                f'updated_at = excluded.updated_at',
+                params,
+            )
+        return
+    # Прочие СУБД: UPDATE, при отсутствии строки — INSERT (параллельную вставку ловим по ключу)
+    for key in keys:
+        if DataVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(key=key, version=1, updated_at=now)
+        except IntegrityError:
+            DataVersion.objects.filter(key=key).update(version=F('version') + 1, updated_at=now)
+
+
+def bump_classes(class_ids: Iterable[Optional[int]]):
+    bump(class_key(cid) for cid in set(class_ids) if cid)
+
+
+def bump_teams(team_ids: Iterable[Optional[int]]):
+    """Версии классов, которым принадлежат команды."""
+    team_ids = {tid for tid in team_ids if tid}
+    if team_ids:
+        bump_classes(Team.objects.filter(id__in=team_ids).values_list('classroom_id', flat=True))
+
+
+def versions(keys: Iterable[str]) -> Dict[str, int]:
+    """Текущие версии (0 — изменений ещё не было)."""
+    keys = list(keys)
+    found = dict(DataVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return {key: found.get(key, 0) for key in keys}
+
+
+# -----------------------------
+# ETag / 304 и кэш ответов
+# -----------------------------
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из версий и параметров ответа."""
+    digest = hashlib.sha1(':'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def not_modified(request, etag: str):
+    """304 Not Modified, если клиент прислал тот же ETag в If-None-Match, иначе None."""
+    return get_conditional_response(request, etag=etag)
+
+
+def with_etag(response, etag: str):
+    response['ETag'] = etag
+    # Браузер хранит ответ, но перепроверяет его по ETag при каждом запросе
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def cached_report(name: str, etag: str, compute: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """
+    Данные отчёта из кэша по ETag (в нём уже есть версии) или свежепосчитанные.
+    None от compute (отчёт недоступен) не кэшируется.
+    """
+    key = f'report:{name}:{etag.strip(chr(34))}'
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        if data is not None:
+            cache.set(key, data, REPORT_CACHE_TIMEOUT)
+    return data
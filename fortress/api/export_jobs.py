@@ -0,0 +1,219 @@
+# api/export_jobs.py
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ExportJob
+from .report_export import ExportRequest, data_watermark, write_report
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Готовые файлы отчётов на диске
+# -----------------------------
+
+class ExportArtifactStore:
+    """
+    Каталог готовых .xlsx по artifact_key. Файл пишется во временный
+    и переименовывается атомарно, так что читатель не увидит недописанный.
+    Старые версии того же отчёта (меньший водяной знак) удаляются после сборки новой.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.xlsx"
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path(key)
+        return path if path.exists() else None
+
+    def build(self, export: ExportRequest, key: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_report(export, f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._prune(key)
+        return path
+
+    def _prune(self, key: str):
+        # key = scope_class_student_watermark: удаляем только версии того же отчёта
+        # со строго более старым водяным знаком. Заявка по старым данным, закончившая
+        # позже, не должна стереть уже собранный более свежий файл
+        prefix, watermark = key.rsplit('_', 1)
+        current = _watermark_versions(watermark)
+        if current is None:
+            return
+        for other in self.directory.glob(f"{prefix}_*.xlsx"):
+            other_prefix, other_watermark = other.stem.rsplit('_', 1)
+            versions = _watermark_versions(other_watermark)
+            if other_prefix != prefix or versions is None or versions == current:
+                continue
+            if all(o <= c for o, c in zip(versions, current)):
+                try:
+                    other.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def _watermark_versions(watermark: str) -> Optional[tuple]:
+    """Водяной знак 'класс-задачи' (report_export.data_watermark) как кортеж версий."""
+    try:
+        return tuple(int(part) for part in watermark.split('-'))
+    except ValueError:
+        return None
+
+
+# -----------------------------
+# Очередь заданий в БД и пул потоков-воркеров
+# -----------------------------
+
+class ExportJobRunner:
+    """
+    Фоновая сборка отчётов без внешнего брокера:
+
+    - submit() сохраняет ExportJob; если файл с тем же artifact_key уже есть,
+      заявка сразу DONE и ничего не пересобирается;
+    - потоки-воркеры (стартуют при первой заявке) забирают самую старую
+      PENDING-заявку условным UPDATE — одну заявку не возьмут двое, даже
+      если воркеры работают в разных процессах (команда run_export_worker);
+    - по готовности файла DONE получают и все ожидающие заявки с тем же ключом;
+    - RUNNING-заявки старше stale_after (упавший воркер) возвращаются в очередь.
+    """
+
+    def __init__(self, store: ExportArtifactStore, workers: int = 2, poll_interval: float = 2.0,
+                 stale_after: float = 600.0, in_process: bool = True):
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.in_process = in_process
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    # --- публичный API ---
+
+    def submit(self, user, export: ExportRequest) -> ExportJob:
+        key = export.artifact_key(data_watermark(export.classroom))
+        ready = self.store.get(key) is not None
+        now = timezone.now()
+        job = ExportJob.objects.create(
+            requested_by=user,
+            scope=export.scope,
+            classroom=export.classroom,
+            student_id=export.student_id,
+            artifact_key=key,
+            status=ExportJob.Status.DONE if ready else ExportJob.Status.PENDING,
+            finished_at=now if ready else None,
+        )
+        if not ready and self.in_process:
+            transaction.on_commit(self._notify)
+        return job
+
+    def artifact(self, job: ExportJob) -> Optional[Path]:
+        """Файл готовой заявки (None, если его уже удалили как устаревший)."""
+        return self.store.get(job.artifact_key)
+
+    def run_pending(self) -> int:
+        """Выполнить все заявки из очереди в текущем потоке; вернуть их число."""
+        done = 0
+        while self.run_one():
+            done += 1
+        return done
+
+    def run_one(self) -> bool:
+        job = self._claim()
+        if job is None:
+            return False
+        self._run_job(job)
+        return True
+
+    def serve_forever(self):
+        """Цикл воркера: ждать заявок и выполнять их (поток пула или run_export_worker)."""
+        while True:
+            try:
+                self._requeue_stale()
+                self.run_pending()
+            except Exception:
+                logger.exception("Сбой воркера экспорта отчётов")
+            finally:
+                close_old_connections()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    # --- внутреннее ---
+
+    def _notify(self):
+        self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.serve_forever, name=f'export-worker-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _claim(self) -> Optional[ExportJob]:
+        pending = ExportJob.objects.filter(status=ExportJob.Status.PENDING)
+        while True:
+            job_id = pending.order_by('id').values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            claimed = pending.filter(id=job_id).update(status=ExportJob.Status.RUNNING, started_at=timezone.now())
+            if claimed:
+                return ExportJob.objects.select_related('classroom').get(id=job_id)
+            # Заявку перехватил другой воркер — берём следующую
+
+    def _run_job(self, job: ExportJob):
+        try:
+            if self.store.get(job.artifact_key) is None:
+                export = ExportRequest(job.scope, job.classroom, job.student_id)
+                self.store.build(export, job.artifact_key)
+        except Exception as e:
+            logger.exception("Не удалось собрать отчёт по заявке %s", job.id)
+            ExportJob.objects.filter(id=job.id).update(
+                status=ExportJob.Status.FAILED, error=str(e)[:1000], finished_at=timezone.now()
+            )
+            return
+        # Готово и для этой заявки, и для всех ожидающих тот же файл
+        now = timezone.now()
+        ExportJob.objects.filter(id=job.id).update(status=ExportJob.Status.DONE, finished_at=now)
+        ExportJob.objects.filter(artifact_key=job.artifact_key, status=ExportJob.Status.PENDING) \
+            .update(status=ExportJob.Status.DONE, finished_at=now)
+
+    def _requeue_stale(self):
+        deadline = timezone.now() - timedelta(seconds=self.stale_after)
+        ExportJob.objects.filter(status=ExportJob.Status.RUNNING, started_at__lt=deadline) \
+            .update(status=ExportJob.Status.PENDING, started_at=None)
+
+
+_config = getattr(settings, 'REPORT_EXPORT_JOBS', {})
+export_jobs = ExportJobRunner(
+    ExportArtifactStore(_config.get('DIR', Path(settings.BASE_DIR) / 'var' / 'exports')),
+    workers=_config.get('WORKERS', 2),
+    poll_interval=_config.get('POLL_INTERVAL', 2.0),
+    stale_after=_config.get('STALE_AFTER', 600),
+    in_process=_config.get('IN_PROCESS', True),
+)
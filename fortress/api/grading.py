@@ -0,0 +1,128 @@
+# api/grading.py
+import json
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .checkers import Checker, CheckerCache, CheckerSpecError, answer_value
+from .models import Task
+
+# Скомпилированные проверщики задач: LRU по (task.id, task.updated_at)
+checker_cache = CheckerCache(maxsize=getattr(settings, 'CHECKER_CACHE_SIZE', 2048))
+
+# Ответы длиннее не кэшируем: в битвах повторяются короткие ответы
+VERDICT_CACHE_MAX_ANSWER = 512
+
+
+class GradeResult(NamedTuple):
+    """Итог проверки одного ответа."""
+    is_correct: bool
+    feedback: str
+    points: int
+
+
+class VerdictCache:
+    """
+    LRU-кэш вердиктов по (task.id, task.updated_at, нормализованный ответ):
+    в битве многие отправляют одно и то же, а студент повторяет ответ с новым
+    attempt_no — повторная проверка не нужна. Правка задачи меняет updated_at,
+    кроме того, сигнал сохранения Task сбрасывает её записи (api/signals.py).
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[tuple, GradeResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(task: Task, payload) -> Optional[tuple]:
+        if task.pk is None:
+            return None
+        value = answer_value(payload)
+        if isinstance(value, str):
+            # Все проверщики обрезают пробелы по краям — на вердикт это не влияет
+            value = value.strip()
+        try:
+            answer = json.dumps(value, sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return None
+        if len(answer) > VERDICT_CACHE_MAX_ANSWER:
+            return None
+        return task.pk, task.updated_at, answer
+
+    def get(self, task: Task, payload) -> Optional[GradeResult]:
+        key = self._key(task, payload)
+        if key is None:
+            return None
+        with self._lock:
+            result = self._items.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, task: Task, payload, result: GradeResult):
+        key = self._key(task, payload)
+        if key is None:
+            return
+        with self._lock:
+            self._items[key] = result
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, task_id):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == task_id]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+verdict_cache = VerdictCache(maxsize=getattr(settings, 'VERDICT_CACHE_SIZE', 10000))
+
+
+def grade_answer(task: Task, payload) -> GradeResult:
+    """
+    Проверка ответа без обращения к БД: нужна только сама задача.
+    Используется и для одиночных, и для пакетных отправок.
+    Проверщик собирается из solution_spec/expected_answer один раз и берётся из кэша;
+    повторный одинаковый ответ на ту же версию задачи берётся из verdict_cache.
+    """
+    cached = verdict_cache.get(task, payload)
+    if cached is not None:
+        return cached
+
+    try:
+        checker = checker_cache.get(task)
+    except CheckerSpecError as e:
+        return GradeResult(False, f'Ответ принят. Ошибка в настройках проверки задачи: {e}', 0)
+
+    if checker is None:
+        return GradeResult(False, 'Ответ принят. Настроек проверки нет (expected_answer и solution_spec пусты).', 0)
+
+    result = verdict(task, checker, checker.check(payload))
+    verdict_cache.put(task, payload, result)
+    return result
+
+
+def verdict(task: Task, checker: Checker, is_correct: bool) -> GradeResult:
+    """Отзыв и очки по результату проверки."""
+    if is_correct:
+        feedback = 'Верно!'
+    elif checker.display:
+        feedback = f'Неверно. Ожидается: {checker.display}'
+    else:
+        feedback = 'Неверно.'
+    # Базовое начисление: максимум из задачи
+    # Можно модифицировать формулой (за попытки/скорость/стрейки и т.д.)
+    points = int(task.max_points) if is_correct else 0
+    return GradeResult(is_correct, feedback, points)
@@ -0,0 +1,286 @@
+# api/grading_pool.py
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import grading_worker
+from .checkers import CheckerSpecError
+from .grading import GradeResult, checker_cache, grade_answer, verdict, verdict_cache
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_RESULT = GradeResult(False, 'Проверка ответа заняла слишком много времени.', 0)
+MEMORY_RESULT = GradeResult(False, 'Проверка ответа превысила лимит памяти.', 0)
+FAILED_RESULT = GradeResult(False, 'Не удалось проверить ответ, попробуйте отправить его ещё раз.', 0)
+
+# Запас на пересылку между процессами сверх лимита CPU самой проверки
+DEADLINE_SLACK = 1.0
+# Как часто сторож пула разбирает сообщения о старте проверок и ищет просроченные
+WATCH_INTERVAL = 0.05
+
+
+class _Job:
+    """Проверка в пуле: deadline появляется, когда процесс пула взял её в работу."""
+    __slots__ = ('task', 'payload', 'checker', 'result', 'deadline', 'attempts')
+
+    def __init__(self, task: Task, payload, checker):
+        self.task = task
+        self.payload = payload
+        self.checker = checker
+        self.result: Future = Future()
+        self.deadline: Optional[float] = None
+        self.attempts = 0
+
+
+class GradingExecutor:
+    """
+    Проверка ответов с «дорогими» проверщиками (Checker.expensive: символьные
+    выражения и т.п.) в ограниченном пуле процессов:
+
+    - дешёвые проверки (точное совпадение, числа, наборы, regex) идут быстрым
+      путём прямо в вызывающем потоке;
+    - дорогие уходят в ProcessPoolExecutor: у каждого процесса лимит памяти
+      (RLIMIT_AS), у каждой проверки — лимит процессорного времени (RLIMIT_CPU)
+      и срок timeout + DEADLINE_SLACK по часам, который отсчитывается с момента,
+      когда процесс пула взял проверку (время в очереди не в счёт); пул
+      пересоздаётся, только если его занимает проверка, вышедшая за срок, а
+      остальные прерванные этим проверки один раз перезапускаются в новом пуле;
+    - grade_async() ждёт результат в event loop, не занимая поток (сокет битвы);
+    - defer() не ждёт вовсе: результат передаётся колбэку в отдельном потоке
+      (HTTP-отправка пишет вердикт в Submission позже, см. api/submissions.py).
+    """
+
+    def __init__(self, enabled: bool = True, max_workers: int = 2, timeout: float = 2.0,
+                 memory_mb: int = 256, start_method: str = 'spawn', worker_cache_size: int = 256):
+        self.enabled = enabled
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.start_method = start_method
+        self.worker_cache_size = worker_cache_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._watch_stop: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, _Job] = {}
+        self._job_ids = itertools.count()
+        self._callbacks = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='grading-callback')
+
+    # --- публичный API ---
+
+    def needs_pool(self, task: Task) -> bool:
+        """Пойдёт ли проверка ответа на эту задачу в пул процессов."""
+        if not self.enabled:
+            return False
+        try:
+            checker = checker_cache.get(task)
+        except CheckerSpecError:
+            return False
+        return checker is not None and checker.expensive
+
+    def grade(self, task: Task, payload) -> GradeResult:
+        """Проверить ответ, дождавшись результата (сама проверка — не дольше timeout)."""
+        if not self.needs_pool(task):
+            return grade_answer(task, payload)
+        return self._submit(task, payload).result()
+
+    def grade_many(self, items: List[Tuple[Task, object]]) -> List[GradeResult]:
+        """Проверить пачку ответов: дорогие проверки идут в пул параллельно."""
+        pending = [self._submit(task, payload) if self.needs_pool(task) else None for task, payload in items]
+        return [future.result() if future is not None else grade_answer(task, payload)
+                for future, (task, payload) in zip(pending, items)]
+
+    async def grade_async(self, task: Task, payload) -> GradeResult:
+        """Проверить ответ из асинхронного кода: ожидание не занимает поток."""
+        if not self.needs_pool(task):
+            return grade_answer(task, payload)
+        return await asyncio.wrap_future(self._submit(task, payload))
+
+    def defer(self, task: Task, payload, callback: Callable[[GradeResult], None]):
+        """Запустить проверку и передать результат callback(result) в фоновом потоке."""
+        self._callbacks.submit(self._run_callback, task, payload, callback)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._stop_watch()
+            # Незавершённые проверки не перезапускаем: пул закрывается насовсем
+            jobs, self._jobs = list(self._jobs.values()), {}
+        for job in jobs:
+            self._resolve(job, FAILED_RESULT)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- внутреннее ---
+
+    def _run_callback(self, task, payload, callback):
+        try:
+            callback(self.grade(task, payload))
+        except Exception:
+            logger.exception("Ошибка при записи результата проверки задачи %s", task.pk)
+        finally:
+            close_old_connections()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                # Процессы пула сообщают сюда id проверки, которую начали: от этого момента считается срок
+                started = context.SimpleQueue()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=grading_worker.init_worker,
+                    initargs=(self.memory_mb, self.worker_cache_size, started),
+                )
+                self._watch_stop = threading.Event()
+                threading.Thread(target=self._watch, args=(started, self._watch_stop),
+                                 name='grading-watch', daemon=True).start()
+            return self._pool
+
+    def _stop_watch(self):
+        # Вызывается под self._lock
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            self._watch_stop = None
+
+    def _submit(self, task: Task, payload) -> Future:
+        """Future с GradeResult; ошибки пула уже переведены в вердикт."""
+        cached = verdict_cache.get(task, payload)
+        if cached is not None:
+            result: Future = Future()
+            result.set_result(cached)
+            return result
+        job = _Job(task, payload, checker_cache.get(task))
+        self._dispatch(job)
+        return job.result
+
+    def _dispatch(self, job: _Job):
+        """Отправить проверку в пул (в том числе повторно — после пересоздания пула)."""
+        job_id = next(self._job_ids)
+        job.attempts += 1
+        job.deadline = None
+        with self._lock:
+            self._jobs[job_id] = job
+        pool = self._get_pool()
+        try:
+            inner = pool.submit(
+                grading_worker.run_check, job_id, (job.task.pk, job.task.updated_at), job.task.solution_spec,
+                job.task.expected_answer, job.payload, self.timeout,
+            )
+        except (BrokenProcessPool, RuntimeError):
+            self._forget(job_id)
+            self._recycle(pool)
+            self._resolve(job, FAILED_RESULT)
+            return
+        inner.add_done_callback(lambda f: self._finish(job_id, job, pool, f))
+
+    def _finish(self, job_id: int, job: _Job, pool: ProcessPoolExecutor, f: Future):
+        if not self._forget(job_id):
+            return  # уже снята сторожем по сроку
+        try:
+            outcome = f.result()
+        except (BrokenProcessPool, CancelledError):
+            # Пул пересоздан из-за чужой зависшей проверки или процесс упал:
+            # один раз пробуем заново в новом пуле, а не отдаём сбой пользователю
+            self._recycle(pool)
+            if job.attempts < 2:
+                self._dispatch(job)
+                return
+            outcome = grading_worker.ERROR
+        except Exception:
+            logger.exception("Ошибка процесса проверки")
+            outcome = grading_worker.ERROR
+        if outcome == grading_worker.TIMEOUT:
+            value = TIMEOUT_RESULT
+        elif outcome == grading_worker.MEMORY:
+            value = MEMORY_RESULT
+        elif outcome == grading_worker.ERROR:
+            value = FAILED_RESULT
+        else:
+            # Кэшируем только настоящие вердикты: таймаут или сбой пула могут не повториться
+            value = verdict(job.task, job.checker, bool(outcome))
+            verdict_cache.put(job.task, job.payload, value)
+        self._resolve(job, value)
+
+    def _forget(self, job_id: int) -> bool:
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+    @staticmethod
+    def _resolve(job: _Job, value: GradeResult):
+        try:
+            job.result.set_result(value)
+        except InvalidStateError:
+            pass
+
+    # --- сторож сроков ---
+
+    def _watch(self, started, stop: threading.Event):
+        """Поток на пул: отмечает старт проверок и снимает те, что вышли за срок."""
+        try:
+            while not stop.is_set():
+                while not started.empty():
+                    self._mark_started(started.get())
+                self._expire_overdue()
+                stop.wait(WATCH_INTERVAL)
+        except (EOFError, OSError):
+            pass  # процессы пула погашены посреди записи
+        finally:
+            started.close()
+
+    def _mark_started(self, job_id: int, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.deadline = now + self.timeout + DEADLINE_SLACK
+
+    def _expire_overdue(self, now: Optional[float] = None) -> int:
+        """Выполняющиеся дольше срока проверки получают TIMEOUT, их пул пересоздаётся."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            overdue = [job_id for job_id, job in self._jobs.items()
+                       if job.deadline is not None and job.deadline < now]
+            expired = [self._jobs.pop(job_id) for job_id in overdue]
+        for job in expired:
+            self._resolve(job, TIMEOUT_RESULT)
+        if expired:
+            self._recycle()
+        return len(expired)
+
+    def _recycle(self, broken: Optional[ProcessPoolExecutor] = None):
+        """
+        Пул сломан или занят зависшей проверкой: гасим процессы и создаём новый при следующем вызове.
+        broken — пул, в котором случился сбой: если его уже заменили, новый не трогаем.
+        """
+        with self._lock:
+            if self._pool is None or (broken is not None and broken is not self._pool):
+                return
+            pool, self._pool = self._pool, None
+            self._stop_watch()
+            # Проверки старого пула будут перезапущены в новом — их срок начнётся заново
+            for job in self._jobs.values():
+                job.deadline = None
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+_config = getattr(settings, 'GRADING_POOL', {})
+grading_executor = GradingExecutor(
+    enabled=_config.get('ENABLED', True),
+    max_workers=_config.get('MAX_WORKERS', 2),
+    timeout=_config.get('TIMEOUT_MS', 2000) / 1000,
+    memory_mb=_config.get('MEMORY_MB', 256),
+    start_method=_config.get('START_METHOD', 'spawn'),
+)
@@ -0,0 +1,77 @@
+# api/grading_worker.py
+"""
+Код, который выполняется в процессах пула проверки (api/grading_pool.py).
+Django здесь не нужен и не импортируется: процессу передаются только
+solution_spec, expected_answer и ответ.
+"""
+import math
+import signal
+from typing import Optional
+
+from .checkers import CheckerCache
+
+try:
+    import resource
+except ImportError:  # не-POSIX: лимиты ресурсов недоступны
+    resource = None
+
+# Вердикты, кроме True/False
+TIMEOUT = 'timeout'
+MEMORY = 'memory'
+ERROR = 'error'
+
+_cache: Optional[CheckerCache] = None
+_started = None  # SimpleQueue: id начатых проверок для сторожа сроков в основном процессе
+
+
+class CheckTimeout(Exception):
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CheckTimeout()
+
+
+def init_worker(memory_mb: int, cache_size: int, started=None):
+    """Инициализация процесса пула: лимит памяти, свой кэш проверщиков и очередь стартов."""
+    global _cache, _started
+    _cache = CheckerCache(maxsize=cache_size)
+    _started = started
+    if resource is None:
+        return
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Мягкий лимит CPU выставляется на каждую проверку; по SIGXCPU прерываем её исключением
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+
+def run_check(job_id: int, key: tuple, spec: Optional[dict], expected_answer: str, payload, timeout: float):
+    """
+    Проверить ответ в процессе пула: True/False или TIMEOUT/MEMORY/ERROR.
+    Время ограничено мягким RLIMIT_CPU (процессорное время этого процесса + timeout);
+    срок по часам считает основной процесс с момента, когда получит job_id из _started.
+    """
+    if _started is not None:
+        _started.put(job_id)
+    soft = hard = None
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        budget = math.ceil(usage.ru_utime + usage.ru_stime + timeout)
+        if hard == resource.RLIM_INFINITY or budget < hard:
+            resource.setrlimit(resource.RLIMIT_CPU, (budget, hard))
+    try:
+        checker = _cache.get_or_compile(key, spec, expected_answer)
+        if checker is None:
+            return False
+        return bool(checker.check(payload))
+    except CheckTimeout:
+        return TIMEOUT
+    except MemoryError:
+        return MEMORY
+    except Exception:
+        return ERROR
+    finally:
+        if resource is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
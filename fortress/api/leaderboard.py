@@ -0,0 +1,170 @@
+# api/leaderboard.py
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Score
+
+# Контекст рейтинга: (classroom_id, team_id), как в Score; (None, None) — глобальный
+Context = Tuple[Optional[int], Optional[int]]
+
+
+# -----------------------------
+# Рейтинг в памяти
+# -----------------------------
+class ContextBoard:
+    """
+    Рейтинг одного контекста: отсортированный список (-points, student_id)
+    и словарь student_id → points. Место ищется бинарным поиском — O(log n);
+    при равных очках выше стоит студент с меньшим id.
+    """
+
+    def __init__(self, rows):
+        self.points: Dict[int, int] = dict(rows)
+        self.order: List[Tuple[int, int]] = sorted((-p, sid) for sid, p in self.points.items())
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.order)
+
+    def set_points(self, student_id: int, points: int):
+        old = self.points.get(student_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, student_id))]
+        self.points[student_id] = points
+        insort(self.order, (-points, student_id))
+
+    def rank(self, student_id: int, default_points: int = 0) -> int:
+        points = self.points.get(student_id)
+        if points is None:
+            # Студента без Score ставим после всех с таким же количеством очков
+            return bisect_right(self.order, (-default_points, float('inf'))) + 1
+        return bisect_left(self.order, (-points, student_id)) + 1
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        return [(sid, -neg) for neg, sid in self.order[:k]]
+
+    def around(self, student_id: int, radius: int) -> List[Tuple[int, int, int]]:
+        """Соседи по рейтингу: [(rank, student_id, points)] в окне ±radius."""
+        if student_id not in self.points:
+            return []
+        pos = self.rank(student_id) - 1
+        lo = max(0, pos - radius)
+        return [(lo + i + 1, sid, -neg) for i, (neg, sid) in enumerate(self.order[lo:pos + radius + 1])]
+
+
+class MemoryLeaderboard:
+    """
+    Рейтинги по контекстам в памяти процесса. Контекст загружается из Score
+    одним запросом при первом обращении и перечитывается не реже max_age секунд
+    (страховка от изменений из других процессов). Локальные начисления
+    применяются сразу после коммита (api/score_ledger.py).
+    """
+
+    def __init__(self, max_age: float = 300.0):
+        self.max_age = max_age
+        self._boards: Dict[Context, ContextBoard] = {}
+        self._lock = threading.RLock()
+
+    def _board(self, ctx: Context) -> ContextBoard:
+        with self._lock:
+            board = self._boards.get(ctx)
+            if board is None or time.monotonic() - board.loaded_at > self.max_age:
+                classroom_id, team_id = ctx
+                rows = Score.objects.filter(classroom_id=classroom_id, team_id=team_id) \
+                                    .values_list('student_id', 'total_points')
+                board = self._boards[ctx] = ContextBoard(rows)
+            return board
+
+    def rank(self, ctx: Context, student_id: int) -> int:
+        with self._lock:
+            return self._board(ctx).rank(student_id)
+
+    def top(self, ctx: Context, k: int) -> List[Tuple[int, int]]:
+        with self._lock:
+            return self._board(ctx).top(k)
+
+    def around(self, ctx: Context, student_id: int, radius: int) -> List[Tuple[int, int, int]]:
+        with self._lock:
+            return self._board(ctx).around(student_id, radius)
+
+    def update(self, rows):
+        """
+        Итоговые очки после начисления: [(student_id, classroom_id, team_id, total_points)]
+        (api/score_ledger.py). Незагруженные контексты не трогаем — прочитаются целиком при обращении.
+        """
+        with self._lock:
+            for student_id, classroom_id, team_id, total in rows:
+                board = self._boards.get((classroom_id, team_id))
+                if board is not None:
+                    board.set_points(student_id, total)
+
+    def invalidate(self, ctx: Optional[Context] = None):
+        with self._lock:
+            if ctx is None:
+                self._boards.clear()
+            else:
+                self._boards.pop(ctx, None)
+
+
+# -----------------------------
+# Рейтинг запросами к БД (несколько процессов без общей памяти)
+# -----------------------------
+class SqlLeaderboard:
+    """
+    Те же запросы через индекс по (classroom, team, total_points):
+    место = 1 + число студентов выше по (очки desc, id asc).
+    """
+
+    @staticmethod
+    def _scores(ctx: Context):
+        classroom_id, team_id = ctx
+        return Score.objects.filter(classroom_id=classroom_id, team_id=team_id)
+
+    @staticmethod
+    def _above(points: int, student_id: int) -> Q:
+        return Q(total_points__gt=points) | Q(total_points=points, student_id__lt=student_id)
+
+    def rank(self, ctx: Context, student_id: int) -> int:
+        points = self._scores(ctx).filter(student_id=student_id).values_list('total_points', flat=True).first()
+        if points is None:
+            return self._scores(ctx).filter(total_points__gte=0).count() + 1
+        return self._scores(ctx).filter(self._above(points, student_id)).count() + 1
+
+    def top(self, ctx: Context, k: int) -> List[Tuple[int, int]]:
+        return list(self._scores(ctx).order_by('-total_points', 'student_id')
+                    .values_list('student_id', 'total_points')[:k])
+
+    def around(self, ctx: Context, student_id: int, radius: int) -> List[Tuple[int, int, int]]:
+        points = self._scores(ctx).filter(student_id=student_id).values_list('total_points', flat=True).first()
+        if points is None:
+            return []
+        rank = self._scores(ctx).filter(self._above(points, student_id)).count() + 1
+        above = list(self._scores(ctx).filter(self._above(points, student_id))
+                     .order_by('total_points', '-student_id')
+                     .values_list('student_id', 'total_points')[:radius])[::-1]
+        below = list(self._scores(ctx).exclude(self._above(points, student_id)).exclude(student_id=student_id)
+                     .order_by('-total_points', 'student_id')
+                     .values_list('student_id', 'total_points')[:radius])
+        rows = above + [(student_id, points)] + below
+        first = rank - len(above)
+        return [(first + i, sid, pts) for i, (sid, pts) in enumerate(rows)]
+
+    def update(self, rows):
+        pass
+
+    def invalidate(self, ctx: Optional[Context] = None):
+        pass
+
+
+def _make_leaderboard():
+    if getattr(settings, 'LEADERBOARD_BACKEND', 'memory') == 'sql':
+        return SqlLeaderboard()
+    return MemoryLeaderboard(max_age=getattr(settings, 'LEADERBOARD_MAX_AGE', 300.0))
+
+
+leaderboard = _make_leaderboard()
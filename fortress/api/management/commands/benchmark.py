@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import BattleBenchmark, bench_environment, compare
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон живой битвы на отдельной тестовой БД: запуск битв, '
+            'ответы через HTTP и сокет, отчёты; p50/p95/p99, SQL-запросы, задержка рассылки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=2, help='Число классов')
+        parser.add_argument('--teams-per-class', type=int, default=4, help='Команд в классе')
+        parser.add_argument('--students-per-team', type=int, default=5, help='Учеников в команде')
+        parser.add_argument('--tasks-per-level', type=int, default=10, help='Задач на каждый уровень L1..L5')
+        parser.add_argument('--rounds', type=int, default=3, help='Раундов ответов через HTTP')
+        parser.add_argument('--ws-rounds', type=int, default=3, help='Раундов ответов через сокет')
+        parser.add_argument('--dashboards', type=int, default=50, help='Запросов к каждому отчёту')
+        parser.add_argument('--concurrency', type=int, default=8, help='Параллельных клиентов')
+        parser.add_argument('--wrong-ratio', type=float, default=0.3, help='Доля неверных ответов')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора (воспроизводимость)')
+        parser.add_argument('--db', help='Файл тестовой БД SQLite (по умолчанию во временном каталоге)')
+        parser.add_argument('--keep-db', action='store_true', help='Не удалять тестовую БД после прогона')
+        parser.add_argument('-o', '--output', help='Сохранить результат в JSON (базовая линия)')
+        parser.add_argument('--compare', help='Сравнить с сохранённым ранее JSON')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        bench = BattleBenchmark(
+            classes=options['classes'],
+            teams_per_class=options['teams_per_class'],
+            students_per_team=options['students_per_team'],
+            tasks_per_level=options['tasks_per_level'],
+            rounds=options['rounds'],
+            ws_rounds=options['ws_rounds'],
+            dashboard_requests=options['dashboards'],
+            concurrency=options['concurrency'],
+            wrong_ratio=options['wrong_ratio'],
+            seed=options['seed'],
+        )
+        with bench_environment(options['db'], options['keep_db']) as db_name:
+            self.stderr.write(f'Тестовая БД: {db_name}')
+            result = bench.run(progress=self.stderr.write)
+
+        self._print(result)
+        if baseline is not None:
+            self._print_compare(compare(baseline, result))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stderr.write(self.style.SUCCESS(f'Результат сохранён: {options["output"]}'))
+
+    def _print(self, result):
+        rows = dict(result['scenarios'], fanout=result['fanout'])
+        self.stdout.write(f'{"сценарий":<24}{"n":>7}{"ошибок":>8}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"SQL":>7}')
+        for name, s in rows.items():
+            self.stdout.write(
+                f'{name:<24}{s["count"]:>7}{s["errors"]:>8}{s.get("throughput_rps", "-"):>9}'
+                f'{s["p50_ms"]:>9}{s["p95_ms"]:>9}{s["p99_ms"]:>9}{s.get("queries_avg", "-"):>7}'
+            )
+
+    def _print_compare(self, rows):
+        self.stdout.write('')
+        self.stdout.write(f'{"сценарий":<24}{"метрика":<16}{"было":>10}{"стало":>10}{"Δ, %":>9}')
+        for row in rows:
+            change = '-' if row['change_pct'] is None else f'{row["change_pct"]:+}'
+            self.stdout.write(
+                f'{row["scenario"]:<24}{row["metric"]:<16}{row["baseline"]:>10}{row["current"]:>10}{change:>9}'
+            )
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.data_export import DATASETS, FORMATS, DataExportError, check_format, get_dataset, iter_rows, \
+    parse_bound, stream_csv, write_columnar
+
+
+class Command(BaseCommand):
+    help = ('Выгрузить сырые данные (отправки, очки, выдачи) в CSV или Parquet/Arrow '
+            'для аналитики — потоково, с постоянным расходом памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS), help='Набор данных')
+        parser.add_argument('--format', default='csv', choices=FORMATS, help='Формат файла (по умолчанию csv)')
+        parser.add_argument('--class-id', type=int, help='Только выдачи класса и его команд')
+        parser.add_argument('--since', help='С даты (YYYY-MM-DD или ISO 8601), включительно')
+        parser.add_argument('--until', help='По дату (YYYY-MM-DD или ISO 8601), не включая')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Строк в одном запросе и RecordBatch')
+        parser.add_argument('-o', '--output', default='-', help='Файл результата ("-" — stdout, только для csv)')
+
+    def handle(self, *args, **options):
+        try:
+            dataset = get_dataset(options['dataset'])
+            fmt = check_format(options['format'])
+            since = parse_bound(options['since'], '--since')
+            until = parse_bound(options['until'], '--until')
+        except DataExportError as e:
+            raise CommandError(str(e))
+        output = options['output']
+        if output == '-' and fmt != 'csv':
+            raise CommandError('Parquet/Arrow пишутся только в файл: укажите --output')
+
+        rows = iter_rows(dataset, options['class_id'], since, until, chunk_size=options['chunk_size'])
+        if fmt == 'csv':
+            if output == '-':
+                for chunk in stream_csv(dataset, rows):
+                    sys.stdout.buffer.write(chunk)
+                return
+            with open(output, 'wb') as f:
+                for chunk in stream_csv(dataset, rows):
+                    f.write(chunk)
+        else:
+            with open(output, 'wb') as f:
+                total = write_columnar(dataset, rows, f, fmt, batch_size=options['chunk_size'])
+            self.stderr.write(f'Записано строк: {total}')
+        self.stderr.write(self.style.SUCCESS(f'Готово: {output}'))
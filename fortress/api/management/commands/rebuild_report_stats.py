@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.report_stats import rebuild_report_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать агрегаты отчётов (ClassReportStat, TeamLevelStat, WrongAnswerStat) из истории Submission'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-id', type=int, help='Пересчитать только один класс')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        processed = rebuild_report_stats(options['class_id'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Готово: учтено отправок — {processed}'))
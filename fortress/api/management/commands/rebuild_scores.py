@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.score_reconcile import reconcile_scores
+
+
+class Command(BaseCommand):
+    help = ('Сверить Score с Submission.points_awarded и исправить расхождения '
+            '(в том числе восстановление после падения в режиме write-behind)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-id', type=int, help='Только контексты одного класса и его команд')
+        parser.add_argument('--team-id', type=int, help='Только контекст одной команды')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Студентов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        if options['class_id'] and options['team_id']:
+            raise CommandError('Укажите либо --class-id, либо --team-id')
+
+        def progress(done, total, stats):
+            if options['verbosity'] >= 1:
+                self.stdout.write(f'{done}/{total} студентов: исправлено {stats["updated"]}, '
+                                  f'добавлено {stats["created"]}')
+
+        stats = reconcile_scores(
+            classroom_id=options['class_id'],
+            team_id=options['team_id'],
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+        prefix = 'Проверка' if options['dry_run'] else 'Готово'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}: студентов {stats["students"]}, строк Score {stats["checked"]}, '
+            f'расхождений {stats["updated"]}, недостающих {stats["created"]}'
+        ))
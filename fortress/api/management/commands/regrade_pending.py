@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.submissions import regrade_stale_pending
+
+
+class Command(BaseCommand):
+    help = ('Допроверить отправки, оставшиеся без вердикта после сбоя или перезапуска процесса '
+            '(отложенная проверка в пуле, api/grading_pool.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=float,
+                            default=getattr(settings, 'GRADING_POOL', {}).get('STALE_AFTER', 60),
+                            help='Сколько секунд отправка может ждать вердикта, прежде чем её допроверить')
+        parser.add_argument('--interval', type=float,
+                            help='Проверять очередь каждые N секунд, не завершаясь (иначе — один проход)')
+
+    def handle(self, *args, **options):
+        if options['interval'] is None:
+            done = regrade_stale_pending(options['stale_after'])
+            self.stdout.write(self.style.SUCCESS(f'Допроверено отправок: {done}'))
+            return
+        self.stdout.write('Поиск отправок без вердикта…')
+        while True:
+            try:
+                done = regrade_stale_pending(options['stale_after'])
+                if done:
+                    self.stdout.write(f'Допроверено отправок: {done}')
+            except Exception as e:
+                self.stderr.write(f'Сбой допроверки: {e}')
+            finally:
+                close_old_connections()
+            time.sleep(options['interval'])
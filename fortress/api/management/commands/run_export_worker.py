@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.export_jobs import export_jobs
+
+
+class Command(BaseCommand):
+    help = ('Воркер фонового экспорта отчётов: выполняет заявки ExportJob из очереди в БД '
+            '(для развёртываний с REPORT_EXPORT_JOBS["IN_PROCESS"] = False)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить очередь и выйти')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            done = export_jobs.run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Выполнено заявок: {done}'))
+            return
+        self.stdout.write('Ожидание заявок на экспорт…')
+        export_jobs.serve_forever()
@@ -0,0 +1,280 @@
+# api/metrics.py
+"""
+Метрики запросов: число SQL-запросов, время в БД, время рендеринга ответа
+и полная длительность — по эндпоинтам («Вид.действие»: SubmissionViewSet.create,
+LeaderboardView.get, BattleConsumer.submit_answer).
+
+- HTTP: MetricsMiddleware; сокеты: metrics.track(...) вокруг обработки сообщения;
+- запросы к БД считает обёртка execute_wrapper, которую получает каждое
+  соединение; текущий замер лежит в contextvar, поэтому учитываются и запросы
+  из database_sync_to_async (asgiref переносит контекст в поток);
+- бюджет запросов на эндпоинт (METRICS['QUERY_BUDGETS']): превышение пишется
+  в лог или, при BUDGET_ACTION='raise', роняет запрос QueryBudgetExceeded —
+  так N+1 в горячем пути ловится тестами до продакшена;
+- GET /api/metrics — текст в формате Prometheus (только с адресов ALLOWED_IPS).
+
+Метрики копятся в памяти процесса: при нескольких воркерах каждый отдаёт свои.
+Запросы, выполненные при отдаче потокового ответа (CSV-выгрузка), не учитываются.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Эндпоинт выполнил больше SQL-запросов, чем разрешает бюджет."""
+
+
+class Measurement:
+    """Замер одного HTTP-запроса или сообщения сокета."""
+    __slots__ = ('queries', 'db_seconds', 'render_seconds', 'started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.started = time.perf_counter()
+
+
+_current: contextvars.ContextVar[Optional[Measurement]] = contextvars.ContextVar('metrics_measurement', default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    measurement = _current.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measurement.queries += 1
+        measurement.db_seconds += time.perf_counter() - start
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    # Сигнал приходит и при переподключении того же соединения — не дублируем обёртку
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+# -----------------------------
+# Хранилище метрик
+# -----------------------------
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'n')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.n += 1
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы по (вид транспорта, эндпоинт); потокобезопасно."""
+
+    def __init__(self, budgets: Dict[str, int] = None, budget_action: str = 'log'):
+        self.budgets = dict(budgets or {})
+        self.budget_action = budget_action
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = defaultdict(int)  # (kind, endpoint, status)
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+        self._queries: Dict[Tuple[str, str], _Histogram] = {}
+        self._db_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._render_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._over_budget: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def record(self, kind: str, endpoint: str, status, m: Measurement, latency: float):
+        key = (kind, endpoint)
+        with self._lock:
+            self._requests[(kind, endpoint, str(status))] += 1
+            self._latency.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(latency)
+            self._queries.setdefault(key, _Histogram(QUERY_BUCKETS)).observe(m.queries)
+            self._db_seconds[key] += m.db_seconds
+            self._render_seconds[key] += m.render_seconds
+
+    def check_budget(self, kind: str, endpoint: str, m: Measurement):
+        budget = self.budgets.get(endpoint)
+        if budget is None or m.queries <= budget:
+            return
+        with self._lock:
+            self._over_budget[(kind, endpoint)] += 1
+        message = f"{endpoint}: {m.queries} SQL-запросов при бюджете {budget}"
+        if self.budget_action == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def reset(self):
+        with self._lock:
+            for store in (self._requests, self._latency, self._queries,
+                          self._db_seconds, self._render_seconds, self._over_budget):
+                store.clear()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Средние по эндпоинтам: {"http BattleView.post": {"count", "queries_avg", ...}}."""
+        with self._lock:
+            result = {}
+            for (kind, endpoint), q in sorted(self._queries.items()):
+                n = max(1, q.n)
+                result[f'{kind} {endpoint}'] = {
+                    'count': q.n,
+                    'queries_avg': round(q.total / n, 2),
+                    'db_ms_avg': round(self._db_seconds[(kind, endpoint)] * 1000 / n, 3),
+                    'render_ms_avg': round(self._render_seconds[(kind, endpoint)] * 1000 / n, 3),
+                    'latency_ms_avg': round(self._latency[(kind, endpoint)].total * 1000 / n, 3),
+                    'over_budget': self._over_budget.get((kind, endpoint), 0),
+                }
+            return result
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        out = []
+
+        def labels(kind, endpoint, **extra):
+            parts = [f'kind="{kind}"', f'endpoint="{endpoint}"'] + [f'{k}="{v}"' for k, v in extra.items()]
+            return '{' + ','.join(parts) + '}'
+
+        def histogram(name, help_text, data):
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} histogram')
+            for (kind, endpoint), h in sorted(data.items()):
+                for bound, count in zip(h.buckets, h.counts):
+                    out.append(f'{name}_bucket{labels(kind, endpoint, le=bound)} {count}')
+                out.append(f'{name}_bucket{labels(kind, endpoint, le="+Inf")} {h.n}')
+                out.append(f'{name}_sum{labels(kind, endpoint)} {h.total}')
+                out.append(f'{name}_count{labels(kind, endpoint)} {h.n}')
+
+        def counter(name, help_text, data):
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} counter')
+            for (kind, endpoint), value in sorted(data.items()):
+                out.append(f'{name}{labels(kind, endpoint)} {value}')
+
+        with self._lock:
+            out.append('# HELP fortress_requests_total Обработанные HTTP-запросы и сообщения сокетов')
+            out.append('# TYPE fortress_requests_total counter')
+            for (kind, endpoint, status), value in sorted(self._requests.items()):
+                out.append(f'fortress_requests_total{labels(kind, endpoint, status=status)} {value}')
+            histogram('fortress_request_duration_seconds', 'Полная длительность обработки', self._latency)
+            histogram('fortress_db_queries', 'SQL-запросов на один запрос', self._queries)
+            counter('fortress_db_seconds_total', 'Время выполнения SQL', self._db_seconds)
+            counter('fortress_render_seconds_total', 'Время рендеринга (сериализации) ответа', self._render_seconds)
+            counter('fortress_query_budget_exceeded_total', 'Превышения бюджета SQL-запросов', self._over_budget)
+        return '\n'.join(out) + '\n'
+
+    @contextmanager
+    def track(self, endpoint: str, kind: str = 'ws'):
+        """
+        Замерить обработку вне HTTP-цикла (сообщение сокета, фоновая задача).
+        Статус — ok/error по тому, вылетело ли исключение.
+        """
+        m = Measurement()
+        token = _current.set(m)
+        status = 'ok'
+        try:
+            yield m
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            _current.reset(token)
+            self.record(kind, endpoint, status, m, time.perf_counter() - m.started)
+        self.check_budget(kind, endpoint, m)
+
+
+_config = getattr(settings, 'METRICS', {})
+metrics = MetricsRegistry(
+    budgets=_config.get('QUERY_BUDGETS', {}),
+    budget_action=_config.get('BUDGET_ACTION', 'log'),
+)
+if _config.get('ENABLED', True):
+    connection_created.connect(_install_wrapper, dispatch_uid='api.metrics.count_queries')
+    # Соединения, открытые до импорта модуля (проверки при старте), тоже считаем
+    for _conn in connections.all(initialized_only=True):
+        if _conn.connection is not None:
+            _install_wrapper(None, _conn)
+
+
+# -----------------------------
+# HTTP
+# -----------------------------
+
+def endpoint_name(request) -> str:
+    """«Вид.действие» для DRF, «Вид.метод» для APIView, имя маршрута для прочего."""
+    view = getattr(request, '_metrics_view', None)
+    if view is None:
+        return 'unmatched'
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return f'{view.__module__}.{view.__name__}'
+    method = request.method.lower()
+    action = (getattr(view, 'actions', None) or {}).get(method, method)
+    return f'{cls.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """Замер каждого HTTP-запроса: SQL, время в БД, рендеринг ответа, длительность."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _config.get('ENABLED', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        m = Measurement()
+        request._metrics = m
+        token = _current.set(m)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        endpoint = endpoint_name(request)
+        metrics.record('http', endpoint, response.status_code, m, time.perf_counter() - m.started)
+        metrics.check_budget('http', endpoint, m)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_func
+        return None
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после вида: засекаем время до и после render()
+        m = getattr(request, '_metrics', None)
+        if m is not None:
+            start = time.perf_counter()
+
+            def rendered(resp):
+                m.render_seconds += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    """GET /api/metrics — метрики процесса в формате Prometheus."""
+    allowed = _config.get('ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if '*' not in allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden('metrics: доступ только с разрешённых адресов')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,74 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+    """
+    Агрегаты для отчётов учителя (api/report_stats.py).
+    Для уже накопленной истории: python manage.py rebuild_report_stats
+    """
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        # ClassReportStat
+        migrations.CreateModel(
+            name='ClassReportStat',
+            fields=[
+                ('classroom', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='report_stat', serialize=False, to='api.classroom')),
+                ('solve_count', models.PositiveIntegerField(default=0)),
+                ('solve_seconds', models.FloatField(default=0)),
+            ],
+        ),
+
+        # TeamLevelStat
+        migrations.CreateModel(
+            name='TeamLevelStat',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('level', models.PositiveIntegerField()),
+                ('solvers', models.PositiveIntegerField(default=0)),
+                ('solve_count', models.PositiveIntegerField(default=0)),
+                ('solve_seconds', models.FloatField(default=0)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_stats', to='api.team')),
+            ],
+            options={
+                'unique_together': {('team', 'level')},
+            },
+        ),
+
+        # TeamLevelSolver
+        migrations.CreateModel(
+            name='TeamLevelSolver',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('level', models.PositiveIntegerField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_solves', to=settings.AUTH_USER_MODEL)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='level_solvers', to='api.team')),
+            ],
+            options={
+                'unique_together': {('team', 'level', 'student')},
+            },
+        ),
+
+        # WrongAnswerStat
+        migrations.CreateModel(
+            name='WrongAnswerStat',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('answer', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wrong_answer_stats', to='api.classroom')),
+            ],
+            options={
+                'unique_together': {('classroom', 'answer')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='wronganswerstat',
+            index=models.Index(fields=['classroom', '-count'], name='api_wrongans_class_cnt_idx'),
+        ),
+    ]
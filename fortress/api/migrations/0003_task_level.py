@@ -0,0 +1,35 @@
+import re
+
+from django.db import migrations, models
+
+LEVEL_TAG_RE = re.compile(r"^L(\d+)$", re.IGNORECASE)
+
+
+def fill_task_level(apps, schema_editor):
+    # Проставляем уровень уже существующим задачам по тегу 'L{n}'
+    Task = apps.get_model('api', 'Task')
+    to_update = []
+    for task in Task.objects.only('id', 'tags').iterator():
+        for t in task.tags or []:
+            m = LEVEL_TAG_RE.match(str(t).strip())
+            if m:
+                task.level = int(m.group(1))
+                to_update.append(task)
+                break
+    Task.objects.bulk_update(to_update, ['level'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_report_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='level',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_task_level, migrations.RunPython.noop),
+    ]
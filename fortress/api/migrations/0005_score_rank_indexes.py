@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_task_level_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['classroom', 'team', '-total_points', '-id'], name='api_score_ctx_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['team', '-total_points', '-id'], name='api_score_team_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def merge_duplicate_scores(apps, schema_editor):
+    """
+    unique_together не ловил дубли с NULL в classroom/team: сливаем их
+    в строку с наименьшим id (сумма очков, последнее обновление).
+    """
+    Score = apps.get_model('api', 'Score')
+    dupes = Score.objects.values('student_id', 'classroom_id', 'team_id') \
+                         .annotate(n=models.Count('id')).filter(n__gt=1).order_by()
+    for key in dupes:
+        rows = list(Score.objects.filter(
+            student_id=key['student_id'], classroom_id=key['classroom_id'], team_id=key['team_id']
+        ).order_by('id'))
+        keep, rest = rows[0], rows[1:]
+        keep.total_points = sum(r.total_points for r in rows)
+        keep.last_update = max(r.last_update for r in rows)
+        keep.save(update_fields=['total_points', 'last_update'])
+        Score.objects.filter(id__in=[r.id for r in rest]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_score_rank_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_scores, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='score',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='score',
+            constraint=models.UniqueConstraint(
+                models.F('student'),
+                django.db.models.functions.comparison.Coalesce(
+                    'classroom', models.Value(0), output_field=models.BigIntegerField()
+                ),
+                django.db.models.functions.comparison.Coalesce(
+                    'team', models.Value(0), output_field=models.BigIntegerField()
+                ),
+                name='api_score_ctx_uniq',
+            ),
+        ),
+    ]
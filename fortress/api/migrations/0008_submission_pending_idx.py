@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_task_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('checked_at__isnull', True)), fields=['created_at'],
+                               name='api_submission_pending_idx'),
+        ),
+    ]
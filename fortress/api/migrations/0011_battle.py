@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Battle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('LIVE', 'Идёт'), ('FINISHED', 'Завершена'), ('CANCELLED', 'Отменена')], default='LIVE', max_length=16)),
+                ('ends_at', models.DateTimeField(blank=True, help_text='После этого времени ответы не принимаются', null=True)),
+                ('standings', models.JSONField(blank=True, default=list)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('started_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='started_battles', to=settings.AUTH_USER_MODEL)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='battles', to='api.team')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'LIVE')), fields=('team',), name='api_battle_one_live_per_team')],
+            },
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='battle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assignments', to='api.battle'),
+        ),
+    ]
@@ -1,7 +1,32 @@
+import re
+from typing import List, Optional
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+LEVEL_TAG_RE = re.compile(r"^L(\d+)$", re.IGNORECASE)
+
+
+def levels_from_tags(tags: List[str]) -> List[int]:
+    """Все уровни задачи по тегам вида 'L{n}' (в порядке тегов, без повторов)."""
+    levels: List[int] = []
+    for t in tags or []:
+        m = LEVEL_TAG_RE.match(str(t).strip())
+        if m and int(m.group(1)) not in levels:
+            levels.append(int(m.group(1)))
+    return levels
+
+
+def level_from_tags(tags: List[str]) -> Optional[int]:
+    """
+    Основной уровень задачи — первый тег вида 'L{n}' (колонка Task.level, отчёты).
+    Для подбора задач в битве задача годится на каждом своём уровне (levels_from_tags).
+    """
+    levels = levels_from_tags(tags)
+    return levels[0] if levels else None
+
 
 # -----------------------------
 # Пользователь
@@ -95,6 +120,9 @@ class Task(models.Model):
     Математическая задача. Тело храним в Markdown.
     Для простой проверки предусмотрен expected_answer (например, число/строка).
     Более сложные проверки можно описывать в solution_spec (JSON).
+    level — денормализованный основной уровень, первый тег 'L{n}' (обновляется в save()),
+    чтобы отчёты группировали по колонке, а не разбирали JSON tags. Задача с
+    несколькими тегами уровня выдаётся в битве на каждом из них (api/task_index.py).
     """
     class Difficulty(models.TextChoices):
         EASY = 'EASY', 'Easy'
@@ -108,12 +136,73 @@ class Task(models.Model):
     max_points = models.PositiveIntegerField(default=10)
     expected_answer = models.CharField(max_length=255, blank=True, help_text='Простой правильный ответ (опционально)')
     solution_spec = models.JSONField(default=dict, blank=True)  # произвольные параметры проверки
+    level = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Версия задачи для кэша проверщиков (api/checkers.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Отчёты и выборки по основному уровню, свежие задачи первыми
+            models.Index(fields=['level', '-created_at'], name='api_task_level_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.level = level_from_tags(self.tags)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = {'updated_at', 'level'} if 'tags' in update_fields else {'updated_at'}
+            kwargs['update_fields'] = {*update_fields, *extra}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Task({self.title})'
 
 
+# -----------------------------
+# Битва команды
+# -----------------------------
+class Battle(models.Model):
+    """
+    Битва одной команды: запускается учителем (BattleView), идёт, пока её
+    не завершат или не отменят. Переходы — только из TRANSITIONS, у команды
+    не больше одной идущей битвы. Живой счёт битвы держится в памяти
+    (api/battle_state.py), итоговая таблица сохраняется в standings при закрытии.
+    """
+    class Status(models.TextChoices):
+        LIVE = 'LIVE', 'Идёт'
+        FINISHED = 'FINISHED', 'Завершена'
+        CANCELLED = 'CANCELLED', 'Отменена'
+
+    TRANSITIONS = {
+        Status.LIVE: {Status.FINISHED, Status.CANCELLED},
+    }
+
+    team = models.ForeignKey(Team, on_delete=models.PROTECT, related_name='battles')
+    started_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='started_battles')
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.LIVE)
+    ends_at = models.DateTimeField(null=True, blank=True, help_text='После этого времени ответы не принимаются')
+    # [{"rank", "student_id", "points", "correct", "attempts"}] — заполняется при закрытии
+    standings = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['team'], condition=models.Q(status='LIVE'),
+                                    name='api_battle_one_live_per_team'),
+        ]
+
+    def can_transition_to(self, status) -> bool:
+        return status in self.TRANSITIONS.get(self.status, ())
+
+    def accepts_answers(self, now=None) -> bool:
+        return self.status == self.Status.LIVE and (self.ends_at is None or (now or timezone.now()) < self.ends_at)
+
+    def __str__(self):
+        return f'Battle({self.team_id}, {self.status})'
+
+
 # -----------------------------
 # Выдача заданий (Assignment)
 # -----------------------------
@@ -126,6 +215,8 @@ class Assignment(models.Model):
     classroom = models.ForeignKey(Classroom, null=True, blank=True, on_delete=models.PROTECT, related_name='assignments')
     team = models.ForeignKey(Team, null=True, blank=True, on_delete=models.PROTECT, related_name='assignments')
     assigned_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name='given_assignments')
+    # Битва, в которой выдано задание (персональные задания BattleView)
+    battle = models.ForeignKey(Battle, null=True, blank=True, on_delete=models.SET_NULL, related_name='assignments')
     due_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -160,6 +251,9 @@ class Submission(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['assignment', 'student']),
+            # Отправки без вердикта (отложенная проверка) — для regrade_pending
+            models.Index(fields=['created_at'], condition=models.Q(checked_at__isnull=True),
+                         name='api_submission_pending_idx'),
         ]
 
 
@@ -179,10 +273,131 @@ class Score(models.Model):
     last_update = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        unique_together = (
-            ('student', 'classroom', 'team'),
-        )
+        constraints = [
+            # NULL в unique_together не совпадают между собой, поэтому ключ — через COALESCE:
+            # на этот индекс опирается INSERT ... ON CONFLICT в api/score_ledger.py
+            models.UniqueConstraint(
+                models.F('student'),
+                Coalesce('classroom', models.Value(0), output_field=models.BigIntegerField()),
+                Coalesce('team', models.Value(0), output_field=models.BigIntegerField()),
+                name='api_score_ctx_uniq',
+            ),
+        ]
+        indexes = [
+            # Рейтинг в контексте: WHERE classroom/team = ... ORDER BY total_points DESC, id DESC
+            models.Index(fields=['classroom', 'team', '-total_points', '-id'], name='api_score_ctx_rank_idx'),
+            models.Index(fields=['team', '-total_points', '-id'], name='api_score_team_rank_idx'),
+        ]
 
     def __str__(self):
         dim = self.team or self.classroom or 'GLOBAL'
         return f'Score(student={self.student_id}, ctx={dim}, points={self.total_points})'
+
+
+# -----------------------------
+# Агрегаты для отчётов (обновляются при проверке ответа, см. api/report_stats.py)
+# -----------------------------
+class ClassReportStat(models.Model):
+    """
+    Сводка по классу: сколько верных решений учтено и суммарное время решения
+    (checked_at - assignment.created_at) в секундах — для среднего времени.
+    """
+    classroom = models.OneToOneField(Classroom, on_delete=models.CASCADE, primary_key=True, related_name='report_stat')
+    solve_count = models.PositiveIntegerField(default=0)
+    solve_seconds = models.FloatField(default=0)
+
+
+class TeamLevelStat(models.Model):
+    """
+    Прогресс команды по уровню: уникальные решившие и время решения.
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='level_stats')
+    level = models.PositiveIntegerField()
+    solvers = models.PositiveIntegerField(default=0)
+    solve_count = models.PositiveIntegerField(default=0)
+    solve_seconds = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('team', 'level')
+
+
+class TeamLevelSolver(models.Model):
+    """
+    Кто из команды уже решил задачу уровня — чтобы solvers считал студентов, а не отправки.
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='level_solvers')
+    level = models.PositiveIntegerField()
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='level_solves')
+
+    class Meta:
+        unique_together = ('team', 'level', 'student')
+
+
+class WrongAnswerStat(models.Model):
+    """
+    Счётчик неправильных ответов (по строке ответа) в рамках класса.
+    """
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='wrong_answer_stats')
+    answer = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('classroom', 'answer')
+        indexes = [
+            models.Index(fields=['classroom', '-count'], name='api_wrongans_class_cnt_idx'),
+        ]
+
+
+# -----------------------------
+# Версии данных для HTTP-кэша (ETag) и кэша отчётов, см. api/data_version.py
+# -----------------------------
+class DataVersion(models.Model):
+    """
+    Счётчик изменений по ключу: 'class:{id}' — всё, что видно в отчётах класса
+    (ответы, очки, выдачи, команды и составы), 'tasks' — банк задач.
+    Увеличивается в той же транзакции, что и сама запись.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'DataVersion({self.key}={self.version})'
+
+
+# -----------------------------
+# Фоновые задания экспорта отчётов (очередь в БД, см. api/export_jobs.py)
+# -----------------------------
+class ExportJob(models.Model):
+    """
+    Заявка на Excel-отчёт. Сама таблица служит очередью: воркер забирает
+    самую старую PENDING-заявку условным UPDATE. Готовый файл лежит на диске
+    под artifact_key — (scope, класс, студент, водяной знак данных), поэтому
+    одинаковые заявки до появления новых ответов отдаются из кэша.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'В очереди'
+        RUNNING = 'RUNNING', 'Выполняется'
+        DONE = 'DONE', 'Готово'
+        FAILED = 'FAILED', 'Ошибка'
+
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    scope = models.CharField(max_length=16)
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='export_jobs')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    artifact_key = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Очередь: WHERE status = 'PENDING' ORDER BY id
+            models.Index(fields=['status', 'id'], name='api_exportjob_queue_idx'),
+            models.Index(fields=['artifact_key', 'status'], name='api_exportjob_key_idx'),
+        ]
+
+    def __str__(self):
+        return f'ExportJob({self.id}, {self.scope}, class={self.classroom_id}, {self.status})'
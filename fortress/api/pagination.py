@@ -0,0 +1,149 @@
+# api/pagination.py
+import base64
+import binascii
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ScoreKeysetPagination(BasePagination):
+    """
+    Keyset-пагинация рейтинга по (total_points, id), оба по убыванию:
+    WHERE total_points < p OR (total_points = p AND id < i) — глубокие страницы
+    не дороже первой, COUNT(*) не выполняется. Порядок совпадает с индексами
+    Score (см. Score.Meta.indexes). Курсор — непрозрачная строка "p:i[:r]",
+    где r — направление назад.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'pageSize'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self._get_page_size(request)
+        position, reverse = self._decode(request.query_params.get(self.cursor_query_param))
+
+        if position is None:
+            qs = queryset.order_by('-total_points', '-id')
+        elif reverse:
+            points, pk = position
+            qs = queryset.filter(Q(total_points__gt=points) | Q(total_points=points, id__gt=pk)) \
+                         .order_by('total_points', 'id')
+        else:
+            points, pk = position
+            qs = queryset.filter(Q(total_points__lt=points) | Q(total_points=points, id__lt=pk)) \
+                         .order_by('-total_points', '-id')
+
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.first, self.last = (rows[0], rows[-1]) if rows else (None, None)
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self._link(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self._link(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def _get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _link(self, row, reverse: bool) -> str:
+        token = f'{row.total_points}:{row.pk}' + (':r' if reverse else '')
+        cursor = base64.urlsafe_b64encode(token.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None, False
+        try:
+            parts = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+            return (int(parts[0]), int(parts[1])), parts[2:] == ['r']
+        except (ValueError, IndexError, UnicodeDecodeError, binascii.Error):
+            raise NotFound('Неверный курсор')
+
+
+class NoCountPageNumberPagination(PageNumberPagination):
+    """
+    Постраничный вывод без COUNT(*): читаем на одну строку больше,
+    чтобы понять, есть ли следующая страница. В ответе нет "count".
+    """
+    page_size_query_param = 'pageSize'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            self.page_number = 1
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self._page_link(self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        return self._page_link(self.page_number - 1)
+
+    def _page_link(self, number):
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, number)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties'].pop('count', None)
+        schema['required'] = [k for k in schema.get('required', []) if k != 'count']
+        return schema
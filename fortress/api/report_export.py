@@ -0,0 +1,219 @@
+# api/report_export.py
+"""
+Построение Excel-отчётов (POST /api/reports/export).
+
+Книга пишется в режиме openpyxl write_only: строки уходят в файл по мере
+чтения из БД (querysets через .iterator(), только нужные поля через
+values_list), а сам файл — во временный SpooledTemporaryFile, который
+небольшие отчёты держит в памяти, а крупные сбрасывает на диск. Поэтому
+пиковая память воркера не зависит от размера класса.
+"""
+from __future__ import annotations
+
+import tempfile
+from typing import IO, NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from rest_framework.exceptions import NotFound, ParseError, PermissionDenied
+
+from .data_version import TASKS_KEY, class_key, versions
+from .leaderboard import leaderboard
+from .models import LEVEL_TAG_RE, Classroom, Score, Submission, Team, TeamMembership
+from .report_queries import get_report_aggregator
+
+User = get_user_model()
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Сколько строк за раз читать из БД при выгрузке длинных листов
+EXPORT_CHUNK_SIZE = 2000
+
+# Отчёты меньше этого размера собираются в памяти, больше — во временном файле на диске
+EXPORT_SPOOL_MAX_SIZE = getattr(settings, 'REPORT_EXPORT_SPOOL_MB', 8) * 1024 * 1024
+
+
+class ExportRequest(NamedTuple):
+    scope: str                  # "CLASS" | "STUDENT"
+    classroom: Classroom
+    student_id: Optional[int]
+
+    @property
+    def filename(self) -> str:
+        return f"report_{self.scope.lower()}_{self.classroom.id}.xlsx"
+
+    def artifact_key(self, watermark: str) -> str:
+        """Ключ готового файла: одинаковые отчёты по тем же данным совпадают."""
+        return f"{self.scope.lower()}_{self.classroom.id}_{self.student_id or 0}_{watermark}"
+
+
+def data_watermark(classroom: Classroom) -> str:
+    """
+    Водяной знак данных отчёта: версии данных класса и банка задач
+    (api/data_version.py). Меняется с каждым новым вердиктом, выдачей или
+    правкой состава — по нему кэшируются готовые файлы (api/export_jobs.py).
+    """
+    v = versions([class_key(classroom.id), TASKS_KEY])
+    return f"{v[class_key(classroom.id)]}-{v[TASKS_KEY]}"
+
+
+def human_timedelta(td) -> str:
+    """Удобная строка для среднего времени решения."""
+    total_seconds = int(td.total_seconds())
+    mins, secs = divmod(total_seconds, 60)
+    hours, mins = divmod(mins, 60)
+    if hours:
+        return f"{hours}ч {mins}м"
+    if mins:
+        return f"{mins}м {secs}с"
+    return f"{secs}с"
+
+
+# -----------------------------
+# Разбор запроса и проверка прав
+# -----------------------------
+
+def parse_export_request(user, data) -> ExportRequest:
+    """
+    Проверяет тело запроса экспорта и права пользователя.
+    Бросает ParseError / NotFound / PermissionDenied (DRF отдаёт их как {"detail": ...}).
+    """
+    scope = str(data.get("scope", "")).upper()
+    class_id = data.get("classId")
+    student_id = data.get("studentId")
+
+    if scope not in {"CLASS", "STUDENT"}:
+        raise ParseError("scope должен быть CLASS или STUDENT")
+    if not class_id:
+        raise ParseError("Укажите classId")
+
+    try:
+        classroom = Classroom.objects.select_related("teacher").get(id=class_id)
+    except (Classroom.DoesNotExist, ValueError, TypeError):
+        raise NotFound("Класс не найден")
+
+    if scope == "CLASS":
+        if user.role != "TEACHER" or classroom.teacher_id != user.id:
+            raise PermissionDenied("Доступ запрещён: это не ваш класс")
+        return ExportRequest(scope, classroom, None)
+
+    if not student_id:
+        raise ParseError("Для STUDENT-отчёта нужен studentId")
+    try:
+        student_id = int(student_id)
+    except (TypeError, ValueError):
+        raise ParseError("studentId должен быть числом")
+    if user.role == "STUDENT" and user.id != student_id:
+        raise PermissionDenied("Студент может экспортировать только свой отчёт")
+    if user.role == "TEACHER" and classroom.teacher_id != user.id:
+        raise PermissionDenied("Доступ запрещён: это не ваш класс")
+    return ExportRequest(scope, classroom, student_id)
+
+
+# -----------------------------
+# Листы отчётов
+# -----------------------------
+
+def _write_class_sheets(wb, classroom: Classroom):
+    aggregator = get_report_aggregator()
+
+    # ----- Лист 1: Сводка по классу -----
+    ws = wb.create_sheet("Сводка")
+    ws.append(["Класс", classroom.name])
+    ws.append(["Среднее время решения", human_timedelta(aggregator.avg_solve_time(classroom))])
+    ws.append([])
+    ws.append(["ТОП ошибок", "Количество"])
+    for row in aggregator.top_errors(classroom, 20):
+        ws.append([row["value"], row["count"]])
+
+    # ----- Лист 2: Прогресс команд по уровням -----
+    ws2 = wb.create_sheet("Прогресс команд")
+    ws2.append(["Команда", "Уровень", "Решивших", "Участников", "Завершение, %"])
+    members_map = {
+        row["team_id"]: row["members"]
+        for row in TeamMembership.objects.filter(team__classroom=classroom)
+                                         .values("team_id")
+                                         .annotate(members=Count("student_id"))
+    }
+    progress = aggregator.team_level_progress(classroom)
+    for tid, name in Team.objects.filter(classroom=classroom).values_list("id", "name").iterator():
+        members = members_map.get(tid, 0)
+        for level, solved in sorted(progress.get(tid, {}).items()):
+            pct = round((solved / max(1, members)) * 100, 1)
+            ws2.append([name, level, solved, members, pct])
+
+    # ----- Лист 3: Рейтинг -----
+    ws3 = wb.create_sheet("Рейтинг")
+    ws3.append(["Студент", "Очки"])
+    class_scores = Score.objects.filter(classroom=classroom, team__isnull=True) \
+                                .order_by("-total_points", "-id") \
+                                .values_list("student__username", "student_id", "total_points")
+    for username, sid, points in class_scores.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        ws3.append([username or sid, points])
+
+
+def _write_student_sheets(wb, classroom: Classroom, student_id: int):
+    # ----- Индивидуальный отчёт -----
+    ws = wb.create_sheet("Студент")
+    stu = User.objects.filter(id=student_id).first()
+    ws.append(["Класс", classroom.name])
+    ws.append(["Студент", (stu.full_name or stu.username) if stu else student_id])
+
+    solved_q = Submission.objects.filter(
+        is_correct=True, student_id=student_id
+    ).filter(
+        Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom)
+    )
+
+    score = Score.objects.filter(student_id=student_id, classroom=classroom, team__isnull=True).first()
+    ws.append(["Решённых задач", solved_q.count()])
+    ws.append(["Баллы", score.total_points if score else 0])
+    ws.append(["Позиция в рейтинге", leaderboard.rank((classroom.id, None), student_id)])
+
+    # Темы (теги, кроме L{n})
+    topics: set[str] = set()
+    for tags in solved_q.values_list("assignment__task__tags", flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        for t in (tags or []):
+            if not LEVEL_TAG_RE.match(str(t)):
+                topics.add(str(t))
+    ws.append([])
+    ws.append(["Пройденные темы"])
+    for t in sorted(topics):
+        ws.append([t])
+
+    # Подробный список решённых задач
+    ws2 = wb.create_sheet("Задачи")
+    ws2.append(["Название", "Уровень", "Получено очков", "Дата проверки"])
+    rows = solved_q.order_by("-checked_at") \
+                   .values_list("assignment__task__title", "assignment__task__level", "points_awarded", "checked_at")
+    for title, level, points, checked_at in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        ws2.append([title, level or "", points, checked_at.strftime("%Y-%m-%d %H:%M") if checked_at else ""])
+
+
+# -----------------------------
+# Сборка файла
+# -----------------------------
+
+def write_report(export: ExportRequest, fileobj: IO[bytes]):
+    """Записать .xlsx отчёта в fileobj (write_only: строки не копятся в памяти)."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    if export.scope == "CLASS":
+        _write_class_sheets(wb, export.classroom)
+    else:
+        _write_student_sheets(wb, export.classroom, export.student_id)
+    wb.save(fileobj)
+
+
+def build_report(export: ExportRequest) -> IO[bytes]:
+    """Отчёт во временном файле, перемотанном в начало (закрывает его тот, кто читает)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    try:
+        write_report(export, spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
@@ -0,0 +1,118 @@
+# api/report_queries.py
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Func, Q, TextField
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, Coalesce, Trim
+
+from .models import Submission, ClassReportStat, TeamLevelStat, WrongAnswerStat
+
+
+class JsonAsText(Func):
+    """
+    JSON-значение как текст: строка — без кавычек, объект/массив — его JSON.
+    Так же, как str(payload) в Python для строковых ответов.
+    """
+    output_field = TextField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="json_extract(%(expressions)s, '$')", **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="(%(expressions)s #>> '{}')", **extra_context)
+
+    def as_sql(self, compiler, connection, template=None, **extra_context):
+        if template is None:
+            # Прочие СУБД: обычное приведение к тексту
+            return compiler.compile(Cast(self.source_expressions[0], TextField()))
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+def _class_submissions(classroom):
+    return Submission.objects.filter(Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom))
+
+
+# -----------------------------
+# Агрегация средствами БД (несколько GROUP BY-запросов)
+# -----------------------------
+class SqlReportAggregator:
+    """
+    Считает отчёт класса по таблице Submission на стороне БД.
+    Работает и без материализованных агрегатов; используется, когда нужен
+    точный пересчёт по истории (REPORT_AGGREGATION = 'sql').
+    """
+
+    def team_level_progress(self, classroom) -> Dict[int, Dict[int, int]]:
+        """{team_id: {level: уникальных решивших}} — COUNT(DISTINCT student) по (команда, уровень)."""
+        rows = Submission.objects.filter(is_correct=True, assignment__team__classroom=classroom) \
+            .annotate(level=Coalesce("assignment__task__level", 0)) \
+            .values("assignment__team_id", "level") \
+            .annotate(solvers=Count("student_id", distinct=True)) \
+            .order_by()
+        progress: Dict[int, Dict[int, int]] = defaultdict(dict)
+        for r in rows:
+            progress[r["assignment__team_id"]][r["level"]] = r["solvers"]
+        return progress
+
+    def avg_solve_time(self, classroom) -> timedelta:
+        """AVG(checked_at - assignment.created_at) по верным решениям класса."""
+        solve_time = ExpressionWrapper(F("checked_at") - F("assignment__created_at"), output_field=DurationField())
+        avg = _class_submissions(classroom).filter(is_correct=True, checked_at__isnull=False) \
+            .aggregate(avg=Avg(solve_time))["avg"]
+        return avg or timedelta(0)
+
+    def top_errors(self, classroom, limit: int) -> List[dict]:
+        """
+        Частые неправильные ответы: GROUP BY по ключу 'answer' из answer_payload.
+        Отложенные проверки (checked_at пуст, is_correct ещё False) — не ошибки.
+        """
+        answer = Trim(Coalesce(KeyTextTransform("answer", "answer_payload"), JsonAsText("answer_payload")))
+        rows = _class_submissions(classroom) \
+            .filter(is_correct=False, checked_at__isnull=False, answer_payload__isnull=False) \
+            .annotate(value=answer) \
+            .values("value") \
+            .annotate(count=Count("id")) \
+            .order_by("-count", "value")[:limit]
+        return [{"value": r["value"], "count": r["count"]} for r in rows]
+
+
+# -----------------------------
+# Чтение материализованных агрегатов (api/report_stats.py)
+# -----------------------------
+class MaterializedReportAggregator:
+    """
+    Читает готовые строки, обновляемые при проверке ответа:
+    стоимость не зависит от объёма истории.
+    """
+
+    def team_level_progress(self, classroom) -> Dict[int, Dict[int, int]]:
+        progress: Dict[int, Dict[int, int]] = defaultdict(dict)
+        rows = TeamLevelStat.objects.filter(team__classroom=classroom, solvers__gt=0) \
+                                    .values_list("team_id", "level", "solvers")
+        for team_id, level, solvers in rows:
+            progress[team_id][level] = solvers
+        return progress
+
+    def avg_solve_time(self, classroom) -> timedelta:
+        stat = ClassReportStat.objects.filter(classroom=classroom).first()
+        if not stat or not stat.solve_count:
+            return timedelta(0)
+        return timedelta(seconds=stat.solve_seconds / stat.solve_count)
+
+    def top_errors(self, classroom, limit: int) -> List[dict]:
+        rows = WrongAnswerStat.objects.filter(classroom=classroom).order_by("-count", "answer")[:limit]
+        return [{"value": r.answer, "count": r.count} for r in rows]
+
+
+REPORT_AGGREGATORS = {
+    'materialized': MaterializedReportAggregator,
+    'sql': SqlReportAggregator,
+}
+
+
+def get_report_aggregator():
+    """Источник данных для отчётов класса по настройке REPORT_AGGREGATION."""
+    return REPORT_AGGREGATORS[getattr(settings, 'REPORT_AGGREGATION', 'materialized')]()
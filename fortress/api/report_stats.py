@@ -0,0 +1,192 @@
+# api/report_stats.py
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from django.db import IntegrityError, connection, models, transaction
+
+from .models import (
+    Team, Submission,
+    ClassReportStat, TeamLevelStat, TeamLevelSolver, WrongAnswerStat
+)
+from .data_version import bump_classes
+
+WRONG_ANSWER_MAX_LEN = 255
+
+
+def answer_str(payload) -> str:
+    """Аккуратно вытащим ответ из answer_payload для статистики ошибок."""
+    if isinstance(payload, dict) and "answer" in payload:
+        return str(payload["answer"]).strip()
+    return str(payload).strip()
+
+
+# -----------------------------
+# Инкрементальное обновление агрегатов отчётов
+# -----------------------------
+
+def record_graded(submissions: Iterable[Submission]):
+    """
+    Учесть проверенные отправки в агрегатах отчётов (ClassReportStat,
+    TeamLevelStat, WrongAnswerStat). Вызывается в той же транзакции,
+    что и сохранение отправок; у каждой отправки должны быть загружены
+    assignment, assignment.task и assignment.team.
+    """
+    class_deltas = defaultdict(lambda: [0, 0.0])      # classroom_id -> [solve_count, solve_seconds]
+    level_deltas = defaultdict(lambda: [0, 0, 0.0])   # (team_id, level) -> [solvers, solve_count, solve_seconds]
+    wrong_deltas = defaultdict(int)                   # (classroom_id, answer) -> count
+    solver_candidates = set()                         # (team_id, level, student_id)
+    touched = set()                                   # classroom_id
+
+    for s in submissions:
+        a = s.assignment
+        classroom_id = a.classroom_id or (a.team.classroom_id if a.team_id else None)
+        if classroom_id is None:
+            continue
+        touched.add(classroom_id)
+
+        if not s.is_correct:
+            if s.answer_payload is not None:
+                answer = answer_str(s.answer_payload)[:WRONG_ANSWER_MAX_LEN]
+                wrong_deltas[(classroom_id, answer)] += 1
+            continue
+
+        seconds = _solve_seconds(s)
+        if seconds is not None:
+            class_deltas[classroom_id][0] += 1
+            class_deltas[classroom_id][1] += seconds
+
+        if a.team_id:
+            # Прогресс по уровням считаем только для выдач на команду
+            level = a.task.level or 0
+            delta = level_deltas[(a.team_id, level)]
+            if seconds is not None:
+                delta[1] += 1
+                delta[2] += seconds
+            solver_candidates.add((a.team_id, level, s.student_id))
+
+    # Уникальные решившие: увеличиваем solvers только при первом решении уровня.
+    # Уже известные — одним запросом (надмножество по трём IN, лишнее отсеем),
+    # новые — одним INSERT; уникальный ключ не даст задвоить строку при гонке
+    if solver_candidates:
+        team_ids, levels, student_ids = (set(column) for column in zip(*solver_candidates))
+        known = set(TeamLevelSolver.objects.filter(
+            team_id__in=team_ids, level__in=levels, student_id__in=student_ids,
+        ).values_list('team_id', 'level', 'student_id'))
+        new_solvers = solver_candidates - known
+        TeamLevelSolver.objects.bulk_create(
+            [TeamLevelSolver(team_id=t, level=lv, student_id=st) for t, lv, st in new_solvers],
+            ignore_conflicts=True,
+        )
+        for team_id, level, _ in new_solvers:
+            level_deltas[(team_id, level)][0] += 1
+
+    _increment_many(ClassReportStat, ('classroom_id',), ('solve_count', 'solve_seconds'),
+                    {(classroom_id,): delta for classroom_id, delta in class_deltas.items()})
+    _increment_many(TeamLevelStat, ('team_id', 'level'), ('solvers', 'solve_count', 'solve_seconds'),
+                    level_deltas)
+    _increment_many(WrongAnswerStat, ('classroom_id', 'answer'), ('count',),
+                    {key: [count] for key, count in wrong_deltas.items()})
+
+    # Отчёты этих классов изменились: новые ETag, старые записи кэша не используются
+    bump_classes(touched)
+
+
+def _solve_seconds(submission: Submission) -> Optional[float]:
+    ca, ac = submission.checked_at, submission.assignment.created_at
+    if ca and ac:
+        return (ca - ac).total_seconds()
+    return None
+
+
+def _increment_many(model, key_fields: tuple, value_fields: tuple, deltas: dict, chunk_size: int = 300):
+    """
+    Прибавить счётчики по ключам: {(значения key_fields): [приращения value_fields]}.
+    На SQLite и PostgreSQL — один INSERT ... ON CONFLICT DO UPDATE на пачку ключей
+    (уникальный ключ модели — ровно key_fields), так что пакет ответов с разными
+    неверными ответами не превращается в пару запросов на каждый ответ.
+    Прочие СУБД — по одному _increment на ключ.
+    """
+    rows = sorted((key, values) for key, values in deltas.items() if any(values))
+    if not rows:
+        return
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for key, values in rows:
+            _increment(model, dict(zip(key_fields, key)), **dict(zip(value_fields, values)))
+        return
+
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = [qn(model._meta.get_field(name).column) for name in key_fields + value_fields]
+    keys = ', '.join(columns[:len(key_fields)])
+    updates = ', '.join(f'{c} = {table}.{c} + excluded.{c}' for c in columns[len(key_fields):])
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    # Стабильный порядок ключей — одинаковый порядок блокировок в параллельных транзакциях
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([placeholder] * len(chunk))} '
+                f'ON CONFLICT ({keys}) DO UPDATE SET {updates}',
+                [p for key, values in chunk for p in (*key, *values)],
+            )
+
+
+def _increment(model, key: dict, **deltas):
+    """
+    UPDATE ... SET f = f + delta по ключу; если строки ещё нет — создаём её.
+    Параллельное создание той же строки ловим по уникальному ключу и прибавляем.
+    """
+    changes = {field: models.F(field) + value for field, value in deltas.items() if value}
+    if not changes:
+        return
+    if model.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        model.objects.filter(**key).update(**changes)
+
+
+# -----------------------------
+# Пересборка агрегатов по истории (после миграции или для починки)
+# -----------------------------
+
+@transaction.atomic
+def rebuild_report_stats(classroom_id: Optional[int] = None, chunk_size: int = 2000) -> int:
+    """
+    Пересчитать агрегаты отчётов из Submission для одного класса или для всех.
+    Возвращает количество обработанных отправок.
+    """
+    teams = Team.objects.all()
+    # Ответы без вердикта (отложенная проверка) учтёт complete_submission, когда допроверит
+    subs = Submission.objects.filter(checked_at__isnull=False) \
+        .select_related('assignment', 'assignment__task', 'assignment__team')
+    class_stats = ClassReportStat.objects.all()
+    wrong_stats = WrongAnswerStat.objects.all()
+    if classroom_id is not None:
+        teams = teams.filter(classroom_id=classroom_id)
+        subs = subs.filter(
+            models.Q(assignment__classroom_id=classroom_id) | models.Q(assignment__team__classroom_id=classroom_id)
+        )
+        class_stats = class_stats.filter(classroom_id=classroom_id)
+        wrong_stats = wrong_stats.filter(classroom_id=classroom_id)
+    team_ids = teams.values('id')
+
+    class_stats.delete()
+    wrong_stats.delete()
+    TeamLevelStat.objects.filter(team_id__in=team_ids).delete()
+    TeamLevelSolver.objects.filter(team_id__in=team_ids).delete()
+
+    processed = 0
+    chunk = []
+    for s in subs.order_by('id').iterator(chunk_size=chunk_size):
+        chunk.append(s)
+        if len(chunk) >= chunk_size:
+            record_graded(chunk)
+            processed += len(chunk)
+            chunk = []
+    if chunk:
+        record_graded(chunk)
+        processed += len(chunk)
+    return processed
@@ -1,15 +1,13 @@
 # api/report_views.py
 from __future__ import annotations
 
-import io
-import re
-from collections import Counter, defaultdict
-from datetime import timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Optional, Tuple
 
 from django.contrib.auth import get_user_model
 from django.db.models import Q, F, Sum, Count
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
@@ -17,46 +15,25 @@ from rest_framework.response import Response
 from rest_framework import status
 
 from .models import (
+    LEVEL_TAG_RE,
     Classroom, Team, Task,
-    Assignment, Submission, Score, TeamMembership
+    Assignment, Submission, Score, TeamMembership, ExportJob
 )
+from .leaderboard import leaderboard
 from .permissions import IsTeacher, IsStudent
+from .data_export import (
+    CONTENT_TYPES as DATA_CONTENT_TYPES,
+    DataExportError, build_columnar, check_format, get_dataset, iter_rows, parse_bound, stream_csv,
+)
+from .data_version import TASKS_KEY, cached_report, class_key, make_etag, not_modified, versions, with_etag
+from .export_jobs import export_jobs
+from .report_export import (
+    XLSX_CONTENT_TYPE, ExportRequest, build_report, data_watermark, human_timedelta, parse_export_request,
+)
+from .report_queries import get_report_aggregator
 
 User = get_user_model()
 
-LEVEL_TAG_RE = re.compile(r"^L(\d+)$", re.IGNORECASE)
-
-
-def _extract_level_from_tags(tags: List[str]) -> Optional[int]:
-    """Извлечь уровень из списка тегов задачи: ищем тег вида 'L{n}'."""
-    for t in tags or []:
-        m = LEVEL_TAG_RE.match(str(t).strip())
-        if m:
-            try:
-                return int(m.group(1))
-            except ValueError:
-                pass
-    return None
-
-
-def _answer_str(payload) -> str:
-    """Аккуратно вытащим ответ из answer_payload для статистики ошибок."""
-    if isinstance(payload, dict) and "answer" in payload:
-        return str(payload["answer"]).strip()
-    return str(payload).strip()
-
-
-def _human_timedelta(td: timedelta) -> str:
-    """Удобная строка для среднего времени решения."""
-    total_seconds = int(td.total_seconds())
-    mins, secs = divmod(total_seconds, 60)
-    hours, mins = divmod(mins, 60)
-    if hours:
-        return f"{hours}ч {mins}м"
-    if mins:
-        return f"{mins}м {secs}с"
-    return f"{secs}с"
-
 
 class ClassOverviewReportView(APIView):
     """
@@ -79,6 +56,16 @@ class ClassOverviewReportView(APIView):
         if classroom.teacher_id != request.user.id:
             return Response({"detail": "Доступ запрещён: вы не учитель этого класса"}, status=403)
 
+        # Пока версия данных класса та же (api/data_version.py) — 304 или ответ из кэша
+        key = class_key(classroom.id)
+        etag = make_etag("overview", classroom.id, versions([key])[key])
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return with_etag(cached, etag)
+        data = cached_report("overview", etag, lambda: self._build(classroom))
+        return with_etag(Response(data, status=200), etag)
+
+    def _build(self, classroom: Classroom) -> dict:
         # Команды и участники класса
         teams = list(Team.objects.filter(classroom=classroom).values("id", "name"))
         team_members = TeamMembership.objects.filter(team__classroom=classroom) \
@@ -86,51 +73,12 @@ class ClassOverviewReportView(APIView):
                                              .annotate(members=Count("student_id"))
         members_map = {row["team_id"]: row["members"] for row in team_members}
 
-        # Собираем submissions по заданиям, привязанным к командам этого класса
-        subs_qs = Submission.objects.select_related("assignment__task", "assignment__team") \
-            .filter(
-                Q(assignment__team__classroom=classroom) | Q(assignment__classroom=classroom)
-            )
-
-        # Прогресс по уровням: считаем верные решения по командам, группируя по уровню
-        # Для корректности учитываем только последнюю корректную отправку per student per assignment
-        correct_subs = subs_qs.filter(is_correct=True)
-
-        # Собираем (team_id, level) -> количество уникальных студентов, решивших задачи этого уровня
-        progress: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
-
-        # Вытянем все нужные поля разом, чтобы не бить БД многими запросами
-        rows = correct_subs.values(
-            "student_id",
-            "assignment__team_id",
-            "assignment__task__tags",
-        )
-
-        for r in rows:
-            team_id = r["assignment__team_id"]
-            if team_id is None:
-                # Если выдача была на класс, а не команду — прогресс по командам не считаем
-                # (можно добавить распределение по командам при желании)
-                continue
-            level = _extract_level_from_tags(r["assignment__task__tags"]) or 0
-            progress[team_id][level] += 1  # кол-во решивших (уникальность упрощённо)
-
-        # Средняя скорость решения (для правильных ответов)
-        # avg(delta = checked_at - assignment.created_at)
-        timed_rows = correct_subs.values("checked_at", "assignment__created_at")
-        total_td = timedelta(0)
-        n = 0
-        for r in timed_rows:
-            ca, ac = r["checked_at"], r["assignment__created_at"]
-            if ca and ac:
-                total_td += (ca - ac)
-                n += 1
-        avg_td = (total_td / n) if n else timedelta(0)
-
-        # Топ-ошибки: неправильные ответы (по value из payload)
-        wrong_rows = subs_qs.filter(is_correct=False).values_list("answer_payload", flat=True)
-        counter = Counter(_answer_str(p) for p in wrong_rows if p is not None)
-        top_errors = [{"value": v, "count": c} for v, c in counter.most_common(10)]
+        # Остальное считает агрегатор (api/report_queries.py): по умолчанию читаем
+        # материализованные агрегаты, REPORT_AGGREGATION='sql' — GROUP BY по Submission.
+        aggregator = get_report_aggregator()
+        progress = aggregator.team_level_progress(classroom)
+        avg_td = aggregator.avg_solve_time(classroom)
+        top_errors = aggregator.top_errors(classroom, 10)
 
         # Сформируем читабельную структуру прогресса по командам
         progress_by_team = []
@@ -150,14 +98,13 @@ class ClassOverviewReportView(APIView):
                 "levels": levels
             })
 
-        data = {
+        return {
             "classId": classroom.id,
             "className": classroom.name,
             "progressByTeam": progress_by_team,
-            "avgSolveTime": _human_timedelta(avg_td),
+            "avgSolveTime": human_timedelta(avg_td),
             "topErrors": top_errors
         }
-        return Response(data, status=200)
 
 
 class StudentReportView(APIView):
@@ -190,12 +137,27 @@ class StudentReportView(APIView):
             if request.user.role == "TEACHER" and classroom.teacher_id != request.user.id:
                 return Response({"detail": "Доступ запрещён: это не ваш класс"}, status=403)
 
+        # ETag и кэш от версий класса и банка задач (темы берутся из тегов задач).
+        # Членство ниже проверяем только при пересчёте: его изменение тоже меняет версию класса.
+        student_id = int(student_id)
+        v = versions([class_key(classroom.id), TASKS_KEY])
+        etag = make_etag("student", classroom.id, student_id, v[class_key(classroom.id)], v[TASKS_KEY])
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return with_etag(cached, etag)
+        data = cached_report("student", etag, lambda: self._build(classroom, student_id))
+        if data is None:
+            return Response({"detail": "Ученик не состоит в указанном классе"}, status=400)
+        return with_etag(Response(data, status=200), etag)
+
+    def _build(self, classroom: Classroom, student_id: int) -> Optional[dict]:
+        """Данные отчёта; None — ученик не состоит в классе."""
         # Проверим, что студент вообще относится к классу (состоит в нём напрямую или через команду)
         is_in_class = TeamMembership.objects.filter(team__classroom=classroom, student_id=student_id).exists()
         # Разрешим также, если есть ClassMembership (на случай выдач на класс)
         is_in_class = is_in_class or classroom.memberships.filter(student_id=student_id).exists()
         if not is_in_class:
-            return Response({"detail": "Ученик не состоит в указанном классе"}, status=400)
+            return None
 
         # Кол-во решённых задач (правильные submissions в рамках этого класса/его команд)
         solved_q = Submission.objects.filter(
@@ -210,22 +172,9 @@ class StudentReportView(APIView):
         score = Score.objects.filter(student_id=student_id, classroom=classroom, team__isnull=True).first()
         points = score.total_points if score else 0
 
-        # Рейтинг внутри класса: место по total_points
-        # (если у кого-то нет Score в классе — считаем 0)
-        class_scores = list(
-            Score.objects.filter(classroom=classroom, team__isnull=True)
-            .values("student_id", "total_points")
-        )
-        # Добавим текущего, если отсутствует
-        if student_id not in [r["student_id"] for r in class_scores]:
-            class_scores.append({"student_id": student_id, "total_points": points})
-        class_scores.sort(key=lambda r: r["total_points"], reverse=True)
-
-        rank = 1
-        for i, r in enumerate(class_scores, start=1):
-            if r["student_id"] == int(student_id):
-                rank = i
-                break
+        # Рейтинг внутри класса: место по total_points (api/leaderboard.py)
+        # (если у студента нет Score в классе — считаем 0)
+        rank = leaderboard.rank((classroom.id, None), student_id)
 
         # Пройденные темы: собираем теги задач, по которым были верные решения
         topics: set[str] = set()
@@ -236,15 +185,36 @@ class StudentReportView(APIView):
                     topics.add(str(t))
         topics_list = sorted(topics)
 
-        data = {
+        return {
             "classId": classroom.id,
-            "studentId": int(student_id),
+            "studentId": student_id,
             "solvedCount": solved_count,
             "points": points,
             "rank": rank,
             "topics": topics_list
         }
-        return Response(data, status=200)
+
+
+def _truthy(value) -> bool:
+    return str(value).lower() in {"1", "true", "yes"}
+
+
+def _job_payload(job: ExportJob) -> dict:
+    data = {
+        "jobId": job.id,
+        "status": job.status,
+        "scope": job.scope,
+        "classId": job.classroom_id,
+        "studentId": job.student_id,
+        "createdAt": job.created_at,
+        "finishedAt": job.finished_at,
+        "statusUrl": reverse("report_export_job", args=[job.id]),
+    }
+    if job.status == ExportJob.Status.DONE:
+        data["downloadUrl"] = reverse("report_export_download", args=[job.id])
+    if job.status == ExportJob.Status.FAILED:
+        data["error"] = job.error
+    return data
 
 
 class ReportExportView(APIView):
@@ -254,9 +224,13 @@ class ReportExportView(APIView):
       {
         "scope": "CLASS" | "STUDENT",
         "classId": 123,
-        "studentId": 7        # обязательно для scope=STUDENT
+        "studentId": 7,       # обязательно для scope=STUDENT
+        "async": true         # опционально: собрать в фоне, вернуть заявку
       }
-    Возвращает Excel (.xlsx) с листами отчётов.
+    Возвращает Excel (.xlsx) с листами отчётов; файл собирается потоково
+    (api/report_export.py) и отдаётся из временного файла. Если такой отчёт
+    по тем же данным уже собирался, отдаётся готовый файл (api/export_jobs.py).
+    С "async": true — 202 и заявка ExportJob: статус по statusUrl, файл по downloadUrl.
     Доступ:
       - для CLASS: учитель этого класса,
       - для STUDENT: сам студент или учитель класса.
@@ -264,183 +238,98 @@ class ReportExportView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        from openpyxl import Workbook
-        from openpyxl.utils import get_column_letter
+        export = parse_export_request(request.user, request.data)
 
-        scope = str(request.data.get("scope", "")).upper()
-        class_id = request.data.get("classId")
-        student_id = request.data.get("studentId")
+        if _truthy(request.data.get("async", False)):
+            job = export_jobs.submit(request.user, export)
+            return Response(_job_payload(job), status=status.HTTP_202_ACCEPTED)
 
-        if scope not in {"CLASS", "STUDENT"}:
-            return Response({"detail": "scope должен быть CLASS или STUDENT"}, status=400)
-        if not class_id:
-            return Response({"detail": "Укажите classId"}, status=400)
+        cached = export_jobs.store.get(export.artifact_key(data_watermark(export.classroom)))
+        stream = None
+        if cached:
+            try:
+                stream = open(cached, "rb")
+            except FileNotFoundError:
+                # Файл успели удалить как устаревший — собираем заново
+                pass
+        return FileResponse(
+            stream or build_report(export),
+            as_attachment=True,
+            filename=export.filename,
+            content_type=XLSX_CONTENT_TYPE,
+        )
+
+
+class ExportJobView(APIView):
+    """
+    GET /api/reports/export/jobs/{job_id} — статус фоновой заявки на отчёт.
+    Доступ: только автор заявки.
+    """
+    permission_classes = [IsAuthenticated]
 
+    def get(self, request, job_id: int):
+        job = get_object_or_404(ExportJob, id=job_id, requested_by=request.user)
+        return Response(_job_payload(job))
+
+
+class ExportJobDownloadView(APIView):
+    """
+    GET /api/reports/export/jobs/{job_id}/download — готовый .xlsx заявки.
+    409, пока отчёт собирается; 410, если файл уже заменён более свежей версией.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id: int):
+        job = get_object_or_404(ExportJob.objects.select_related("classroom"), id=job_id, requested_by=request.user)
+        if job.status != ExportJob.Status.DONE:
+            return Response({"detail": "Отчёт ещё не готов", "status": job.status}, status=409)
+        path = export_jobs.artifact(job)
         try:
-            classroom = Classroom.objects.select_related("teacher").get(id=class_id)
-        except Classroom.DoesNotExist:
-            return Response({"detail": "Класс не найден"}, status=404)
+            stream = open(path, "rb") if path else None
+        except FileNotFoundError:
+            stream = None
+        if stream is None:
+            return Response({"detail": "Файл отчёта устарел, запросите экспорт заново"}, status=410)
+        export = ExportRequest(job.scope, job.classroom, job.student_id)
+        return FileResponse(stream, as_attachment=True, filename=export.filename,
+                            content_type=XLSX_CONTENT_TYPE)
 
-        # Проверка прав
-        if scope == "CLASS":
-            if request.user.role != "TEACHER" or classroom.teacher_id != request.user.id:
-                return Response({"detail": "Доступ запрещён: это не ваш класс"}, status=403)
-        else:
-            if not student_id:
-                return Response({"detail": "Для STUDENT-отчёта нужен studentId"}, status=400)
-            student_id = int(student_id)
-            if request.user.role == "STUDENT" and request.user.id != student_id:
-                return Response({"detail": "Студент может экспортировать только свой отчёт"}, status=403)
-            if request.user.role == "TEACHER" and classroom.teacher_id != request.user.id:
-                return Response({"detail": "Доступ запрещён: это не ваш класс"}, status=403)
 
-        wb = Workbook()
-        wb.remove(wb.active)  # удалим дефолтный лист
-
-        if scope == "CLASS":
-            # ----- Лист 1: Сводка по классу -----
-            ws = wb.create_sheet("Сводка")
-            ws.append(["Класс", classroom.name])
-            # Средняя скорость
-            correct_subs = Submission.objects.filter(
-                is_correct=True
-            ).filter(
-                Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom)
-            ).values("checked_at", "assignment__created_at")
-
-            total_td = timedelta(0)
-            n = 0
-            for r in correct_subs:
-                ca, ac = r["checked_at"], r["assignment__created_at"]
-                if ca and ac:
-                    total_td += (ca - ac)
-                    n += 1
-            avg_td = (total_td / n) if n else timedelta(0)
-            ws.append(["Среднее время решения", _human_timedelta(avg_td)])
-
-            ws.append([])
-            ws.append(["ТОП ошибок", "Количество"])
-            wrong_rows = Submission.objects.filter(
-                is_correct=False
-            ).filter(
-                Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom)
-            ).values_list("answer_payload", flat=True)
-            counter = Counter(_answer_str(p) for p in wrong_rows if p is not None)
-            for value, count in counter.most_common(20):
-                ws.append([value, count])
-
-            # ----- Лист 2: Прогресс команд по уровням -----
-            ws2 = wb.create_sheet("Прогресс команд")
-            ws2.append(["Команда", "Уровень", "Решивших", "Участников", "Завершение, %"])
-
-            teams = list(Team.objects.filter(classroom=classroom).values("id", "name"))
-            members_map = {
-                row["team_id"]: row["members"]
-                for row in TeamMembership.objects.filter(team__classroom=classroom)
-                                                 .values("team_id")
-                                                 .annotate(members=Count("student_id"))
-            }
-            rows = Submission.objects.filter(
-                is_correct=True,
-                assignment__team__classroom=classroom
-            ).values("assignment__team_id", "assignment__task__tags", "student_id")
-
-            # считаем уникальные student_id на уровне (team, level)
-            seen = set()
-            counts = defaultdict(int)  # (team_id, level) -> solved
-            for r in rows:
-                team_id = r["assignment__team_id"]
-                level = _extract_level_from_tags(r["assignment__task__tags"]) or 0
-                key = (team_id, level, r["student_id"])
-                if key in seen:
-                    continue
-                seen.add(key)
-                counts[(team_id, level)] += 1
-
-            for t in teams:
-                tid = t["id"]
-                for (team_id, level), solved in sorted(counts.items()):
-                    if team_id != tid:
-                        continue
-                    members = members_map.get(tid, 0)
-                    pct = round((solved / max(1, members)) * 100, 1)
-                    ws2.append([t["name"], level, solved, members, pct])
-
-            # ----- Лист 3: Рейтинг -----
-            ws3 = wb.create_sheet("Рейтинг")
-            ws3.append(["Студент", "Очки"])
-            class_scores = Score.objects.filter(classroom=classroom, team__isnull=True) \
-                                        .select_related("student") \
-                                        .order_by("-total_points")
-            for s in class_scores:
-                ws3.append([s.student.get_username() or s.student_id, s.total_points])
-
-        else:  # scope == "STUDENT"
-            # ----- Индивидуальный отчёт -----
-            ws = wb.create_sheet("Студент")
-            stu = User.objects.filter(id=student_id).first()
-            ws.append(["Класс", classroom.name])
-            ws.append(["Студент", (stu.full_name or stu.username) if stu else student_id])
-
-            solved_q = Submission.objects.filter(
-                is_correct=True, student_id=student_id
-            ).filter(
-                Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom)
-            )
-
-            solved_count = solved_q.count()
-            score = Score.objects.filter(student_id=student_id, classroom=classroom, team__isnull=True).first()
-            points = score.total_points if score else 0
-
-            ws.append(["Решённых задач", solved_count])
-            ws.append(["Баллы", points])
-
-            # Ранг
-            class_scores = list(
-                Score.objects.filter(classroom=classroom, team__isnull=True)
-                .values("student_id", "total_points")
-            )
-            if student_id not in [r["student_id"] for r in class_scores]:
-                class_scores.append({"student_id": student_id, "total_points": points})
-            class_scores.sort(key=lambda r: r["total_points"], reverse=True)
-            rank = 1
-            for i, r in enumerate(class_scores, start=1):
-                if r["student_id"] == int(student_id):
-                    rank = i
-                    break
-            ws.append(["Позиция в рейтинге", rank])
-
-            # Темы (теги, кроме L{n})
-            topics: set[str] = set()
-            for row in solved_q.values("assignment__task__tags"):
-                for t in (row["assignment__task__tags"] or []):
-                    if not LEVEL_TAG_RE.match(str(t)):
-                        topics.add(str(t))
-            ws.append([])
-            ws.append(["Пройденные темы"])
-            for t in sorted(topics):
-                ws.append([t])
-
-            # Подробный список решённых задач
-            ws2 = wb.create_sheet("Задачи")
-            ws2.append(["Название", "Уровень", "Получено очков", "Дата проверки"])
-            for r in Submission.objects.filter(
-                is_correct=True, student_id=student_id
-            ).filter(
-                Q(assignment__classroom=classroom) | Q(assignment__team__classroom=classroom)
-            ).select_related("assignment__task").order_by("-checked_at"):
-                task = r.assignment.task
-                level = _extract_level_from_tags(task.tags) or ""
-                ws2.append([task.title, level, r.points_awarded, r.checked_at.strftime("%Y-%m-%d %H:%M") if r.checked_at else ""])
-
-        # Отдаём Excel
-        bio = io.BytesIO()
-        wb.save(bio)
-        bio.seek(0)
-        filename = f"report_{scope.lower()}_{class_id}.xlsx"
-        resp = HttpResponse(
-            bio.getvalue(),
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return resp
+class DataExportView(APIView):
+    """
+    GET /api/exports/{dataset}?classId=&since=&until=&fileFormat=csv|parquet|arrow
+    Сырые данные для аналитики (api/data_export.py): submissions | scores | assignments.
+    CSV отдаётся потоком построчно; Parquet/Arrow пишутся пакетами во временный файл
+    (нужен pyarrow). since/until — ISO-даты, until не включается.
+    Параметр называется fileFormat: format DRF занимает под выбор рендерера.
+    Доступ: учитель — только по своему классу; администратор — и без classId.
+    """
+    permission_classes = [IsAuthenticated, IsTeacher]
+
+    def get(self, request, dataset: str):
+        params = request.query_params
+        class_id = params.get("classId")
+        try:
+            ds = get_dataset(dataset)
+            fmt = check_format(params.get("fileFormat", "csv"))
+            since = parse_bound(params.get("since"), "since")
+            until = parse_bound(params.get("until"), "until")
+            class_id = int(class_id) if class_id else None
+        except (DataExportError, ValueError) as e:
+            return Response({"detail": str(e)}, status=400)
+
+        if class_id is None:
+            if not request.user.is_staff:
+                return Response({"detail": "Укажите classId"}, status=400)
+        elif not Classroom.objects.filter(id=class_id, teacher=request.user).exists() and not request.user.is_staff:
+            return Response({"detail": "Доступ запрещён: это не ваш класс"}, status=403)
+
+        rows = iter_rows(ds, class_id, since, until)
+        filename = f"{dataset}_{class_id or 'all'}.{fmt}"
+        if fmt == "csv":
+            resp = StreamingHttpResponse(stream_csv(ds, rows), content_type=DATA_CONTENT_TYPES[fmt])
+            resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return resp
+
+        return FileResponse(build_columnar(ds, rows, fmt), as_attachment=True, filename=filename,
+                            content_type=DATA_CONTENT_TYPES[fmt])
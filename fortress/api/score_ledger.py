@@ -0,0 +1,233 @@
+# api/score_ledger.py
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, models, transaction
+from django.utils import timezone
+
+from .data_version import bump_classes
+from .leaderboard import leaderboard
+from .models import Score
+
+logger = logging.getLogger(__name__)
+
+# (student_id, classroom_id, team_id) — ключ строки Score
+ScoreKey = Tuple[int, Optional[int], Optional[int]]
+
+
+# -----------------------------
+# Контексты начисления
+# -----------------------------
+
+def score_contexts(classroom_id: Optional[int], team_id: Optional[int],
+                   team_classroom_id: Optional[int] = None) -> List[Tuple[Optional[int], Optional[int]]]:
+    """
+    Куда идут очки за задание: контекст самого задания (команда и/или класс),
+    рейтинг класса (team=NULL) и глобальный рейтинг (оба NULL).
+    team_classroom_id — класс команды, если задание выдано на команду.
+    """
+    contexts = [(classroom_id, team_id)]
+    class_id = classroom_id or team_classroom_id
+    if class_id:
+        contexts.append((class_id, None))
+    contexts.append((None, None))
+    # Порядок сохраняем, повторы убираем
+    return list(dict.fromkeys(contexts))
+
+
+def assignment_score_keys(student_id: int, assignment) -> List[ScoreKey]:
+    """Ключи Score для ответа на задание (assignment загружен вместе с team)."""
+    team_classroom_id = assignment.team.classroom_id if assignment.team_id else None
+    return [(student_id, c, t) for c, t in score_contexts(assignment.classroom_id, assignment.team_id, team_classroom_id)]
+
+
+# -----------------------------
+# Начисление одним оператором
+# -----------------------------
+
+def credit_scores(deltas: Dict[ScoreKey, int]) -> List[Tuple[int, Optional[int], Optional[int], int]]:
+    """
+    Прибавить очки по ключам Score одним INSERT ... ON CONFLICT DO UPDATE
+    на все строки (SQLite ≥ 3.24, PostgreSQL). Конфликт ловится уникальным
+    индексом по (student, COALESCE(classroom, 0), COALESCE(team, 0)), поэтому
+    первая запись в контекст не гоняется с параллельной за unique-ключ.
+    Возвращает [(student_id, classroom_id, team_id, total_points)] после начисления
+    (в режиме write-behind — пустой список: запись произойдёт позже).
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+
+    if score_buffer is not None:
+        # Режим write-behind: очки копятся в памяти и пишутся пачкой (ScoreWriteBehindBuffer)
+        transaction.on_commit(lambda: score_buffer.add(deltas))
+        return []
+
+    rows = _apply(deltas)
+    # Рейтинги в памяти получают итоговые суммы после коммита (api/leaderboard.py)
+    transaction.on_commit(lambda: leaderboard.update(rows))
+    return rows
+
+
+def _apply(deltas: Dict[ScoreKey, int]):
+    if connection.vendor in ('sqlite', 'postgresql'):
+        return _upsert(deltas)
+    return _update_or_create(deltas)
+
+
+def _upsert(deltas: Dict[ScoreKey, int]):
+    table = connection.ops.quote_name(Score._meta.db_table)
+    now = timezone.now()
+    values, params = [], []
+    # Стабильный порядок ключей — одинаковый порядок блокировок строк в параллельных транзакциях
+    for (student_id, classroom_id, team_id), delta in sorted(deltas.items(), key=_sort_key):
+        values.append('(%s, %s, %s, %s, %s)')
+        params += [student_id, classroom_id, team_id, delta, now]
+
+    sql = (
+        f'INSERT INTO {table} (student_id, classroom_id, team_id, total_points, last_update) '
+        f'VALUES {", ".join(values)} '
+        f'ON CONFLICT (student_id, COALESCE(classroom_id, 0), COALESCE(team_id, 0)) '
+        f'DO UPDATE SET total_points = {table}.total_points + excluded.total_points, '
+        f'last_update = excluded.last_update'
+    )
+    if not connection.features.can_return_rows_from_bulk_insert:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        return _read_totals(deltas)
+    sql += ' RETURNING student_id, classroom_id, team_id, total_points'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [tuple(r) for r in cursor.fetchall()]
+
+
+def _update_or_create(deltas: Dict[ScoreKey, int]):
+    """Запасной путь для СУБД без ON CONFLICT: UPDATE, при отсутствии строки — INSERT."""
+    now = timezone.now()
+    for (student_id, classroom_id, team_id), delta in sorted(deltas.items(), key=_sort_key):
+        key = dict(student_id=student_id, classroom_id=classroom_id, team_id=team_id)
+        if not Score.objects.filter(**key).update(total_points=models.F('total_points') + delta, last_update=now):
+            Score.objects.create(**key, total_points=delta, last_update=now)
+    return _read_totals(deltas)
+
+
+def _read_totals(deltas: Dict[ScoreKey, int]):
+    cond = models.Q()
+    for student_id, classroom_id, team_id in deltas:
+        cond |= models.Q(student_id=student_id, classroom_id=classroom_id, team_id=team_id)
+    return list(Score.objects.filter(cond).values_list('student_id', 'classroom_id', 'team_id', 'total_points'))
+
+
+def _sort_key(item):
+    (student_id, classroom_id, team_id), _ = item
+    return student_id, classroom_id or 0, team_id or 0
+
+
+def credit_submissions(submissions) -> List[Tuple[int, Optional[int], Optional[int], int]]:
+    """Свернуть очки отправок по ключам Score и начислить одним оператором."""
+    deltas: Dict[ScoreKey, int] = defaultdict(int)
+    for s in submissions:
+        if s.points_awarded:
+            for key in assignment_score_keys(s.student_id, s.assignment):
+                deltas[key] += s.points_awarded
+    return credit_scores(deltas)
+
+
+# -----------------------------
+# Write-behind: накопление очков в памяти (горячие строки Score в битвах)
+# -----------------------------
+class ScoreWriteBehindBuffer:
+    """
+    Буфер приращений очков по ключу (student, classroom, team).
+
+    - add() вызывается после коммита отправки: Submission уже сохранён
+      вместе с points_awarded, а Score догоняет его позже;
+    - фоновый поток раз в flush_interval (или сразу, если ключей набралось
+      max_pending) сворачивает всё накопленное в один upsert — горячие
+      строки команды блокируются раз в окно, а не на каждый ответ;
+    - при остановке процесса остаток дописывается (atexit).
+
+    При падении процесса неслитые приращения теряются; Score восстанавливается
+    из Submission.points_awarded командой rebuild_scores (api/score_reconcile.py).
+    """
+
+    def __init__(self, flush_interval: float = 0.2, max_pending: int = 5000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[ScoreKey, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, deltas: Dict[ScoreKey, int]):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._pending[key] += delta
+            full = len(self._pending) >= self.max_pending
+        self._ensure_started()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def discard(self):
+        """Забыть накопленное (после полной пересборки Score)."""
+        with self._lock:
+            self._pending = defaultdict(int)
+
+    def flush(self):
+        """Записать накопленное одним upsert. При ошибке приращения возвращаются в буфер."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, defaultdict(int)
+            batch = {key: delta for key, delta in batch.items() if delta}
+            if not batch:
+                return
+            try:
+                with transaction.atomic():
+                    rows = _apply(batch)
+                    bump_classes(classroom_id for _, classroom_id, _ in batch)
+            except Exception:
+                logger.exception("Не удалось записать %d приращений очков, повторим позже", len(batch))
+                with self._lock:
+                    for key, delta in batch.items():
+                        self._pending[key] += delta
+                return
+            leaderboard.update(rows)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='score-write-behind', daemon=True)
+                thread.start()
+                atexit.register(self.flush)
+                self._thread = thread
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # У потока своё соединение с БД: не держим его дольше CONN_MAX_AGE
+                close_old_connections()
+
+
+_config = getattr(settings, 'SCORE_LEDGER', {})
+score_buffer: Optional[ScoreWriteBehindBuffer] = None
+if _config.get('MODE', 'sync') == 'write_behind':
+    score_buffer = ScoreWriteBehindBuffer(
+        flush_interval=_config.get('FLUSH_INTERVAL_MS', 200) / 1000,
+        max_pending=_config.get('MAX_PENDING', 5000),
+    )
@@ -0,0 +1,152 @@
+# api/score_reconcile.py
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .data_version import bump_classes, bump_teams
+from .leaderboard import leaderboard
+from .models import Score, Submission, Team
+from .score_ledger import ScoreKey, score_contexts
+
+ProgressCallback = Callable[[int, int, Dict[str, int]], None]
+
+
+class ReconcileScope:
+    """
+    Какие строки Score пересчитываются: все, один класс (его контекст,
+    контексты его команд; глобальный рейтинг не трогаем — он складывается
+    из всех классов) или одна команда.
+    """
+
+    def __init__(self, classroom_id: Optional[int] = None, team_id: Optional[int] = None):
+        self.classroom_id = classroom_id
+        self.team_id = team_id
+        self.team_ids = set()
+        if team_id is not None:
+            self.team_ids = {team_id}
+        elif classroom_id is not None:
+            self.team_ids = set(Team.objects.filter(classroom_id=classroom_id).values_list('id', flat=True))
+
+    def scores(self):
+        qs = Score.objects.all()
+        if self.team_id is not None:
+            return qs.filter(team_id=self.team_id)
+        if self.classroom_id is not None:
+            return qs.filter(models.Q(classroom_id=self.classroom_id) | models.Q(team_id__in=self.team_ids))
+        return qs
+
+    def submissions(self):
+        qs = Submission.objects.exclude(points_awarded=0)
+        if self.team_id is not None:
+            return qs.filter(assignment__team_id=self.team_id)
+        if self.classroom_id is not None:
+            return qs.filter(
+                models.Q(assignment__classroom_id=self.classroom_id) | models.Q(assignment__team_id__in=self.team_ids)
+            )
+        return qs
+
+    def covers(self, key: ScoreKey) -> bool:
+        _, classroom_id, team_id = key
+        if self.team_id is not None:
+            return team_id == self.team_id
+        if self.classroom_id is not None:
+            return classroom_id == self.classroom_id or team_id in self.team_ids
+        return True
+
+
+# -----------------------------
+# Сверка и починка Score по истории отправок
+# -----------------------------
+
+def reconcile_scores(classroom_id: Optional[int] = None, team_id: Optional[int] = None,
+                     chunk_size: int = 1000, dry_run: bool = False,
+                     progress: Optional[ProgressCallback] = None) -> Dict[str, int]:
+    """
+    Пересчитать Score из Submission.points_awarded и исправить расхождения.
+
+    Студенты обходятся порциями по chunk_size (id потоком через .iterator()),
+    для каждой порции — отдельная короткая транзакция: строки Score порции
+    блокируются, суммы очков считаются GROUP BY на стороне БД, отличающиеся
+    строки правятся bulk_update, недостающие — bulk_create. Памяти нужно на одну
+    порцию, таблица целиком не блокируется; начисления, пришедшие во время
+    сверки, ждут блокировки своей строки и прибавляются уже к исправленному значению.
+
+    В режиме write-behind (SCORE_LEDGER) запускать при остановленных воркерах:
+    их неслитые буферы прибавятся поверх пересчёта.
+
+    Возвращает счётчики: students, checked, updated, created.
+    """
+    scope = ReconcileScope(classroom_id, team_id)
+    stats = {'students': 0, 'checked': 0, 'updated': 0, 'created': 0}
+
+    student_ids = scope.scores().values('student_id').union(scope.submissions().values('student_id'))
+    total = student_ids.count()
+
+    for chunk in _chunks(student_ids.order_by('student_id').values_list('student_id', flat=True).iterator(chunk_size),
+                         chunk_size):
+        _reconcile_chunk(scope, chunk, chunk_size, dry_run, stats)
+        stats['students'] += len(chunk)
+        if progress:
+            progress(stats['students'], total, stats)
+
+    if not dry_run:
+        leaderboard.invalidate()
+    return stats
+
+
+@transaction.atomic
+def _reconcile_chunk(scope: ReconcileScope, student_ids: List[int], chunk_size: int, dry_run: bool,
+                     stats: Dict[str, int]):
+    existing = {
+        (s.student_id, s.classroom_id, s.team_id): s
+        for s in scope.scores().filter(student_id__in=student_ids).select_for_update()
+    }
+
+    expected: Dict[ScoreKey, int] = defaultdict(int)
+    rows = scope.submissions().filter(student_id__in=student_ids) \
+        .values('student_id', 'assignment__classroom_id', 'assignment__team_id', 'assignment__team__classroom_id') \
+        .annotate(points=models.Sum('points_awarded')) \
+        .order_by()
+    for r in rows.iterator(chunk_size):
+        for classroom_id, team_id in score_contexts(r['assignment__classroom_id'], r['assignment__team_id'],
+                                                    r['assignment__team__classroom_id']):
+            key = (r['student_id'], classroom_id, team_id)
+            if scope.covers(key):
+                expected[key] += r['points']
+
+    now = timezone.now()
+    to_update, to_create = [], []
+    for key, score in existing.items():
+        points = expected.pop(key, 0)
+        if score.total_points != points:
+            score.total_points = points
+            score.last_update = now
+            to_update.append(score)
+    for (student_id, classroom_id, team_id), points in expected.items():
+        if points:
+            to_create.append(Score(student_id=student_id, classroom_id=classroom_id, team_id=team_id,
+                                   total_points=points, last_update=now))
+
+    stats['checked'] += len(existing)
+    stats['updated'] += len(to_update)
+    stats['created'] += len(to_create)
+    if dry_run:
+        return
+    Score.objects.bulk_update(to_update, ['total_points', 'last_update'], batch_size=500)
+    Score.objects.bulk_create(to_create, batch_size=500)
+    changed = to_update + to_create
+    bump_classes(s.classroom_id for s in changed)
+    bump_teams(s.team_id for s in changed)
+
+
+def _chunks(ids: Iterator[int], size: int) -> Iterator[List[int]]:
+    chunk: List[int] = []
+    for i in ids:
+        chunk.append(i)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
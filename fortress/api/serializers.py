@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from .checkers import CheckerSpecError, compile_checker
 from .models import Classroom, ClassMembership, Team, TeamMembership, Task, Assignment, Submission, Score
 
 User = get_user_model()
@@ -77,9 +78,19 @@ class TaskSerializer(serializers.ModelSerializer):
         model = Task
         fields = (
             'id', 'title', 'body_md', 'difficulty', 'tags',
-            'max_points', 'expected_answer', 'solution_spec', 'created_at'
+            'max_points', 'expected_answer', 'solution_spec', 'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+    def validate(self, attrs):
+        # Проверщик собирается здесь же, чтобы ошибка в solution_spec не всплыла только при первом ответе
+        spec = attrs.get('solution_spec', getattr(self.instance, 'solution_spec', {}))
+        expected = attrs.get('expected_answer', getattr(self.instance, 'expected_answer', ''))
+        try:
+            compile_checker(spec, expected)
+        except CheckerSpecError as e:
+            raise serializers.ValidationError({'solution_spec': str(e)})
+        return attrs
 
 
 # -----------------------------
@@ -91,8 +102,8 @@ class AssignmentSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Assignment
-        fields = ('id', 'task', 'classroom', 'team', 'assigned_by', 'due_at', 'created_at')
-        read_only_fields = ('id', 'created_at')
+        fields = ('id', 'task', 'classroom', 'team', 'battle', 'assigned_by', 'due_at', 'created_at')
+        read_only_fields = ('id', 'battle', 'created_at')
 
     def validate(self, attrs):
         classroom = attrs.get('classroom')
@@ -106,6 +117,9 @@ class AssignmentSerializer(serializers.ModelSerializer):
 # Отправка решения
 # -----------------------------
 class SubmissionSerializer(serializers.ModelSerializer):
+    # Задачу и команду подгружаем сразу: они нужны при проверке ответа
+    assignment = serializers.PrimaryKeyRelatedField(queryset=Assignment.objects.select_related('task', 'team'))
+
     class Meta:
         model = Submission
         fields = (
@@ -116,6 +130,16 @@ class SubmissionSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'is_correct', 'feedback', 'checked_at', 'points_awarded', 'created_at')
 
 
+class SubmissionBatchItemSerializer(serializers.Serializer):
+    """
+    Элемент пакетной отправки (POST /api/submissions/batch).
+    Студент берётся из токена, задания подгружаются одним запросом во вьюхе.
+    """
+    assignment = serializers.IntegerField(min_value=1)
+    answer_payload = serializers.JSONField()
+    attempt_no = serializers.IntegerField(min_value=1, default=1)
+
+
 # -----------------------------
 # Очки
 # -----------------------------
@@ -124,3 +148,4 @@ class ScoreSerializer(serializers.ModelSerializer):
         model = Score
         fields = ('id', 'student', 'classroom', 'team', 'total_points', 'last_update')
         read_only_fields = ('id', 'total_points', 'last_update')
+
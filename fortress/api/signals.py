@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .data_version import TASKS_KEY, bump, bump_classes, bump_teams
+from .grading import checker_cache, verdict_cache
+from .models import Assignment, ClassMembership, Classroom, Task, Team, TeamMembership, User
+from .task_index import task_index
+
+
+@receiver([post_save, post_delete], sender=Task)
+def invalidate_task_index(sender, **kwargs):
+    # Индекс задач по уровням перестроится при следующем подборе;
+    # повторно сбрасываем после коммита, чтобы не закэшировать незакоммиченное состояние
+    task_index.invalidate()
+    transaction.on_commit(task_index.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Task)
+def invalidate_task_grading(sender, instance, **kwargs):
+    # Проверщик и вердикты прежней версии задачи больше не нужны
+    checker_cache.invalidate(instance.pk)
+    verdict_cache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Роль или блокировка могли измениться: claims старых токенов этому процессу больше не указ
+    user_cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+# -----------------------------
+# Версии данных (api/data_version.py): ETag и кэш отчётов
+# -----------------------------
+
+@receiver([post_save, post_delete], sender=Task)
+def bump_tasks_version(sender, **kwargs):
+    bump([TASKS_KEY])
+
+
+@receiver(post_save, sender=Classroom)
+def bump_classroom_version(sender, instance, **kwargs):
+    bump_classes([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Team)
+@receiver([post_save, post_delete], sender=ClassMembership)
+def bump_class_version(sender, instance, **kwargs):
+    bump_classes([instance.classroom_id])
+
+
+@receiver([post_save, post_delete], sender=TeamMembership)
+def bump_team_class_version(sender, instance, **kwargs):
+    bump_teams([instance.team_id])
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def bump_assignment_class_version(sender, instance, **kwargs):
+    if instance.classroom_id:
+        bump_classes([instance.classroom_id])
+    else:
+        bump_teams([instance.team_id])
@@ -0,0 +1,135 @@
+# api/submissions.py
+from datetime import timedelta
+from typing import Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .battle_state import check_accepts_answers, lock_battle, publish_graded, refresh_final_standings
+from .grading import GradeResult, verdict_cache
+from .grading_pool import grading_executor
+from .models import Assignment, Battle, Submission
+from .report_stats import record_graded
+from .score_ledger import credit_submissions
+
+PENDING_FEEDBACK = 'Ответ проверяется…'
+
+
+# -----------------------------
+# Приём ответа: общий путь для HTTP (SubmissionViewSet) и сокета битвы
+# -----------------------------
+
+def record_submission(student_id: int, assignment: Assignment, answer_payload, attempt_no: int = 1,
+                      result: Optional[GradeResult] = None, defer: bool = False) -> Submission:
+    """
+    Проверяет ответ, сохраняет Submission (сразу с вердиктом — одним INSERT),
+    начисляет очки, обновляет агрегаты отчётов и ставит обновление битвы в outbox.
+    assignment должен быть загружен вместе с task и team.
+
+    result — вердикт, уже полученный вызывающей стороной (сокет ждёт его асинхронно).
+    defer=True — дорогую проверку (api/grading_pool.py) не ждём: Submission
+    сохраняется без checked_at, вердикт допишет complete_submission()
+    (а если процесс упадёт раньше — команда regrade_pending).
+    BattleClosed — задание из битвы, которая уже не принимает ответы.
+
+    Проверка идёт до транзакции: пока она выполняется, строка битвы не заблокирована.
+    """
+    if result is None and defer:
+        # Такой ответ на эту версию задачи уже проверяли — записываем вердикт сразу
+        result = verdict_cache.get(assignment.task, answer_payload)
+    if result is None and not (defer and grading_executor.needs_pool(assignment.task)):
+        result = grading_executor.grade(assignment.task, answer_payload)
+    return _save_submission(student_id, assignment, answer_payload, attempt_no, result)
+
+
+@transaction.atomic
+def _save_submission(student_id: int, assignment: Assignment, answer_payload, attempt_no: int,
+                     result: Optional[GradeResult]) -> Submission:
+    # result=None — проверка отложена: ответ сохраняется без вердикта
+    check_accepts_answers([assignment])
+    if result is None:
+        submission = Submission.objects.create(
+            assignment=assignment,
+            student_id=student_id,
+            answer_payload=answer_payload,
+            attempt_no=attempt_no,
+            feedback=PENDING_FEEDBACK,
+        )
+        transaction.on_commit(lambda: grading_executor.defer(
+            assignment.task, answer_payload, lambda r: complete_submission(submission.id, r)
+        ))
+        return submission
+
+    submission = Submission.objects.create(
+        assignment=assignment,
+        student_id=student_id,
+        answer_payload=answer_payload,
+        attempt_no=attempt_no,
+        is_correct=result.is_correct,
+        feedback=result.feedback,
+        checked_at=timezone.now(),
+        points_awarded=result.points,
+    )
+    _apply_graded(submission)
+    return submission
+
+
+@transaction.atomic
+def complete_submission(submission_id: int, result: GradeResult) -> Optional[Submission]:
+    """Записать вердикт отложенной проверки в Submission и провести начисления."""
+    submission = Submission.objects.select_for_update() \
+        .select_related('assignment', 'assignment__task', 'assignment__team') \
+        .filter(id=submission_id, checked_at__isnull=True).first()
+    if submission is None:
+        return None
+    battle = lock_battle(submission.assignment.battle_id)
+    submission.is_correct = result.is_correct
+    submission.feedback = result.feedback
+    submission.points_awarded = result.points
+    submission.checked_at = timezone.now()
+    submission.save(update_fields=['is_correct', 'feedback', 'points_awarded', 'checked_at'])
+    if battle is not None and battle.status != Battle.Status.LIVE:
+        # Битву закрыли, пока ответ проверялся: итоговая таблица должна его учесть
+        _apply_graded(submission, publish=False)
+        refresh_final_standings(battle)
+    else:
+        _apply_graded(submission)
+    return submission
+
+
+def regrade_stale_pending(stale_after: float, limit: int = 500) -> int:
+    """
+    Допроверить отправки, застрявшие без вердикта: отложенная проверка шла в потоке
+    процесса, который упал или перезапустился, и checked_at пуст дольше stale_after секунд.
+    Проверка — в текущем потоке; вердикт пишет complete_submission (дважды не запишется).
+    Возвращает число допроверенных отправок.
+    """
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    stale = Submission.objects.filter(checked_at__isnull=True, created_at__lt=deadline) \
+        .select_related('assignment__task').order_by('id')[:limit]
+    done = 0
+    for submission in stale:
+        result = grading_executor.grade(submission.assignment.task, submission.answer_payload)
+        if complete_submission(submission.id, result) is not None:
+            done += 1
+    return done
+
+
+def _apply_graded(submission: Submission, publish: bool = True):
+    # Начисляем очки в контексте задания, класса и глобально — одним upsert (api/score_ledger.py)
+    credit_submissions([submission])
+
+    # Агрегаты для дашборда учителя (api/report_stats.py)
+    record_graded([submission])
+
+    # Живой счёт битвы и рассылка участникам — после коммита (api/battle_state.py)
+    if publish:
+        publish_graded([submission])
+
+
+def load_assignment(assignment_id: int) -> Assignment:
+    """
+    Задание вместе с задачей и командой (для сокета).
+    Бросает Assignment.DoesNotExist, если задания нет.
+    """
+    return Assignment.objects.select_related('task', 'team').get(id=assignment_id)
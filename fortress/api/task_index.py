@@ -0,0 +1,72 @@
+# api/task_index.py
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .models import Task, levels_from_tags
+
+# Порядок соседних уровней, если задач точного уровня нет
+LEVEL_FALLBACK_DELTAS = (0, 1, -1, 2, -2, 3, -3)
+
+
+class TaskLevelIndex:
+    """
+    Внутрипроцессный индекс «уровень → самая свежая задача» для подбора задач в битве.
+    Задача с несколькими тегами уровня (['L2', 'L3']) попадает в индекс на каждом из них,
+    как и при прежнем подборе по tags__contains. Строится одним запросом и сбрасывается сигналами
+    при сохранении/удалении Task (api/signals.py). TTL страхует от изменений,
+    сделанных другими процессами.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_level: Optional[Dict[int, int]] = None
+        self._by_difficulty: Dict[str, int] = {}
+        self._built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._by_level = None
+
+    def pick(self, level: int) -> Optional[int]:
+        """
+        id задачи для уровня: L{level}, затем соседние уровни в радиусе 3,
+        иначе — по сложности (чем выше уровень, тем сложнее).
+        """
+        by_level, by_difficulty = self._snapshot()
+        for delta in LEVEL_FALLBACK_DELTAS:
+            task_id = by_level.get(level + delta)
+            if task_id:
+                return task_id
+
+        if level <= 2:
+            diff = 'EASY'
+        elif level <= 5:
+            diff = 'MEDIUM'
+        else:
+            diff = 'HARD'
+        return by_difficulty.get(diff)
+
+    def _snapshot(self):
+        with self._lock:
+            if self._by_level is None or time.monotonic() - self._built_at > self.ttl:
+                self._build()
+            return self._by_level, self._by_difficulty
+
+    def _build(self):
+        by_level: Dict[int, int] = {}
+        by_difficulty: Dict[str, int] = {}
+        # Сначала самые свежие: первая встреченная задача уровня/сложности и есть нужная
+        rows = Task.objects.order_by('-created_at', '-id').values_list('id', 'tags', 'difficulty')
+        for task_id, tags, difficulty in rows:
+            for level in levels_from_tags(tags):
+                by_level.setdefault(level, task_id)
+            by_difficulty.setdefault(difficulty, task_id)
+        self._by_level, self._by_difficulty = by_level, by_difficulty
+        self._built_at = time.monotonic()
+
+
+task_index = TaskLevelIndex(ttl=getattr(settings, 'TASK_INDEX_TTL', 60.0))
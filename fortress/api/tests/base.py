@@ -0,0 +1,88 @@
+# api/tests/base.py
+"""Общие данные тестов api и сброс состояния, которое процесс держит в памяти."""
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import ClaimsRefreshToken, user_cache
+from api.battle_state import live_battles
+from api.grading import checker_cache, verdict_cache
+from api.leaderboard import leaderboard
+from api.metrics import metrics
+from api.models import Assignment, ClassMembership, Classroom, Task, Team, TeamMembership, User
+from api.task_index import task_index
+
+PASSWORD = 'correct-horse-1'
+
+# Стойкий хэш паролей в тестах только тратит время
+fast_passwords = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+
+def access_token(user) -> str:
+    """Access-токен, как его выдаёт auth/token/ (с claims пользователя)."""
+    return str(ClaimsRefreshToken.for_user(user).access_token)
+
+
+def reset_process_state():
+    """БД между тестами откатывается, а кэши и реестры процесса — нет: чистим их сами."""
+    cache.clear()
+    user_cache.clear()
+    live_battles.clear()
+    checker_cache.clear()
+    verdict_cache.clear()
+    leaderboard.invalidate()
+    task_index.invalidate()
+    metrics.reset()
+
+
+class FortressFixture:
+    """Учитель, его класс, команда из трёх учеников и задачи уровней L1–L3 с ответом 42."""
+
+    @classmethod
+    def create_fixture(cls):
+        cls.teacher = User.objects.create_user('teacher', password=PASSWORD, role=User.Role.TEACHER)
+        cls.students = [
+            User.objects.create_user(f'student{i}', password=PASSWORD, role=User.Role.STUDENT) for i in range(3)
+        ]
+        cls.classroom = Classroom.objects.create(name='7А', teacher=cls.teacher, code='SEVEN-A')
+        cls.team = Team.objects.create(classroom=cls.classroom, name='Альфа')
+        for student in cls.students:
+            ClassMembership.objects.create(classroom=cls.classroom, student=student)
+            TeamMembership.objects.create(team=cls.team, student=student)
+        cls.tasks = [
+            Task.objects.create(title=f'Задача L{n}', body_md='6 × 7 = ?', tags=[f'L{n}'], expected_answer='42')
+            for n in (1, 2, 3)
+        ]
+
+    def client_for(self, user) -> APIClient:
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def assign(self, task=None, **fields) -> Assignment:
+        """Выдача задачи команде (по умолчанию — первой задачи команде self.team)."""
+        if 'classroom' not in fields:
+            fields.setdefault('team', self.team)
+        return Assignment.objects.create(task=task or self.tasks[0], assigned_by=self.teacher, **fields)
+
+
+@fast_passwords
+class FortressTestCase(FortressFixture, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_fixture()
+
+    def setUp(self):
+        reset_process_state()
+
+
+@fast_passwords
+class FortressTransactionTestCase(FortressFixture, TransactionTestCase):
+    """
+    Для кода, который читает БД из других потоков (сокеты, фоновые проверки):
+    данные коммитятся по-настоящему, после теста таблицы очищаются.
+    """
+
+    def setUp(self):
+        reset_process_state()
+        self.create_fixture()
@@ -0,0 +1,117 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from api.authentication import UserCache, get_token_user, user_cache, user_from_claims
+from api.models import User
+
+from .base import PASSWORD, FortressTestCase, access_token
+
+USER_TABLE = User._meta.db_table
+
+
+class ClaimsAuthenticationTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = self.students[0]
+
+    def get_tasks(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/')
+        user_queries = [q['sql'] for q in queries.captured_queries if f'"{USER_TABLE}"' in q['sql']]
+        return response, user_queries
+
+    def test_login_issues_tokens_with_claims(self):
+        response = self.client.post('/api/auth/token/', {'username': 'teacher', 'password': PASSWORD}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['role'], access['username'], access['is_staff']), ('TEACHER', 'teacher', False))
+
+    def test_request_with_claims_skips_user_select(self):
+        response, user_queries = self.get_tasks(access_token(self.teacher))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(user_queries, [])
+
+    def test_user_built_from_claims(self):
+        user = user_from_claims(AccessToken(access_token(self.student)))
+
+        self.assertEqual((user.id, user.username, user.role, user.is_active),
+                         (self.student.id, 'student0', 'STUDENT', True))
+        self.assertIn('full_name', user.get_deferred_fields())
+        with self.assertNumQueries(1):  # отложенное поле догружается по требованию
+            self.assertEqual(user.full_name, '')
+
+    def test_role_change_is_read_from_db_and_cached(self):
+        token = access_token(self.student)
+        self.student.role = User.Role.TEACHER
+        self.student.save()
+
+        response, user_queries = self.get_tasks(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(user_queries), 1)
+        self.assertEqual(get_token_user(AccessToken(token)).role, User.Role.TEACHER)
+
+        _, user_queries = self.get_tasks(token)
+        self.assertEqual(user_queries, [])  # второй раз — из user_cache
+
+    def test_blocked_user_is_rejected(self):
+        token = access_token(self.student)
+        self.student.is_active = False
+        self.student.save()
+
+        response, _ = self.get_tasks(token)
+        self.assertEqual(response.status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        token = access_token(self.student)
+        self.student.delete()
+
+        response, _ = self.get_tasks(token)
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_without_claims_falls_back_to_db(self):
+        token = str(RefreshToken.for_user(self.teacher).access_token)
+
+        response, user_queries = self.get_tasks(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(user_queries), 1)
+        self.assertEqual(self.get_tasks(token)[1], [])
+
+    def test_refresh_rereads_claims(self):
+        tokens = self.client.post('/api/auth/token/', {'username': 'student0', 'password': PASSWORD},
+                                  format='json').data
+        User.objects.filter(id=self.student.id).update(role=User.Role.TEACHER)
+
+        response = self.client.post('/api/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['role'], User.Role.TEACHER)
+
+    def test_user_save_invalidates_cache(self):
+        user_cache.put(self.student)
+        self.student.full_name = 'Иван'
+        self.student.save()
+        self.assertIsNone(user_cache.get(self.student.id))
+
+
+class UserCacheTests(FortressTestCase):
+    def test_copies_and_disabled_cache(self):
+        cache = UserCache(ttl=30)
+        cache.put(self.teacher)
+        cached = cache.get(self.teacher.id)
+        self.assertEqual(cached.username, 'teacher')
+        self.assertIsNot(cached, cache.get(self.teacher.id))
+
+        disabled = UserCache(ttl=0)
+        disabled.put(self.teacher)
+        self.assertIsNone(disabled.get(self.teacher.id))
+
+    def test_changed_since(self):
+        cache = UserCache()
+        self.assertFalse(cache.changed_since(self.teacher.id, 0))
+        cache.invalidate(self.teacher.id)
+        self.assertTrue(cache.changed_since(self.teacher.id, 0))
+        self.assertFalse(cache.changed_since(self.teacher.id, 2 ** 40))
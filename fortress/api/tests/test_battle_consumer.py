@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+
+from api.models import Battle, Score, Submission, Team
+from battles.consumers import BattleConsumer
+from fortress.routing import application
+
+from .base import FortressTransactionTestCase, access_token
+
+
+class BufferedConsumer(BattleConsumer):
+    """Consumer без сокета: отправленные кадры копятся в sent."""
+    flush_interval = 0.01
+    max_buffer = 3
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self._buffer = OrderedDict()
+        self._seq = itertools.count()
+        self._dropped = 0
+        self._flush_task = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.sent.append(json.loads(text_data))
+
+
+class SocketBufferTests(SimpleTestCase):
+    def run_pushes(self, frames):
+        consumer = BufferedConsumer()
+
+        async def scenario():
+            for key, message in frames:
+                consumer._push(key, json.dumps(message))
+            await consumer._flush_task
+
+        asyncio.run(scenario())
+        return consumer.sent
+
+    def test_single_frame_is_sent_as_update(self):
+        self.assertEqual(self.run_pushes([(None, {'n': 1})]), [{'type': 'battle.update', 'message': {'n': 1}}])
+
+    def test_frames_of_one_window_go_out_as_one_batch(self):
+        sent = self.run_pushes([(None, {'n': 1}), ('standing:1', {'p': 1}), ('standing:1', {'p': 2})])
+        self.assertEqual(sent, [{
+            'type': 'battle_batch', 'dropped': 0,
+            'messages': [{'n': 1}, {'p': 2}],
+        }])
+
+    def test_overflow_drops_oldest_frames_and_reports_it(self):
+        sent = self.run_pushes([(None, {'n': i}) for i in range(5)])
+        self.assertEqual(sent, [{
+            'type': 'battle_batch', 'dropped': 2,
+            'messages': [{'n': 2}, {'n': 3}, {'n': 4}],
+        }])
+
+    def test_group_frames_event_is_buffered(self):
+        consumer = BufferedConsumer()
+
+        async def scenario():
+            await consumer.battle_frames({'frames': [[None, '{"a": 1}'], ['k', '{"b": 2}']]})
+            await consumer._flush_task
+
+        asyncio.run(scenario())
+        self.assertEqual(consumer.sent, [{'type': 'battle_batch', 'dropped': 0, 'messages': [{'a': 1}, {'b': 2}]}])
+
+
+class SocketSubmitAnswerTests(FortressTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.battle = Battle.objects.create(team=self.team, started_by=self.teacher)
+        self.assignment = self.assign(battle=self.battle)
+
+    def exchange(self, user, *messages):
+        """Подключиться к битве, отправить сообщения и вернуть ответ на каждое."""
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/battle/{self.battle.id}/?token={access_token(user)}'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_json_from()  # connection_success
+            await communicator.receive_json_from()  # battle_snapshot
+            replies = []
+            for message in messages:
+                await communicator.send_to(text_data=message if isinstance(message, str) else json.dumps(message))
+                replies.append(await communicator.receive_json_from(timeout=5))
+            await communicator.disconnect()
+            return replies
+
+        return async_to_sync(scenario)()
+
+    def test_answer_is_graded_and_recorded(self):
+        student = self.students[0]
+        [reply] = self.exchange(student, {
+            'action': 'submit_answer', 'assignment': self.assignment.id, 'answer': '42', 'requestId': 'r1',
+        })
+        self.assertEqual(reply['type'], 'answer_result')
+        self.assertEqual(reply['requestId'], 'r1')
+        self.assertTrue(reply['is_correct'])
+        submission = Submission.objects.get(id=reply['submissionId'])
+        self.assertEqual((submission.student_id, submission.points_awarded), (student.id, reply['points']))
+        self.assertEqual(
+            Score.objects.get(student=student, classroom=None, team=None).total_points, reply['points']
+        )
+
+    def test_rejected_messages_get_errors(self):
+        other_battle = Battle.objects.create(
+            team=Team.objects.create(classroom=self.classroom, name='Бета'), started_by=self.teacher
+        )
+        foreign = self.assign(team=other_battle.team, battle=other_battle)
+        replies = self.exchange(
+            self.students[0],
+            'not json',
+            {'action': 'submit_answer', 'answer': '42'},
+            {'action': 'submit_answer', 'assignment': 999999, 'answer': '42'},
+            {'action': 'submit_answer', 'assignment': foreign.id, 'answer': '42'},
+        )
+        self.assertEqual([r['type'] for r in replies], ['error'] * 4)
+        self.assertEqual(
+            [r['message'] for r in replies],
+            ['Некорректный JSON', 'Требуется assignment', 'Задание не найдено', 'Задание не из этой битвы'],
+        )
+        self.assertFalse(Submission.objects.exists())
+
+    def test_teacher_cannot_submit(self):
+        [reply] = self.exchange(self.teacher, {
+            'action': 'submit_answer', 'assignment': self.assignment.id, 'answer': '42',
+        })
+        self.assertEqual(reply['type'], 'error')
+        self.assertFalse(Submission.objects.exists())
@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Assignment, Battle, Score, Team, TeamMembership, User
+from api.task_index import task_index
+
+from .base import PASSWORD, FortressTestCase
+
+LAUNCH_URL = '/api/battles/launch'
+
+
+class BattleLaunchTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.teacher)
+
+    def launch(self, body):
+        return self.client.post(LAUNCH_URL, body, format='json')
+
+    def add_team(self, name, size):
+        team = Team.objects.create(classroom=self.classroom, name=name)
+        for i in range(size):
+            student = User.objects.create_user(f'{name}{i}', password=PASSWORD, role=User.Role.STUDENT)
+            TeamMembership.objects.create(team=team, student=student)
+        return team
+
+    def test_team_launch_assigns_a_task_per_member_by_level(self):
+        s0, s1, s2 = self.students
+        Score.objects.create(student=s1, team=self.team, total_points=120)            # L2 по команде
+        Score.objects.create(student=s2, classroom=self.classroom, total_points=250)  # L3 по классу
+        Score.objects.create(student=s2, total_points=999)                            # глобальный не важнее
+
+        response = self.launch({'teamId': self.team.id})
+
+        self.assertEqual(response.status_code, 201)
+        battle = Battle.objects.get(team=self.team)
+        self.assertEqual(response.data['battles'], {self.team.id: battle.id})
+        tasks = dict(Assignment.objects.filter(battle=battle).values_list('id', 'task_id'))
+        self.assertEqual(sorted(tasks), sorted(response.data['assignments']))
+        self.assertEqual(sorted(tasks.values()), sorted([self.tasks[0].id, self.tasks[1].id, self.tasks[2].id]))
+
+    def test_class_launch_skips_empty_teams(self):
+        other = self.add_team('beta', 2)
+        empty = Team.objects.create(classroom=self.classroom, name='Пустая')
+
+        response = self.launch({'classId': self.classroom.id})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data['battles']), {self.team.id, other.id})
+        self.assertEqual({k: len(v) for k, v in response.data['teams'].items()}, {self.team.id: 3, other.id: 2})
+        self.assertFalse(Battle.objects.filter(team=empty).exists())
+
+    def test_query_count_does_not_depend_on_team_count(self):
+        task_index.pick(1)  # индекс задач строится один раз на процесс
+        with CaptureQueriesContext(connection) as one_team:
+            self.assertEqual(self.launch({'teamIds': [self.team.id]}).status_code, 201)
+        teams = [self.add_team(f'team{i}', 4) for i in range(4)]
+        with CaptureQueriesContext(connection) as many_teams:
+            self.assertEqual(self.launch({'teamIds': [t.id for t in teams]}).status_code, 201)
+        self.assertEqual(len(many_teams), len(one_team))
+
+    def test_missing_teams_reject_the_launch(self):
+        response = self.launch({'teamIds': [self.team.id, 999999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['teamIds'], [999999])
+        self.assertFalse(Battle.objects.exists())
+
+    def test_malformed_ids_are_bad_requests(self):
+        for body in ({'teamIds': ['abc']}, {'teamIds': [None]}, {'teamIds': str(self.team.id)},
+                     {'teamId': 'x'}, {'classId': [1]}, {}):
+            with self.subTest(body=body):
+                self.assertEqual(self.launch(body).status_code, 400)
+        self.assertFalse(Battle.objects.exists())
+
+    def test_only_the_class_teacher_can_launch(self):
+        stranger = User.objects.create_user('stranger', password=PASSWORD, role=User.Role.TEACHER)
+        response = self.client_for(stranger).post(LAUNCH_URL, {'teamId': self.team.id}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client_for(self.students[0]).post(LAUNCH_URL, {'teamId': self.team.id}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Battle.objects.exists())
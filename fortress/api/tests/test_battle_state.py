@@ -0,0 +1,202 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.utils import timezone
+
+from api.battle_state import (
+    BattleClosed, BattleStateError, LiveBattle, close_battle, live_battles, publish_graded,
+)
+from api.broadcast import battle_group
+from api.grading import GradeResult
+from api.models import Battle, Submission, Task, User
+from api.submissions import PENDING_FEEDBACK, complete_submission, record_submission
+
+from .base import PASSWORD, FortressTestCase
+
+
+class LiveBattleOrderTests(FortressTestCase):
+    def test_ordering_and_tie_breaks(self):
+        s0, s1, s2 = (s.id for s in self.students)
+        now = timezone.now()
+        live = LiveBattle(Battle(id=1, team=self.team, status=Battle.Status.LIVE), [s0, s1, s2], [])
+
+        live.apply(s1, 10, True, now)
+        live.apply(s0, 10, True, now + timedelta(seconds=1))  # столько же, но позже
+        live.apply(s2, 0, False, now)
+
+        self.assertEqual([r['student_id'] for r in live.standings()], [s1, s0, s2])
+        self.assertEqual(live.row(s2), {'rank': 3, 'student_id': s2, 'points': 0, 'correct': 0, 'attempts': 1})
+        self.assertEqual(live.version, 3)
+
+        live.apply(s2, 15, True, now)
+        self.assertEqual(live.rank(s2), 1)
+        self.assertEqual(live.delta(s2)['version'], 4)
+
+    def test_loaded_answers_are_not_applied_again(self):
+        s0 = self.students[0].id
+        now = timezone.now()
+        live = LiveBattle(Battle(id=1, team=self.team, status=Battle.Status.LIVE), [s0], [(7, s0, 10, True, now)])
+
+        self.assertFalse(live.apply(s0, 10, True, now, submission_id=7))
+        self.assertTrue(live.apply(s0, 5, True, now, submission_id=8))
+        self.assertEqual(live.row(s0), {'rank': 1, 'student_id': s0, 'points': 15, 'correct': 2, 'attempts': 2})
+        self.assertEqual(live.version, 1)
+
+
+class BattleLifecycleTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.battle = Battle.objects.create(team=self.team, started_by=self.teacher)
+        self.assignment = self.assign(battle=self.battle)
+        self.teacher_client = self.client_for(self.teacher)
+        self.frames = []
+        patcher = mock.patch('api.battle_state.broadcaster.enqueue',
+                             side_effect=lambda group, items: self.frames.append((group, items)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def answer(self, student, answer):
+        with self.captureOnCommitCallbacks(execute=True):
+            return record_submission(student.id, self.assignment, {'answer': answer})
+
+    def test_snapshot_then_deltas(self):
+        s0, s1, _ = self.students
+        self.answer(s0, '41')
+        snapshot = live_battles.snapshot(self.battle)
+        self.assertEqual((snapshot['type'], snapshot['status'], snapshot['version']),
+                         ('battle_snapshot', Battle.Status.LIVE, 0))
+        self.assertEqual(len(snapshot['standings']), 3)  # вся команда, даже без ответов
+
+        self.answer(s1, '42')
+
+        group, items = self.frames[-1]
+        self.assertEqual(group, battle_group(self.battle.id))
+        key, delta = items[-1]
+        self.assertEqual(key, f'standing:{s1.id}')
+        self.assertEqual((delta['type'], delta['rank'], delta['correct']), ('battle_standing', 1, 1))
+        self.assertGreater(delta['version'], snapshot['version'])
+        self.assertEqual(live_battles.snapshot(self.battle)['standings'][0]['student_id'], s1.id)
+
+    def test_delta_after_reload_is_not_counted_twice(self):
+        student = self.students[0]
+        live_battles.snapshot(self.battle)
+        with self.captureOnCommitCallbacks() as callbacks:
+            submission = record_submission(student.id, self.assignment, {'answer': '42'})
+        # До отправки дельты другой запрос перечитал битву из БД — ответ в ней уже есть
+        live_battles.discard(self.battle.id)
+        live_battles.snapshot(self.battle)
+        for callback in callbacks:
+            callback()
+
+        row = live_battles.snapshot(self.battle)['standings'][0]
+        self.assertEqual((row['student_id'], row['points'], row['attempts']),
+                         (student.id, submission.points_awarded, 1))
+
+    def test_finish_persists_final_standings(self):
+        s0, s1, s2 = self.students
+        self.answer(s1, '42')
+        self.answer(s0, '41')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.teacher_client.post(f'/api/battles/{self.battle.id}/finish')
+
+        self.assertEqual(response.status_code, 200)
+        self.battle.refresh_from_db()
+        self.assertEqual(self.battle.status, Battle.Status.FINISHED)
+        self.assertIsNotNone(self.battle.finished_at)
+        self.assertEqual([r['student_id'] for r in self.battle.standings], [s1.id, s0.id, s2.id])
+        self.assertEqual(self.battle.standings, response.data['standings'])
+        self.assertEqual(self.frames[-1][1][0][1]['type'], 'battle_closed')
+
+        detail = self.teacher_client.get(f'/api/battles/{self.battle.id}')
+        self.assertEqual((detail.data['status'], detail.data['standings']),
+                         (Battle.Status.FINISHED, self.battle.standings))
+
+    def test_answer_graded_after_close_updates_final_standings(self):
+        student = self.students[0]
+        pending = Submission.objects.create(assignment=self.assignment, student=student,
+                                            answer_payload={'answer': '42'}, feedback=PENDING_FEEDBACK)
+        with self.captureOnCommitCallbacks(execute=True):
+            close_battle(self.battle.id, Battle.Status.FINISHED)
+        self.battle.refresh_from_db()
+        self.assertEqual(self.battle.standings[0]['points'], 0)
+        self.frames.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            complete_submission(pending.id, GradeResult(True, 'Верно!', 10))
+
+        self.battle.refresh_from_db()
+        self.assertEqual(self.battle.standings[0], {
+            'rank': 1, 'student_id': student.id, 'points': 10, 'correct': 1, 'attempts': 1,
+        })
+        # Ни события ответа, ни дельты — только итог заново
+        [(_, items)] = self.frames
+        self.assertEqual(items, [('status', {'type': 'battle_closed', 'battle': self.battle.id,
+                                             'status': Battle.Status.FINISHED,
+                                             'standings': self.battle.standings})])
+
+    def test_closed_battle_gets_no_deltas(self):
+        submission = self.answer(self.students[0], '42')
+        with self.captureOnCommitCallbacks(execute=True):
+            close_battle(self.battle.id, Battle.Status.FINISHED)
+        self.frames.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_graded([submission])
+
+        self.assertEqual(self.frames, [])
+
+    def test_closed_battle_cannot_be_closed_again(self):
+        self.assertEqual(self.teacher_client.post(f'/api/battles/{self.battle.id}/cancel').status_code, 200)
+        self.assertEqual(self.teacher_client.post(f'/api/battles/{self.battle.id}/finish').status_code, 409)
+        with self.assertRaises(BattleStateError):
+            close_battle(self.battle.id, Battle.Status.CANCELLED)
+
+    def test_only_the_class_teacher_closes(self):
+        stranger = User.objects.create_user('stranger', password=PASSWORD, role=User.Role.TEACHER)
+        url = f'/api/battles/{self.battle.id}/finish'
+        self.assertEqual(self.client_for(stranger).post(url).status_code, 403)
+        self.assertEqual(self.client_for(self.students[0]).post(url).status_code, 403)
+        self.assertEqual(self.teacher_client.post('/api/battles/999999/finish').status_code, 404)
+
+    def test_answers_after_close_are_rejected(self):
+        close_battle(self.battle.id, Battle.Status.FINISHED)
+
+        response = self.client_for(self.students[0]).post('/api/submissions/', {
+            'assignment': self.assignment.id, 'student': self.students[0].id, 'answer_payload': {'answer': '42'},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'].code, 'battle_closed')
+        self.assertFalse(self.assignment.submissions.exists())
+
+    def test_db_status_wins_over_stale_registry(self):
+        live_battles.snapshot(self.battle)  # битва загружена в память как LIVE
+        Battle.objects.filter(id=self.battle.id).update(status=Battle.Status.FINISHED)  # закрыл другой процесс
+
+        with self.assertRaises(BattleClosed):
+            record_submission(self.students[0].id, self.assignment, {'answer': '42'})
+
+    def test_expired_battle_rejects_answers(self):
+        Battle.objects.filter(id=self.battle.id).update(ends_at=timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(BattleClosed):
+            record_submission(self.students[0].id, self.assignment, {'answer': '42'})
+
+
+class BattleLaunchConflictTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.teacher)
+
+    def test_running_battle_blocks_a_second_launch(self):
+        battle = Battle.objects.create(team=self.team, started_by=self.teacher)
+        response = self.client.post('/api/battles/launch', {'teamId': self.team.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['battles'], {self.team.id: battle.id})
+        self.assertEqual(Battle.objects.count(), 1)
+
+    def test_no_tasks_leaves_no_battle(self):
+        Task.objects.all().delete()
+        response = self.client.post('/api/battles/launch', {'teamId': self.team.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Battle.objects.exists())
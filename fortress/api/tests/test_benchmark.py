@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TransactionTestCase
+
+from api.benchmark import BattleBenchmark, LatencyStats, compare, percentile
+from api.models import Battle, Submission
+
+from .base import reset_process_state
+
+
+class StatsTests(SimpleTestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_latency_summary(self):
+        stats = LatencyStats()
+        for ms, queries in ((10, 4), (20, 6), (30, 8)):
+            stats.add(ms / 1000, queries)
+        stats.add(5, ok=False)
+        stats.wall = 1.5
+
+        summary = stats.summary()
+
+        self.assertEqual((summary['count'], summary['errors']), (3, 1))
+        self.assertEqual(summary['throughput_rps'], 2.0)
+        self.assertEqual((summary['p50_ms'], summary['p99_ms'], summary['max_ms']), (20.0, 30.0, 30.0))
+        self.assertEqual((summary['queries_avg'], summary['queries_max']), (6.0, 8))
+
+    def test_compare_with_baseline(self):
+        baseline = {'scenarios': {'http_submit': {'p95_ms': 10.0, 'queries_avg': 0}, 'gone': {'p95_ms': 1}},
+                    'fanout': {'p50_ms': 100.0}}
+        current = {'scenarios': {'http_submit': {'p95_ms': 12.5, 'queries_avg': 3}, 'new': {'p95_ms': 1}},
+                   'fanout': {'p50_ms': 50.0}}
+
+        rows = {(r['scenario'], r['metric']): r['change_pct'] for r in compare(baseline, current)}
+
+        self.assertEqual(rows, {
+            ('http_submit', 'p95_ms'): 25.0,
+            ('http_submit', 'queries_avg'): None,  # от нуля процент не считается
+            ('fanout', 'p50_ms'): -50.0,
+        })
+
+
+class BattleBenchmarkRunTests(TransactionTestCase):
+    """
+    Маленький прогон целиком: HTTP и сокеты ходят в БД из своих потоков — нужны настоящие коммиты.
+    concurrency=1: тестовая SQLite в памяти не ждёт блокировку, а падает с «table is locked»
+    (параллельных писателей выдерживает файл с WAL из bench_environment).
+    """
+
+    def setUp(self):
+        reset_process_state()
+
+    def test_small_run(self):
+        bench = BattleBenchmark(classes=1, teams_per_class=2, students_per_team=2, tasks_per_level=1,
+                                rounds=1, ws_rounds=1, dashboard_requests=2, concurrency=1, wrong_ratio=0.5)
+
+        result = bench.run()
+
+        scenarios = result['scenarios']
+        for name in ('battle_launch', 'http_submit', 'ws_submit', 'dashboard_overview', 'dashboard_student',
+                     'dashboard_leaderboard', 'dashboard_battle', 'battle_finish'):
+            with self.subTest(scenario=name):
+                self.assertEqual(scenarios[name]['errors'], 0)
+                self.assertGreater(scenarios[name]['count'], 0)
+        self.assertEqual(scenarios['http_submit']['count'], 4)
+        self.assertEqual(scenarios['ws_submit']['count'], 4)
+        self.assertIn('queries_avg', scenarios['http_submit'])
+        self.assertIn('queries_avg', scenarios['ws_submit'])
+        self.assertGreater(result['fanout']['count'], 0)
+        self.assertEqual(Submission.objects.count(), 8)
+        self.assertFalse(Battle.objects.filter(status=Battle.Status.LIVE).exists())
+        json.dumps(result)  # базовую линию можно сохранить как есть
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def result(self, p95):
+        stats = LatencyStats()
+        stats.add(p95 / 1000, 5)
+        stats.wall = 1.0
+        fanout = LatencyStats().summary()
+        fanout.pop('throughput_rps')
+        return {'meta': {}, 'params': {}, 'seed_seconds': 0.1, 'scenarios': {'http_submit': stats.summary()},
+                'fanout': fanout, 'endpoints': {}}
+
+    def run_command(self, result, *args):
+        out = StringIO()
+        with mock.patch('api.management.commands.benchmark.bench_environment') as env, \
+                mock.patch.object(BattleBenchmark, 'run', return_value=result):
+            env.return_value.__enter__.return_value = 'bench.sqlite3'
+            call_command('benchmark', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_saves_baseline_and_compares(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            self.assertIn('http_submit', self.run_command(self.result(10), '-o', path))
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['scenarios']['http_submit']['p95_ms'], 10.0)
+
+            output = self.run_command(self.result(15), '--compare', path)
+
+        self.assertRegex(output, r'http_submit\s+p95_ms\s+10\.0\s+15\.0\s+\+50\.0')
+
+    def test_unreadable_baseline(self):
+        with self.assertRaises(CommandError):
+            self.run_command(self.result(10), '--compare', '/nonexistent/baseline.json')
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+
+from api.broadcast import BattleBroadcaster, battle_group
+
+
+class CoalesceTests(SimpleTestCase):
+    def test_keeps_events_and_only_latest_state_per_key(self):
+        messages = [
+            (None, {'n': 1}),
+            ('standing:5', {'points': 10}),
+            (None, {'n': 2}),
+            ('standing:5', {'points': 20}),
+            ('standing:6', {'points': 5}),
+        ]
+        self.assertEqual(BattleBroadcaster._coalesce(messages), [
+            (None, {'n': 1}),
+            (None, {'n': 2}),
+            ('standing:5', {'points': 20}),
+            ('standing:6', {'points': 5}),
+        ])
+
+    def test_event_carries_serialized_frames(self):
+        event = BattleBroadcaster._make_event([(None, {'a': 1}), ('k', {'b': 'ё'})])
+        self.assertEqual(event['type'], 'battle.frames')
+        self.assertEqual([key for key, _ in event['frames']], [None, 'k'])
+        self.assertEqual([json.loads(frame) for _, frame in event['frames']], [{'a': 1}, {'b': 'ё'}])
+
+
+class PublishOnCommitTests(TestCase):
+    def setUp(self):
+        self.broadcaster = BattleBroadcaster(flush_interval=0.01)
+        self.enqueued = []
+        self.broadcaster.enqueue = lambda group, messages: self.enqueued.append((group, messages))
+
+    def test_publish_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.broadcaster.publish(3, {'x': 1}, key='status')
+            self.broadcaster.publish_many(3, [{'y': 1}, {'y': 2}])
+            self.assertEqual(self.enqueued, [])
+        self.assertEqual(self.enqueued, [
+            (battle_group(3), [('status', {'x': 1})]),
+            (battle_group(3), [(None, {'y': 1}), (None, {'y': 2})]),
+        ])
+
+    def test_rolled_back_transaction_publishes_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.broadcaster.publish(3, {'x': 1})
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.enqueued, [])
+
+
+class DispatchTests(SimpleTestCase):
+    def test_one_group_send_per_window(self):
+        broadcaster = BattleBroadcaster(flush_interval=0.05)
+        layer = get_channel_layer()
+        group = battle_group('dispatch-test')
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            receiving = asyncio.ensure_future(layer.receive(channel))
+            await asyncio.sleep(0)
+            broadcaster.enqueue(group, [(None, {'n': 1}), ('s', {'v': 1})])
+            broadcaster.enqueue(group, [(None, {'n': 2}), ('s', {'v': 2})])
+            event = await asyncio.wait_for(receiving, 2)
+            await layer.group_discard(group, channel)
+            return event
+
+        event = asyncio.run(scenario())
+        frames = [(key, json.loads(frame)) for key, frame in event['frames']]
+        self.assertEqual(frames, [(None, {'n': 1}), (None, {'n': 2}), ('s', {'v': 2})])
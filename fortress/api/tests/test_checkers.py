@@ -0,0 +1,157 @@
+from fractions import Fraction
+
+from django.test import SimpleTestCase
+
+from api.checkers import (
+    CheckerCache, CheckerSpecError, ExpressionChecker, NumericChecker, compile_checker, parse_number,
+)
+from api.grading import checker_cache, grade_answer
+from api.models import Task
+
+from .base import FortressTestCase
+
+
+class ParseNumberTests(SimpleTestCase):
+    def test_formats(self):
+        cases = {
+            '42': Fraction(42), ' -0.75 ': Fraction(-3, 4), '0,75': Fraction(3, 4), '3/4': Fraction(3, 4),
+            '-6/8': Fraction(-3, 4), '1 1/2': Fraction(3, 2), '-1 1/2': Fraction(-3, 2),
+            '1e-3': Fraction(1, 1000), '75%': Fraction(3, 4), '−2': Fraction(-2), 7: Fraction(7),
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(parse_number(text), expected)
+
+    def test_not_numbers(self):
+        for text in ('', 'abc', '1/0', '1 1/0', '1,000,000', '1e999999', 'nan', 'inf', True, float('inf'), '9' * 101):
+            with self.subTest(text=text):
+                self.assertIsNone(parse_number(text))
+
+
+class CompileCheckerTests(SimpleTestCase):
+    def check(self, spec, answer, expected_answer=''):
+        return compile_checker(spec, expected_answer).check({'answer': answer})
+
+    def test_default_is_exact_match_with_expected_answer(self):
+        self.assertTrue(self.check({}, ' 42 ', '42'))
+        self.assertFalse(self.check({}, '42.0', '42'))
+        self.assertTrue(self.check({'type': 'exact', 'ignore_case': True}, 'МОСКВА', 'Москва'))
+        self.assertIsNone(compile_checker({}, ''))
+
+    def test_numeric_exact_and_tolerance(self):
+        self.assertTrue(self.check({'type': 'numeric', 'answer': '3/4'}, '0,75'))
+        self.assertTrue(self.check({'type': 'numeric', 'answer': '3/4'}, '75%'))
+        self.assertFalse(self.check({'type': 'numeric', 'answer': '3/4'}, '0.7500001'))
+        spec = {'type': 'numeric', 'answer': '3.14159', 'tolerance': 0.01}
+        self.assertTrue(self.check(spec, '3.14'))
+        self.assertFalse(self.check(spec, '3.13'))
+        self.assertFalse(self.check(spec, 'пи'))
+
+    def test_numeric_relative_tolerance(self):
+        spec = {'type': 'numeric', 'answer': '1000', 'relative': 0.01}
+        self.assertTrue(self.check(spec, '1009'))
+        self.assertFalse(self.check(spec, '1011'))
+        self.assertIsInstance(compile_checker(spec), NumericChecker)
+
+    def test_set_ordered_and_unordered(self):
+        spec = {'type': 'set', 'answer': ['1', '-2']}
+        self.assertTrue(self.check(spec, '-2; 1'))
+        self.assertTrue(self.check(spec, ['1.0', '-4/2']))
+        self.assertFalse(self.check(spec, '1'))
+        self.assertFalse(self.check(spec, '1; -2; 3'))
+        ordered = {'type': 'set', 'answer': 'a, b', 'separator': ',', 'ordered': True}
+        self.assertTrue(self.check(ordered, 'a,  b'))
+        self.assertFalse(self.check(ordered, 'b, a'))
+
+    def test_regex_is_full_match(self):
+        spec = {'type': 'regex', 'pattern': r'x\s*=\s*5', 'ignore_case': True, 'display': 'x = 5'}
+        checker = compile_checker(spec)
+        self.assertTrue(checker.check({'answer': ' X= 5 '}))
+        self.assertFalse(checker.check({'answer': 'x = 55'}))
+        self.assertEqual(checker.display, 'x = 5')
+
+    def test_expression_equivalence(self):
+        spec = {'type': 'expression', 'answer': '(x+1)^2'}
+        self.assertTrue(self.check(spec, 'x^2 + 2x + 1'))
+        self.assertTrue(self.check(spec, '(x+1)(x+1)'))
+        self.assertFalse(self.check(spec, 'x^2 + 1'))
+        self.assertFalse(self.check(spec, '__import__("os")'))
+        self.assertTrue(self.check({'type': 'expression', 'answer': 'sin(2x)'}, '2sin(x)cos(x)'))
+        self.assertTrue(compile_checker(spec).expensive)
+
+    def test_expression_rejects_unsafe_constructs(self):
+        for text in ('x.real', 'open(x)', 'y + 1', '[x]', 'x if x else 1', ''):
+            with self.subTest(text=text):
+                with self.assertRaises(CheckerSpecError):
+                    ExpressionChecker(text)
+
+    def test_invalid_specs(self):
+        invalid = [
+            ['numeric'], {'type': 'numeric', 'answer': 'abc'}, {'type': 'numeric'}, {'type': 'regex'},
+            {'type': 'regex', 'pattern': '('}, {'type': 'set', 'answer': ' ; '}, {'type': 'unknown', 'answer': '1'},
+            {'type': 'expression', 'answer': 'log(-x^2-1)'},
+        ]
+        for spec in invalid:
+            with self.subTest(spec=spec):
+                with self.assertRaises(CheckerSpecError):
+                    compile_checker(spec)
+
+    def test_sandbox_overrides_expensive(self):
+        self.assertTrue(compile_checker({'sandbox': True}, '42').expensive)
+        self.assertFalse(compile_checker({'type': 'expression', 'answer': 'x', 'sandbox': False}).expensive)
+
+
+class CheckerCacheTests(FortressTestCase):
+    def test_compiled_once_per_task_version(self):
+        task = self.tasks[0]
+        cache = CheckerCache(maxsize=2)
+        first = cache.get(task)
+        self.assertIs(cache.get(task), first)
+
+        task.expected_answer = '43'
+        task.save()
+        second = cache.get(task)
+        self.assertIsNot(second, first)
+        self.assertTrue(second.check('43'))
+
+    def test_lru_eviction(self):
+        cache = CheckerCache(maxsize=2)
+        a, b, c = self.tasks
+        first = cache.get(a)
+        cache.get(b)
+        cache.get(a)
+        cache.get(c)  # вытесняет b, а не недавно использованную a
+        self.assertIs(cache.get(a), first)
+        self.assertEqual(len(cache._items), 2)
+        self.assertNotIn((b.pk, b.updated_at), cache._items)
+
+    def test_task_save_invalidates_shared_cache(self):
+        task = self.tasks[0]
+        checker_cache.get(task)
+        Task.objects.get(pk=task.pk).save()
+        self.assertFalse([key for key in checker_cache._items if key[0] == task.pk])
+
+
+class GradeAnswerTests(FortressTestCase):
+    def test_verdicts_and_points(self):
+        task = Task.objects.create(title='Дробь', solution_spec={'type': 'numeric', 'answer': '1/2'}, max_points=5)
+        self.assertEqual(tuple(grade_answer(task, {'answer': '0,5'})), (True, 'Верно!', 5))
+        self.assertEqual(tuple(grade_answer(task, {'answer': '0.4'})), (False, 'Неверно. Ожидается: 1/2', 0))
+
+    def test_unconfigured_and_broken_tasks_accept_without_points(self):
+        empty = Task.objects.create(title='Без ответа')
+        broken = Task(pk=10 ** 6, title='Сломанная', solution_spec={'type': 'numeric', 'answer': 'x'})
+        for task in (empty, broken):
+            with self.subTest(task=task.title):
+                result = grade_answer(task, {'answer': '1'})
+                self.assertFalse(result.is_correct)
+                self.assertEqual(result.points, 0)
+                self.assertTrue(result.feedback.startswith('Ответ принят.'))
+
+    def test_task_api_rejects_invalid_spec(self):
+        client = self.client_for(self.teacher)
+        response = client.post('/api/tasks/', {
+            'title': 'Регулярка', 'body_md': 'x = ?', 'solution_spec': {'type': 'regex', 'pattern': '('},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('solution_spec', response.data)
@@ -0,0 +1,165 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from api import data_export
+from api.data_export import DATASETS, iter_rows, write_columnar
+from api.models import Classroom, Submission, Team, User
+from api.submissions import PENDING_FEEDBACK, record_submission
+
+from .base import PASSWORD, FortressTestCase
+
+# Без pyarrow выгрузки Parquet/Arrow не проверяются вовсе — пропуск виден в отчёте тестов
+needs_pyarrow = unittest.skipUnless(data_export.pyarrow, 'pyarrow не установлен: Parquet/Arrow не проверены')
+
+
+class DataExportTests(FortressTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other_teacher = User.objects.create_user('teacher2', password=PASSWORD, role=User.Role.TEACHER)
+        cls.other_class = Classroom.objects.create(name='8Б', teacher=other_teacher, code='EIGHT-B')
+        cls.other_team = Team.objects.create(classroom=cls.other_class, name='Бета')
+
+    def setUp(self):
+        super().setUp()
+        s0, s1, _ = self.students
+        record_submission(s0.id, self.assign(), {'answer': '42'})
+        record_submission(s1.id, self.assign(self.tasks[1], classroom=self.classroom), {'answer': 'сорок'})
+        record_submission(s1.id, self.assign(team=self.other_team), {'answer': '42'})
+
+    def get(self, url, user=None):
+        return self.client_for(user or self.teacher).get(url)
+
+    def read_csv(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(body.startswith('\ufeff'))
+        return list(csv.DictReader(io.StringIO(body[1:])))
+
+    def test_submissions_csv_of_own_class(self):
+        response = self.get(f'/api/exports/submissions?classId={self.classroom.id}')
+
+        self.assertIn('submissions_', response['Content-Disposition'])
+        rows = self.read_csv(response)
+        self.assertEqual([name for name, _, _ in DATASETS['submissions'].columns], list(rows[0]))
+        self.assertEqual(len(rows), 2)  # выдача другого класса не попала
+        self.assertEqual({row['classroom_id'] for row in rows}, {str(self.classroom.id)})
+        self.assertEqual(rows[1]['answer'], '{"answer": "сорок"}')
+        self.assertEqual([row['is_correct'] for row in rows], ['True', 'False'])
+
+    def test_pending_submission_has_no_verdict(self):
+        Submission.objects.create(assignment=self.assign(), student=self.students[2],
+                                  answer_payload={'answer': '41'}, feedback=PENDING_FEEDBACK)
+
+        rows = self.read_csv(self.get(f'/api/exports/submissions?classId={self.classroom.id}'))
+
+        self.assertEqual([row['is_correct'] for row in rows], ['True', 'False', ''])
+        self.assertEqual(rows[2]['checked_at'], '')
+
+    def test_date_range(self):
+        Submission.objects.filter(student=self.students[0]).update(created_at=timezone.now() - timedelta(days=10))
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        until = (timezone.now() - timedelta(days=5)).date().isoformat()
+        url = f'/api/exports/submissions?classId={self.classroom.id}'
+
+        self.assertEqual(len(self.read_csv(self.get(f'{url}&since={since}'))), 1)
+        self.assertEqual(len(self.read_csv(self.get(f'{url}&until={until}'))), 1)
+
+    def test_scores_and_assignments(self):
+        scores = self.read_csv(self.get(f'/api/exports/scores?classId={self.classroom.id}'))
+        self.assertTrue(scores)
+        self.assertTrue(all(row['classroom_id'] == str(self.classroom.id) or row['team_id'] == str(self.team.id)
+                            for row in scores))
+        assignments = self.read_csv(self.get(f'/api/exports/assignments?classId={self.classroom.id}'))
+        self.assertEqual(len(assignments), 2)
+
+    def test_errors_and_access(self):
+        class_id = self.classroom.id
+        cases = [
+            (f'/api/exports/grades?classId={class_id}', self.teacher, 400),
+            (f'/api/exports/submissions?classId={class_id}&fileFormat=xml', self.teacher, 400),
+            (f'/api/exports/submissions?classId={class_id}&since=вчера', self.teacher, 400),
+            ('/api/exports/submissions?classId=abc', self.teacher, 400),
+            ('/api/exports/submissions', self.teacher, 400),
+            (f'/api/exports/submissions?classId={self.other_class.id}', self.teacher, 403),
+            (f'/api/exports/submissions?classId={class_id}', self.students[0], 403),
+        ]
+        for url, user, code in cases:
+            with self.subTest(url=url, user=user.username):
+                self.assertEqual(self.get(url, user).status_code, code)
+
+    def test_staff_exports_everything(self):
+        admin = User.objects.create_user('admin', password=PASSWORD, role=User.Role.TEACHER, is_staff=True)
+        self.assertEqual(len(self.read_csv(self.get('/api/exports/submissions', admin))), 3)
+
+    def test_columnar_formats_need_pyarrow(self):
+        with mock.patch.object(data_export, 'pyarrow', None):
+            response = self.get(f'/api/exports/submissions?classId={self.classroom.id}&fileFormat=parquet')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('pyarrow', response.data['detail'])
+
+    def test_csv_comes_in_chunks(self):
+        with mock.patch.object(data_export, 'CSV_FLUSH_SIZE', 1):
+            chunks = list(data_export.stream_csv(DATASETS['submissions'], iter_rows(DATASETS['submissions'])))
+        self.assertEqual(len(chunks), 3)  # заголовок с первой строкой и по куску на каждую следующую
+
+    def test_command_writes_csv_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'submissions.csv')
+            call_command('export_data', 'submissions', '--class-id', str(self.classroom.id), '-o', path,
+                         stderr=io.StringIO())
+            with open(path, encoding='utf-8-sig') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 2)
+
+    def test_command_errors(self):
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'submissions', '--since', 'вчера', stderr=io.StringIO())
+        if data_export.pyarrow is not None:
+            with self.assertRaises(CommandError):
+                call_command('export_data', 'submissions', '--format', 'parquet', stderr=io.StringIO())
+
+    @needs_pyarrow
+    def test_parquet_and_arrow_round_trip(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        # Отложенная проверка: пустые is_correct и checked_at должны стать null, а не False/0
+        Submission.objects.create(assignment=self.assign(), student=self.students[2],
+                                  answer_payload={'answer': '41'}, feedback=PENDING_FEEDBACK)
+        dataset = DATASETS['submissions']
+        for fmt in ('parquet', 'arrow'):
+            with self.subTest(fmt=fmt):
+                buf = io.BytesIO()
+                self.assertEqual(write_columnar(dataset, iter_rows(dataset), buf, fmt, batch_size=2), 4)
+                buf.seek(0)
+                if fmt == 'parquet':
+                    table = pyarrow.parquet.read_table(buf)
+                else:
+                    table = pyarrow.ipc.open_file(buf).read_all()
+                self.assertEqual(table.num_rows, 4)
+                self.assertEqual(table.column_names, [name for name, _, _ in dataset.columns])
+                self.assertEqual(table.column('answer').to_pylist(),
+                                 ['{"answer": "42"}', '{"answer": "сорок"}', '{"answer": "42"}', '{"answer": "41"}'])
+                self.assertEqual(table.column('is_correct').to_pylist(), [True, False, True, None])
+                self.assertEqual(table.column('checked_at').null_count, 1)
+                self.assertEqual(str(table.schema.field('created_at').type), 'timestamp[us, tz=UTC]')
+
+    @needs_pyarrow
+    def test_parquet_download(self):
+        import pyarrow.parquet
+
+        response = self.get(f'/api/exports/submissions?classId={self.classroom.id}&fileFormat=parquet')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.parquet', response['Content-Disposition'])
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('classroom_id').to_pylist(), [self.classroom.id] * 2)
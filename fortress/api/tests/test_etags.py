@@ -0,0 +1,108 @@
+from unittest import mock
+
+from api.data_version import bump_classes, cached_report, class_key, versions
+from api.models import Task, Team
+from api.report_views import ClassOverviewReportView, StudentReportView
+from api.submissions import record_submission
+
+from .base import FortressTestCase
+
+
+class ConditionalGetMixin:
+    def get(self, client, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return client.get(url, **headers)
+
+    def assertRevalidates(self, client, url):
+        """Первый ответ с ETag, повторный с If-None-Match — 304 без тела; возвращает ETag."""
+        response = self.get(client, url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        again = self.get(client, url, etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], etag)
+        self.assertFalse(again.content)
+        return etag
+
+
+class ReportETagTests(ConditionalGetMixin, FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher_client = self.client_for(self.teacher)
+        self.overview_url = f'/api/reports/class/{self.classroom.id}/overview'
+        self.student = self.students[0]
+        self.student_url = f'/api/reports/student/{self.student.id}?classId={self.classroom.id}'
+
+    def test_overview_304_until_new_answer(self):
+        etag = self.assertRevalidates(self.teacher_client, self.overview_url)
+
+        record_submission(self.student.id, self.assign(), {'answer': '41'})
+
+        response = self.get(self.teacher_client, self.overview_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['topErrors'], [{'value': '41', 'count': 1}])
+
+    def test_not_modified_is_a_cheap_lookup(self):
+        etag = self.assertRevalidates(self.teacher_client, self.overview_url)
+        with self.assertNumQueries(2):  # класс и его версия
+            self.assertEqual(self.get(self.teacher_client, self.overview_url, etag).status_code, 304)
+
+    def test_unchanged_report_is_served_from_cache(self):
+        self.get(self.teacher_client, self.overview_url)
+        with mock.patch.object(ClassOverviewReportView, '_build') as build:
+            self.assertEqual(self.get(self.teacher_client, self.overview_url).status_code, 200)
+        self.assertFalse(build.called)
+
+    def test_class_writes_bump_version(self):
+        key = class_key(self.classroom.id)
+        before = versions([key])[key]
+        Team.objects.create(classroom=self.classroom, name='Бета')
+        self.assign(classroom=self.classroom)
+        self.assertEqual(versions([key])[key], before + 2)
+
+    def test_student_report_revalidates(self):
+        client = self.client_for(self.student)
+        etag = self.assertRevalidates(client, self.student_url)
+
+        with mock.patch.object(StudentReportView, '_build') as build:
+            bump_classes([self.classroom.id])
+            build.return_value = {'solvedCount': 0}
+            self.assertEqual(self.get(client, self.student_url, etag).status_code, 200)
+        self.assertTrue(build.called)
+
+    def test_student_report_depends_on_tasks(self):
+        client = self.client_for(self.student)
+        etag = self.assertRevalidates(client, self.student_url)
+        Task.objects.create(title='Новая', body_md='?', tags=['L1', 'геометрия'])
+        self.assertEqual(self.get(client, self.student_url, etag).status_code, 200)
+
+    def test_unavailable_report_is_not_cached(self):
+        url = f'/api/reports/student/{10 ** 6}?classId={self.classroom.id}'
+        self.assertEqual(self.get(self.teacher_client, url).status_code, 400)
+        compute = mock.Mock(return_value=None)
+        self.assertIsNone(cached_report('student', '"x"', compute))
+        self.assertIsNone(cached_report('student', '"x"', compute))
+        self.assertEqual(compute.call_count, 2)
+
+
+class TaskListETagTests(ConditionalGetMixin, FortressTestCase):
+    def test_list_and_detail_304_until_task_changes(self):
+        client = self.client_for(self.teacher)
+        list_etag = self.assertRevalidates(client, '/api/tasks/')
+        detail_etag = self.assertRevalidates(client, f'/api/tasks/{self.tasks[0].id}/')
+        self.assertNotEqual(list_etag, detail_etag)
+
+        self.tasks[1].title = 'Переименована'
+        self.tasks[1].save()
+
+        self.assertEqual(self.get(client, '/api/tasks/', list_etag).status_code, 200)
+        self.assertEqual(self.get(client, f'/api/tasks/{self.tasks[0].id}/', detail_etag).status_code, 200)
+
+    def test_query_string_is_part_of_etag(self):
+        client = self.client_for(self.teacher)
+        etag = self.get(client, '/api/tasks/')['ETag']
+        self.assertEqual(self.get(client, '/api/tasks/?page=1', etag).status_code, 200)
@@ -0,0 +1,137 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.export_jobs import ExportArtifactStore, ExportJobRunner
+from api.models import ExportJob
+from api.report_export import ExportRequest, data_watermark
+from api.submissions import record_submission
+
+from .base import FortressTestCase
+
+EXPORT_URL = '/api/reports/export'
+
+
+class ExportJobTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        # Воркеры не стартуют: очередь выполняется в тесте через run_pending()
+        self.runner = ExportJobRunner(ExportArtifactStore(self.directory), in_process=False)
+        patcher = mock.patch('api.report_views.export_jobs', self.runner)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.client_for(self.teacher)
+        self.export = ExportRequest('CLASS', self.classroom, None)
+
+    def submit(self):
+        response = self.client.post(EXPORT_URL, {'scope': 'CLASS', 'classId': self.classroom.id, 'async': True},
+                                    format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def new_answer(self):
+        """Новый вердикт меняет водяной знак данных класса."""
+        record_submission(self.students[0].id, self.assign(), {'answer': '42'})
+
+    def test_job_lifecycle(self):
+        job = self.submit()
+        self.assertEqual(job['status'], ExportJob.Status.PENDING)
+        self.assertEqual(self.client.get(job['statusUrl']).data['status'], ExportJob.Status.PENDING)
+        self.assertEqual(self.client.get(f"{job['statusUrl']}/download").status_code, 409)
+
+        self.assertEqual(self.runner.run_pending(), 1)
+
+        status = self.client.get(job['statusUrl']).data
+        self.assertEqual(status['status'], ExportJob.Status.DONE)
+        download = self.client.get(status['downloadUrl'])
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'PK'))
+
+    def test_jobs_of_other_users_are_hidden(self):
+        job = self.submit()
+        other = self.client_for(self.students[0])
+        self.assertEqual(other.get(job['statusUrl']).status_code, 404)
+
+    def test_same_data_reuses_artifact(self):
+        self.submit()
+        second = self.submit()
+        self.assertEqual(self.runner.run_pending(), 1)  # вторую закрыла сборка первой
+        self.assertEqual(ExportJob.objects.get(id=second['jobId']).status, ExportJob.Status.DONE)
+
+        third = self.submit()
+        self.assertEqual(third['status'], ExportJob.Status.DONE)
+        self.assertEqual(len(list(self.directory.glob('*.xlsx'))), 1)
+
+        with mock.patch('api.report_views.build_report') as build:
+            response = self.client.post(EXPORT_URL, {'scope': 'CLASS', 'classId': self.classroom.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(build.called)
+
+    def test_newer_build_prunes_only_older_versions(self):
+        old_key = self.export.artifact_key(data_watermark(self.classroom))
+        self.runner.store.build(self.export, old_key)
+        self.new_answer()
+        new_key = self.export.artifact_key(data_watermark(self.classroom))
+        self.assertNotEqual(new_key, old_key)
+
+        self.runner.store.build(self.export, new_key)
+        self.assertIsNone(self.runner.store.get(old_key))
+        self.assertIsNotNone(self.runner.store.get(new_key))
+
+        # Запоздавшая сборка по старым данным не стирает более свежий файл
+        self.runner.store.build(self.export, old_key)
+        self.assertIsNotNone(self.runner.store.get(new_key))
+
+    def test_other_reports_are_not_pruned(self):
+        student_export = ExportRequest('STUDENT', self.classroom, self.students[0].id)
+        student_key = student_export.artifact_key(data_watermark(self.classroom))
+        self.runner.store.build(student_export, student_key)
+        self.new_answer()
+        self.runner.store.build(self.export, self.export.artifact_key(data_watermark(self.classroom)))
+        self.assertIsNotNone(self.runner.store.get(student_key))
+
+    def test_download_of_outdated_artifact_is_gone(self):
+        job = self.submit()
+        self.runner.run_pending()
+        self.runner.store.path(ExportJob.objects.get(id=job['jobId']).artifact_key).unlink()
+        self.assertEqual(self.client.get(f"{job['statusUrl']}/download").status_code, 410)
+
+    def test_vanished_cached_file_is_rebuilt(self):
+        missing = self.directory / 'missing.xlsx'
+        with mock.patch.object(self.runner.store, 'get', return_value=missing):
+            response = self.client.post(EXPORT_URL, {'scope': 'CLASS', 'classId': self.classroom.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+    def test_failed_build_is_reported(self):
+        job = self.submit()
+        with mock.patch.object(self.runner.store, 'build', side_effect=RuntimeError('диск заполнен')):
+            with self.assertLogs('api.export_jobs', 'ERROR'):
+                self.runner.run_pending()
+        status = self.client.get(job['statusUrl']).data
+        self.assertEqual(status['status'], ExportJob.Status.FAILED)
+        self.assertEqual(status['error'], 'диск заполнен')
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = self.submit()
+        ExportJob.objects.filter(id=job['jobId']).update(
+            status=ExportJob.Status.RUNNING, started_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(self.runner.run_pending(), 0)
+        self.runner._requeue_stale()
+        self.assertEqual(self.runner.run_pending(), 1)
+
+    def test_worker_command(self):
+        self.submit()
+        out = StringIO()
+        with mock.patch('api.management.commands.run_export_worker.export_jobs', self.runner):
+            call_command('run_export_worker', '--once', stdout=out)
+        self.assertIn('Выполнено заявок: 1', out.getvalue())
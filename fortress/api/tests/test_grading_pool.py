@@ -0,0 +1,194 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from api.grading import GradeResult, verdict_cache
+from api.grading_pool import TIMEOUT_RESULT, GradingExecutor, grading_executor
+from api.models import Score, Submission, Task
+from api.submissions import PENDING_FEEDBACK, complete_submission, record_submission, regrade_stale_pending
+
+from .base import FortressTestCase
+
+EXPRESSION_SPEC = {'type': 'expression', 'answer': '(x+1)^2'}
+
+
+class FakePool:
+    """Пул без процессов: проверки «выполняет» сам тест, завершая их future."""
+
+    def __init__(self):
+        self.jobs = {}  # job_id -> Future
+        self.closed = False
+
+    def submit(self, fn, job_id, *args):
+        self.jobs[job_id] = Future()
+        return self.jobs[job_id]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.closed = True
+
+
+class GradingExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = GradingExecutor(max_workers=1, timeout=10, memory_mb=0)
+        self.addCleanup(self.executor.shutdown)
+        self.cheap = Task(title='Число', expected_answer='42')
+        self.expensive = Task(title='Выражение', solution_spec=EXPRESSION_SPEC, max_points=3)
+
+    def test_cheap_checks_stay_in_process(self):
+        self.assertFalse(self.executor.needs_pool(self.cheap))
+        self.assertTrue(self.executor.grade(self.cheap, {'answer': '42'}).is_correct)
+        self.assertIsNone(self.executor._pool)
+
+    def test_disabled_or_broken_spec_never_uses_pool(self):
+        self.assertFalse(GradingExecutor(enabled=False).needs_pool(self.expensive))
+        broken = Task(title='Сломанная', solution_spec={'type': 'expression', 'answer': 'x +'})
+        self.assertFalse(self.executor.needs_pool(broken))
+
+    def test_expensive_checks_run_in_pool(self):
+        self.assertTrue(self.executor.needs_pool(self.expensive))
+        results = self.executor.grade_many([
+            (self.expensive, {'answer': 'x^2 + 2x + 1'}),
+            (self.cheap, {'answer': '41'}),
+            (self.expensive, {'answer': 'x^2 + 1'}),
+        ])
+        self.assertEqual([r.is_correct for r in results], [True, False, False])
+        self.assertEqual(results[0].points, 3)
+        self.assertIsNotNone(self.executor._pool)
+
+
+class GradingDeadlineTests(SimpleTestCase):
+    """Срок проверки (timeout + запас) идёт с момента, когда процесс пула её начал."""
+
+    def setUp(self):
+        self.executor = GradingExecutor(max_workers=1, timeout=1, memory_mb=0)
+        self.pool = self.executor._pool = FakePool()
+        self.task = Task(title='Выражение', solution_spec=EXPRESSION_SPEC, max_points=3)
+        self.addCleanup(verdict_cache.clear)
+
+    def submit(self, answer):
+        result = self.executor._submit(self.task, {'answer': answer})
+        return result, max(self.pool.jobs)
+
+    def test_time_in_queue_does_not_count(self):
+        first, first_id = self.submit('x^2+2x+1')
+        second, second_id = self.submit('x^2+1')
+        self.executor._mark_started(first_id, now=0)
+
+        self.assertEqual(self.executor._expire_overdue(now=1.9), 0)
+        self.pool.jobs[first_id].set_result(True)
+        self.executor._mark_started(second_id, now=1.9)
+
+        # Вторая ждала в очереди почти весь срок первой, но её собственный срок только начался
+        self.assertEqual(self.executor._expire_overdue(now=3.5), 0)
+        self.pool.jobs[second_id].set_result(False)
+        self.assertEqual([first.result().is_correct, second.result().is_correct], [True, False])
+        self.assertFalse(self.pool.closed)
+
+    def test_overrun_recycles_pool_and_retries_the_rest(self):
+        hung, hung_id = self.submit('x^2+2x+1')
+        other, other_id = self.submit('x^2+1')
+        self.executor._mark_started(hung_id, now=0)
+        self.executor._mark_started(other_id, now=0.5)
+
+        self.assertEqual(self.executor._expire_overdue(now=2.2), 1)
+
+        self.assertEqual(hung.result(timeout=0), TIMEOUT_RESULT)
+        self.assertTrue(self.pool.closed)
+        self.assertFalse(other.done())
+        # Пул погашен: вторая проверка не получает сбой, а уходит в новый пул
+        old_pool, self.pool = self.pool, FakePool()
+        self.executor._pool = self.pool
+        old_pool.jobs[other_id].set_exception(BrokenProcessPool())
+        old_pool.jobs[hung_id].set_exception(BrokenProcessPool())
+        [retry_id] = self.pool.jobs
+        self.executor._mark_started(retry_id, now=2.3)
+        self.assertEqual(self.executor._expire_overdue(now=4.0), 0)
+        self.pool.jobs[retry_id].set_result(True)
+        self.assertTrue(other.result(timeout=0).is_correct)
+        self.assertEqual(hung.result(), TIMEOUT_RESULT)
+        self.assertFalse(self.pool.closed)
+
+
+class DeferredGradingTests(FortressTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.task = Task.objects.create(title='Квадрат суммы', body_md='(x+1)^2 = ?', solution_spec=EXPRESSION_SPEC)
+
+    def setUp(self):
+        super().setUp()
+        self.assignment = self.assign(self.task)
+        self.student = self.students[0]
+
+    def submit_pending(self):
+        with mock.patch.object(grading_executor, 'defer') as defer:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client_for(self.student).post('/api/submissions/', {
+                    'assignment': self.assignment.id, 'student': self.student.id,
+                    'answer_payload': {'answer': 'x^2+2x+1'},
+                }, format='json')
+        return response, defer
+
+    def global_points(self):
+        score = Score.objects.filter(student=self.student, classroom=None, team=None).first()
+        return score.total_points if score else 0
+
+    def test_http_submission_is_accepted_before_grading(self):
+        response, defer = self.submit_pending()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.data['checked_at'])
+        self.assertEqual(response.data['feedback'], PENDING_FEEDBACK)
+        self.assertEqual(defer.call_count, 1)
+        self.assertEqual(self.global_points(), 0)
+
+        callback = defer.call_args.args[2]
+        callback(GradeResult(True, 'Верно!', 10))
+        submission = Submission.objects.get(id=response.data['id'])
+        self.assertTrue(submission.is_correct)
+        self.assertIsNotNone(submission.checked_at)
+        self.assertEqual(self.global_points(), 10)
+
+    def test_verdict_is_written_once(self):
+        response, _ = self.submit_pending()
+        self.assertIsNotNone(complete_submission(response.data['id'], GradeResult(True, 'Верно!', 10)))
+        self.assertIsNone(complete_submission(response.data['id'], GradeResult(True, 'Верно!', 10)))
+        self.assertEqual(self.global_points(), 10)
+
+    def test_cached_verdict_is_recorded_immediately(self):
+        with mock.patch.object(grading_executor, 'enabled', False):
+            record_submission(self.student.id, self.assignment, {'answer': 'x^2+2x+1'})
+
+        response, defer = self.submit_pending()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(defer.called)
+        self.assertEqual(self.global_points(), 20)
+
+    def test_regrade_stale_pending(self):
+        response, _ = self.submit_pending()
+        self.assertEqual(regrade_stale_pending(stale_after=60), 0)  # ещё свежая
+
+        Submission.objects.filter(id=response.data['id']).update(created_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch.object(grading_executor, 'enabled', False):
+            self.assertEqual(regrade_stale_pending(stale_after=60), 1)
+            self.assertEqual(regrade_stale_pending(stale_after=60), 0)
+
+        submission = Submission.objects.get(id=response.data['id'])
+        self.assertTrue(submission.is_correct)
+        self.assertEqual(self.global_points(), 10)
+
+    def test_regrade_pending_command(self):
+        response, _ = self.submit_pending()
+        out = StringIO()
+        with mock.patch.object(grading_executor, 'enabled', False):
+            call_command('regrade_pending', '--stale-after', '0', stdout=out)
+
+        self.assertIn('Допроверено отправок: 1', out.getvalue())
+        self.assertIsNotNone(Submission.objects.get(id=response.data['id']).checked_at)
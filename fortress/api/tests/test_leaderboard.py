@@ -0,0 +1,89 @@
+import random
+
+from django.test import SimpleTestCase
+
+from api.leaderboard import ContextBoard, MemoryLeaderboard, SqlLeaderboard
+from api.models import Score, User
+
+from .base import PASSWORD, FortressTestCase
+
+
+class ContextBoardTests(SimpleTestCase):
+    def setUp(self):
+        self.board = ContextBoard([(1, 50), (2, 80), (3, 50), (4, 10)])
+
+    def test_rank_orders_by_points_then_id(self):
+        self.assertEqual([self.board.rank(s) for s in (2, 1, 3, 4)], [1, 2, 3, 4])
+        self.assertEqual(self.board.top(2), [(2, 80), (1, 50)])
+
+    def test_student_without_score_ranks_after_equal_points(self):
+        self.assertEqual(self.board.rank(99), 5)
+
+    def test_set_points_moves_student(self):
+        self.board.set_points(4, 60)
+        self.board.set_points(5, 50)
+        self.assertEqual(self.board.top(5), [(2, 80), (4, 60), (1, 50), (3, 50), (5, 50)])
+
+    def test_around(self):
+        self.assertEqual(self.board.around(1, 1), [(1, 2, 80), (2, 1, 50), (3, 3, 50)])
+        self.assertEqual(self.board.around(2, 1), [(1, 2, 80), (2, 1, 50)])
+        self.assertEqual(self.board.around(99, 1), [])
+
+
+class LeaderboardBackendsTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(7)
+        self.student_ids = [s.id for s in self.students]
+        for i in range(12):
+            user = User.objects.create_user(f'ranked{i}', password=PASSWORD, role=User.Role.STUDENT)
+            self.student_ids.append(user.id)
+        for sid in self.student_ids:
+            Score.objects.create(student_id=sid, classroom=self.classroom, total_points=rng.choice([0, 10, 20, 30]))
+
+    def test_memory_and_sql_backends_agree(self):
+        ctx = (self.classroom.id, None)
+        memory, sql = MemoryLeaderboard(), SqlLeaderboard()
+        self.assertEqual(memory.top(ctx, 5), sql.top(ctx, 5))
+        for sid in self.student_ids + [999999]:
+            with self.subTest(student=sid):
+                self.assertEqual(memory.rank(ctx, sid), sql.rank(ctx, sid))
+                self.assertEqual(memory.around(ctx, sid, 2), sql.around(ctx, sid, 2))
+
+    def test_memory_board_applies_credited_totals(self):
+        ctx = (self.classroom.id, None)
+        memory = MemoryLeaderboard()
+        last = self.student_ids[-1]
+        memory.rank(ctx, last)  # контекст загружен
+        memory.update([(last, self.classroom.id, None, 1000)])
+        self.assertEqual(memory.top(ctx, 1), [(last, 1000)])
+
+
+class LeaderboardViewTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        for points, student in zip((30, 10, 20), self.students):
+            Score.objects.create(student=student, classroom=self.classroom, total_points=points)
+            Score.objects.create(student=student, total_points=points)
+
+    def test_class_leaderboard_for_student_includes_own_rank(self):
+        s0, s1, s2 = self.students
+        response = self.client_for(s1).get('/api/leaderboard', {'classId': self.classroom.id, 'radius': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['studentId'] for row in response.data['top']], [s0.id, s2.id, s1.id])
+        self.assertEqual(response.data['top'][0]['username'], s0.username)
+        self.assertEqual(response.data['me'], {'studentId': s1.id, 'rank': 3})
+        self.assertEqual([row['rank'] for row in response.data['around']], [2, 3])
+
+    def test_teacher_sees_top_without_me(self):
+        response = self.client_for(self.teacher).get('/api/leaderboard', {'classId': self.classroom.id, 'top': 2})
+        self.assertEqual(len(response.data['top']), 2)
+        self.assertNotIn('me', response.data)
+
+    def test_access_and_validation(self):
+        outsider = User.objects.create_user('outsider', password=PASSWORD, role=User.Role.STUDENT)
+        client = self.client_for(outsider)
+        self.assertEqual(client.get('/api/leaderboard', {'classId': self.classroom.id}).status_code, 403)
+        self.assertEqual(client.get('/api/leaderboard', {'classId': 999999}).status_code, 404)
+        self.assertEqual(client.get('/api/leaderboard', {'top': 'many'}).status_code, 400)
+        self.assertEqual(client.get('/api/leaderboard').status_code, 200)
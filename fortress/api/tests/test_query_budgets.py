@@ -0,0 +1,111 @@
+"""
+Бюджеты SQL-запросов горячих эндпоинтов (METRICS['QUERY_BUDGETS']) с
+budget_action='raise': превышение роняет запрос исключением QueryBudgetExceeded,
+так что N+1 ловится здесь, а не в продакшене. Данных больше одной строки
+на каждую связь — иначе N+1 не отличить от константы.
+"""
+from django.conf import settings
+
+from api.metrics import QueryBudgetExceeded, metrics
+from api.models import ClassMembership, Team, TeamMembership, User
+from api.submissions import record_submission
+from api.task_index import task_index
+
+from .base import PASSWORD, FortressTestCase, access_token
+
+
+class QueryBudgetTests(FortressTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.second_team = Team.objects.create(classroom=cls.classroom, name='Бета')
+        for i in range(4):
+            student = User.objects.create_user(f'beta{i}', password=PASSWORD, role=User.Role.STUDENT)
+            ClassMembership.objects.create(classroom=cls.classroom, student=student)
+            TeamMembership.objects.create(team=cls.second_team, student=student)
+
+    def setUp(self):
+        super().setUp()
+        # Холодные кэши процесса (индекс задач) строятся один раз — не в счёт бюджета запроса
+        task_index.pick(1)
+        for student, answer in zip(self.students, ('42', '41', '40')):
+            record_submission(student.id, self.assign(), {'answer': answer})
+
+        previous = metrics.budget_action
+        metrics.budget_action = 'raise'
+        self.addCleanup(setattr, metrics, 'budget_action', previous)
+
+    def client_with_token(self, user):
+        # Настоящий JWT, а не force_authenticate: аутентификация тоже в бюджете
+        client = self.client_class()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(user)}')
+        return client
+
+    def assertWithinBudget(self, endpoint, response, status=200):
+        self.assertEqual(response.status_code, status, getattr(response, 'data', None))
+        # Превышение уронило бы запрос раньше; здесь — что замер вообще попал в эндпоинт
+        self.assertGreaterEqual(metrics.snapshot()[f'http {endpoint}']['count'], 1)
+
+    def test_budget_violation_raises(self):
+        metrics.budgets['TaskViewSet.list'], previous = 0, metrics.budgets['TaskViewSet.list']
+        self.addCleanup(metrics.budgets.__setitem__, 'TaskViewSet.list', previous)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client_with_token(self.teacher).get('/api/tasks/')
+
+    def test_socket_messages_are_budgeted_too(self):
+        metrics.budgets['BattleConsumer.test'] = 1
+        self.addCleanup(metrics.budgets.pop, 'BattleConsumer.test')
+        with self.assertRaises(QueryBudgetExceeded):
+            with metrics.track('BattleConsumer.test'):
+                User.objects.count()
+                User.objects.count()
+        self.assertIn('fortress_query_budget_exceeded_total{kind="ws",endpoint="BattleConsumer.test"} 1',
+                      self.client.get('/api/metrics').content.decode())
+
+    def test_submission_create(self):
+        response = self.client_with_token(self.students[0]).post('/api/submissions/', {
+            'assignment': self.assign().id, 'student': self.students[0].id, 'answer_payload': {'answer': '42'},
+        }, format='json')
+        self.assertWithinBudget('SubmissionViewSet.create', response, 201)
+
+    def test_submission_batch(self):
+        items = [{'assignment': self.assign(task).id, 'answer_payload': {'answer': answer}}
+                 for task in self.tasks for answer in ('42', '41', '40')]
+        response = self.client_with_token(self.students[1]).post(
+            '/api/submissions/batch/', {'submissions': items}, format='json'
+        )
+        self.assertWithinBudget('SubmissionViewSet.batch', response, 201)
+
+    def test_battle_launch(self):
+        response = self.client_with_token(self.teacher).post(
+            '/api/battles/launch', {'teamIds': [self.team.id, self.second_team.id]}, format='json'
+        )
+        self.assertWithinBudget('BattleView.post', response, 201)
+
+    def test_reports(self):
+        client = self.client_with_token(self.teacher)
+        self.assertWithinBudget('ClassOverviewReportView.get',
+                                client.get(f'/api/reports/class/{self.classroom.id}/overview'))
+        self.assertWithinBudget('StudentReportView.get',
+                                client.get(f'/api/reports/student/{self.students[0].id}',
+                                           {'classId': self.classroom.id}))
+
+    def test_report_export(self):
+        response = self.client_with_token(self.teacher).post(
+            '/api/reports/export', {'scope': 'CLASS', 'classId': self.classroom.id}, format='json'
+        )
+        self.assertWithinBudget('ReportExportView.post', response)
+        response.close()
+
+    def test_read_endpoints(self):
+        student = self.client_with_token(self.students[0])
+        self.assertWithinBudget('LeaderboardView.get', student.get('/api/leaderboard', {'classId': self.classroom.id}))
+        self.assertWithinBudget('ScoreViewSet.list', student.get('/api/scores/'))
+        self.assertWithinBudget('TaskViewSet.list', self.client_with_token(self.teacher).get('/api/tasks/'))
+
+    def test_budgets_cover_hot_paths(self):
+        budgets = settings.METRICS['QUERY_BUDGETS']
+        for endpoint in ('SubmissionViewSet.create', 'SubmissionViewSet.batch', 'BattleConsumer.submit_answer',
+                         'BattleView.post', 'ClassOverviewReportView.get', 'StudentReportView.get',
+                         'ReportExportView.post'):
+            self.assertIn(endpoint, budgets)
@@ -0,0 +1,93 @@
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from openpyxl import load_workbook
+
+from api.export_jobs import ExportArtifactStore, export_jobs
+from api.report_export import ExportRequest, build_report, human_timedelta
+from api.submissions import record_submission
+
+from .base import FortressTestCase
+
+EXPORT_URL = '/api/reports/export'
+
+
+class ReportExportTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        # Готовые файлы отчётов — во временный каталог, а не в var/exports
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(export_jobs, 'store', ExportArtifactStore(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        s0, s1, _ = self.students
+        first, second = self.assign(self.tasks[0]), self.assign(self.tasks[1])
+        record_submission(s0.id, first, {'answer': '42'})
+        record_submission(s0.id, second, {'answer': '42'})
+        record_submission(s1.id, first, {'answer': '41'})
+
+    def export(self, user, **body):
+        return self.client_for(user).post(EXPORT_URL, body, format='json')
+
+    def workbook(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        return load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+
+    def rows(self, sheet):
+        return list(sheet.iter_rows(values_only=True))
+
+    def test_class_export(self):
+        response = self.export(self.teacher, scope='CLASS', classId=self.classroom.id)
+
+        wb = self.workbook(response)
+        self.assertIn(f'report_class_{self.classroom.id}.xlsx', response['Content-Disposition'])
+        self.assertEqual(wb.sheetnames, ['Сводка', 'Прогресс команд', 'Рейтинг'])
+        self.assertIn(('41', 1), self.rows(wb['Сводка']))
+        self.assertEqual(self.rows(wb['Рейтинг']), [('Студент', 'Очки'), ('student0', 20)])
+        self.assertIn(('Альфа', 1, 1, 3, 33.3), self.rows(wb['Прогресс команд']))
+
+    def test_student_export(self):
+        student = self.students[0]
+        response = self.export(student, scope='STUDENT', classId=self.classroom.id, studentId=student.id)
+
+        wb = self.workbook(response)
+        self.assertEqual(wb.sheetnames, ['Студент', 'Задачи'])
+        summary = self.rows(wb['Студент'])
+        self.assertIn(('Решённых задач', 2), summary)
+        self.assertIn(('Баллы', 20), summary)
+        self.assertIn(('Позиция в рейтинге', 1), summary)
+        tasks = self.rows(wb['Задачи'])
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual(sorted(row[1] for row in tasks[1:]), [1, 2])
+
+    def test_access_and_validation(self):
+        other = self.students[1]
+        cases = [
+            (self.teacher, {'scope': 'ALL', 'classId': self.classroom.id}, 400),
+            (self.teacher, {'scope': 'CLASS'}, 400),
+            (self.teacher, {'scope': 'CLASS', 'classId': 10 ** 6}, 404),
+            (self.teacher, {'scope': 'STUDENT', 'classId': self.classroom.id}, 400),
+            (self.teacher, {'scope': 'STUDENT', 'classId': self.classroom.id, 'studentId': 'x'}, 400),
+            (self.students[0], {'scope': 'CLASS', 'classId': self.classroom.id}, 403),
+            (self.students[0], {'scope': 'STUDENT', 'classId': self.classroom.id, 'studentId': other.id}, 403),
+        ]
+        for user, body, code in cases:
+            with self.subTest(body=body):
+                self.assertEqual(self.export(user, **body).status_code, code)
+
+    def test_build_report_is_rewound_spool(self):
+        report = build_report(ExportRequest('CLASS', self.classroom, None))
+        with report:
+            self.assertEqual(report.tell(), 0)
+            self.assertEqual(load_workbook(report, read_only=True).sheetnames[0], 'Сводка')
+
+    def test_human_timedelta(self):
+        self.assertEqual(human_timedelta(timedelta(seconds=42)), '42с')
+        self.assertEqual(human_timedelta(timedelta(minutes=3, seconds=5)), '3м 5с')
+        self.assertEqual(human_timedelta(timedelta(hours=2, minutes=1)), '2ч 1м')
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.test import override_settings
+
+from api.models import Submission
+from api.report_queries import MaterializedReportAggregator, SqlReportAggregator
+from api.submissions import PENDING_FEEDBACK, record_submission
+
+from .base import FortressTestCase
+
+
+class ReportAggregatorTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        first, second = self.assign(self.tasks[0]), self.assign(self.tasks[1])
+        s0, s1, s2 = self.students
+        for student, assignment, answer in [
+            (s0, first, '42'), (s0, first, '42'), (s1, first, '42'), (s1, second, '42'),
+            (s2, first, '41'), (s2, first, ' 41 '), (s2, second, 7), (s0, second, '40'),
+        ]:
+            record_submission(student.id, assignment, {'answer': answer})
+
+    def test_sql_and_materialized_aggregators_agree(self):
+        sql, materialized = SqlReportAggregator(), MaterializedReportAggregator()
+
+        self.assertEqual(sql.team_level_progress(self.classroom), materialized.team_level_progress(self.classroom))
+        self.assertEqual(dict(sql.team_level_progress(self.classroom)), {self.team.id: {1: 2, 2: 1}})
+        self.assertEqual(sql.top_errors(self.classroom, 10), materialized.top_errors(self.classroom, 10))
+        self.assertEqual(sql.top_errors(self.classroom, 1), [{'value': '41', 'count': 2}])
+        self.assertAlmostEqual(
+            sql.avg_solve_time(self.classroom).total_seconds(),
+            materialized.avg_solve_time(self.classroom).total_seconds(),
+            places=3,
+        )
+
+    def test_pending_submissions_are_not_errors(self):
+        # Отложенная проверка: is_correct пока False по умолчанию, checked_at пуст
+        for _ in range(3):
+            Submission.objects.create(assignment=self.assign(self.tasks[0]), student=self.students[0],
+                                      answer_payload={'answer': 'x'}, feedback=PENDING_FEEDBACK)
+
+        for aggregator in (SqlReportAggregator(), MaterializedReportAggregator()):
+            with self.subTest(aggregator=type(aggregator).__name__):
+                self.assertEqual(aggregator.top_errors(self.classroom, 1), [{'value': '41', 'count': 2}])
+
+    def test_overview_is_the_same_for_both_sources(self):
+        client = self.client_for(self.teacher)
+        url = f'/api/reports/class/{self.classroom.id}/overview'
+        responses = {}
+        for source in ('sql', 'materialized'):
+            cache.clear()
+            with override_settings(REPORT_AGGREGATION=source):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses[source] = response.data
+        self.assertEqual(responses['sql']['progressByTeam'], responses['materialized']['progressByTeam'])
+        self.assertEqual(responses['sql']['topErrors'], responses['materialized']['topErrors'])
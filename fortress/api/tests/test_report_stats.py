@@ -0,0 +1,71 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from api.models import ClassReportStat, Submission, TeamLevelSolver, TeamLevelStat, WrongAnswerStat
+from api.report_stats import answer_str, rebuild_report_stats
+from api.submissions import PENDING_FEEDBACK, record_submission
+
+from .base import FortressTestCase
+
+
+class AnswerStrTests(SimpleTestCase):
+    def test_takes_answer_key_or_whole_payload(self):
+        self.assertEqual(answer_str({'answer': ' 41 '}), '41')
+        self.assertEqual(answer_str({'answer': 7}), '7')
+        self.assertEqual(answer_str(' x '), 'x')
+        self.assertEqual(answer_str({'steps': [1]}), "{'steps': [1]}")
+
+
+class ReportStatsTests(FortressTestCase):
+    def submit(self, student, assignment, answer):
+        return record_submission(student.id, assignment, {'answer': answer})
+
+    def stats(self):
+        return {
+            'class': list(ClassReportStat.objects.values_list('classroom_id', 'solve_count')),
+            'levels': sorted(TeamLevelStat.objects.values_list('team_id', 'level', 'solvers', 'solve_count')),
+            'wrong': sorted(WrongAnswerStat.objects.values_list('classroom_id', 'answer', 'count')),
+            'solvers': TeamLevelSolver.objects.count(),
+        }
+
+    def solve_some(self):
+        first, second = self.assign(self.tasks[0]), self.assign(self.tasks[1])
+        s0, s1, s2 = self.students
+        self.submit(s0, first, '42')
+        self.submit(s0, first, '42')        # повторное решение: решивших не прибавляет
+        self.submit(s1, first, ' 42')
+        self.submit(s1, second, '42')
+        self.submit(s2, first, '41')
+        self.submit(s2, first, ' 41 ')      # тот же неверный ответ после обрезки пробелов
+        self.submit(s2, second, {'x': 1})   # составной ответ — строкой
+
+    def test_aggregates_follow_graded_submissions(self):
+        self.solve_some()
+        self.assertEqual(self.stats(), {
+            'class': [(self.classroom.id, 4)],
+            'levels': [(self.team.id, 1, 2, 3), (self.team.id, 2, 1, 1)],
+            'wrong': [(self.classroom.id, '41', 2), (self.classroom.id, "{'x': 1}", 1)],
+            'solvers': 3,
+        })
+
+    def test_rebuild_reproduces_incremental_aggregates(self):
+        self.solve_some()
+        incremental = self.stats()
+        # Ответ с отложенной проверкой в агрегаты не попадает, пока нет вердикта
+        Submission.objects.create(assignment=self.assign(), student=self.students[2],
+                                  answer_payload={'answer': '41'}, feedback=PENDING_FEEDBACK)
+        TeamLevelStat.objects.update(solvers=0, solve_count=0)
+        WrongAnswerStat.objects.all().delete()
+
+        self.assertEqual(rebuild_report_stats(chunk_size=2), 7)
+        self.assertEqual(self.stats(), incremental)
+
+        call_command('rebuild_report_stats', class_id=self.classroom.id, stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_unsolved_team_levels_are_not_created(self):
+        self.submit(self.students[0], self.assign(), 'нет')
+        self.assertFalse(TeamLevelStat.objects.exists())
+        self.assertFalse(ClassReportStat.objects.exists())
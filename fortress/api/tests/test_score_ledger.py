@@ -0,0 +1,154 @@
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.data_version import class_key, versions
+from api.leaderboard import leaderboard
+from api.models import Score
+from api.score_ledger import (
+    ScoreWriteBehindBuffer, _update_or_create, credit_scores, credit_submissions, score_contexts,
+)
+from api.submissions import record_submission
+
+from .base import FortressTestCase
+
+
+class ScoreContextTests(FortressTestCase):
+    def test_contexts_of_team_and_class_assignments(self):
+        self.assertEqual(score_contexts(None, self.team.id, self.classroom.id),
+                         [(None, self.team.id), (self.classroom.id, None), (None, None)])
+        self.assertEqual(score_contexts(self.classroom.id, None), [(self.classroom.id, None), (None, None)])
+        self.assertEqual(score_contexts(None, None), [(None, None)])
+
+
+class ScoreUpsertTests(FortressTestCase):
+    def totals(self):
+        return sorted(Score.objects.values_list('student_id', 'classroom_id', 'team_id', 'total_points'),
+                      key=lambda r: (r[0], r[1] or 0, r[2] or 0))
+
+    def test_upsert_inserts_then_adds_including_null_contexts(self):
+        sid = self.students[0].id
+        keys = [(sid, None, None), (sid, self.classroom.id, None), (sid, None, self.team.id)]
+
+        first = credit_scores({key: 10 for key in keys})
+        second = credit_scores({keys[0]: 5, keys[2]: 0})
+
+        self.assertEqual(sorted(first, key=str), sorted([(*key, 10) for key in keys], key=str))
+        self.assertEqual(second, [(sid, None, None, 15)])
+        self.assertEqual(Score.objects.count(), 3)
+        self.assertEqual(Score.objects.get(student_id=sid, classroom=None, team=None).total_points, 15)
+
+    def test_upsert_is_a_single_statement(self):
+        sid = self.students[0].id
+        credit_scores({(sid, None, None): 1})
+        with self.assertNumQueries(1):
+            credit_scores({(sid, None, None): 1, (sid, self.classroom.id, None): 1, (sid, None, self.team.id): 1})
+
+    def test_fallback_path_matches_upsert(self):
+        deltas = {(s.id, None, None): 7 for s in self.students}
+        credit_scores(deltas)
+        upserted = self.totals()
+        Score.objects.all().delete()
+        _update_or_create(deltas)
+        _update_or_create(deltas)
+        credit_scores(deltas)
+        self.assertEqual(self.totals(), [(sid, c, t, points * 3) for sid, c, t, points in upserted])
+
+    def test_credit_submissions_sums_points_per_context(self):
+        assignment = self.assign()
+        record_submission(self.students[0].id, assignment, {'answer': '42'})
+        record_submission(self.students[0].id, assignment, {'answer': '42'}, attempt_no=2)
+        points = self.tasks[0].max_points
+        self.assertEqual(self.totals(), [
+            (self.students[0].id, None, None, 2 * points),
+            (self.students[0].id, None, self.team.id, 2 * points),
+            (self.students[0].id, self.classroom.id, None, 2 * points),
+        ])
+        self.assertEqual(credit_submissions([]), [])
+
+    def test_leaderboard_gets_totals_after_commit(self):
+        ctx = (self.classroom.id, None)
+        leaderboard.top(ctx, 1)
+        sid = self.students[1].id
+        with self.captureOnCommitCallbacks(execute=True):
+            credit_scores({(sid, self.classroom.id, None): 40})
+            self.assertEqual(leaderboard.top(ctx, 1), [])
+        self.assertEqual(leaderboard.top(ctx, 1), [(sid, 40)])
+
+
+class MergeDuplicateScoresMigrationTests(TransactionTestCase):
+    before = [('api', '0005_score_rank_indexes')]
+    after = [('api', '0006_score_ctx_unique')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_with_null_context_are_merged(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        old_apps = executor.loader.project_state(self.before).apps
+        User = old_apps.get_model('api', 'User')
+        Score = old_apps.get_model('api', 'Score')
+        student = User.objects.create(username='dup', role='STUDENT')
+        other = User.objects.create(username='single', role='STUDENT')
+        Score.objects.create(student=student, total_points=10)
+        Score.objects.create(student=student, total_points=5)
+        Score.objects.create(student=other, total_points=1)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+
+        new_apps = executor.loader.project_state(self.after).apps
+        rows = new_apps.get_model('api', 'Score').objects.order_by('student_id')
+        self.assertEqual([(r.student_id, r.total_points) for r in rows], [(student.id, 15), (other.id, 1)])
+
+
+class WriteBehindBufferTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = ScoreWriteBehindBuffer(flush_interval=3600, max_pending=100)
+        # Фоновый поток не нужен: flush() вызываем сами
+        self.buffer._ensure_started = lambda: None
+        self.sid = self.students[0].id
+
+    def test_credit_is_buffered_until_flush(self):
+        key = (self.sid, self.classroom.id, None)
+        with mock.patch('api.score_ledger.score_buffer', self.buffer):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(credit_scores({key: 10}), [])
+            with self.captureOnCommitCallbacks(execute=True):
+                credit_scores({key: 5, (self.sid, None, None): 5})
+
+        self.assertFalse(Score.objects.exists())
+        self.assertEqual(self.buffer.pending(), 2)
+        version = versions([class_key(self.classroom.id)])[class_key(self.classroom.id)]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.buffer.flush()
+        executed = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(executed), 2)  # upsert очков + версия класса
+
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(Score.objects.get(student_id=self.sid, classroom=self.classroom).total_points, 15)
+        self.assertEqual(versions([class_key(self.classroom.id)])[class_key(self.classroom.id)], version + 1)
+
+    def test_failed_flush_keeps_deltas(self):
+        key = (self.sid, None, None)
+        self.buffer.add({key: 3})
+        with mock.patch('api.score_ledger._apply', side_effect=DatabaseError('locked')), \
+                self.assertLogs('api.score_ledger', 'ERROR'):
+            self.buffer.flush()
+        self.buffer.add({key: 4})
+        self.assertEqual(self.buffer.pending(), 1)
+        self.buffer.flush()
+        self.assertEqual(Score.objects.get(student_id=self.sid).total_points, 7)
+
+    def test_discard_drops_pending(self):
+        self.buffer.add({(self.sid, None, None): 3})
+        self.buffer.discard()
+        self.buffer.flush()
+        self.assertFalse(Score.objects.exists())
@@ -0,0 +1,103 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+
+from api.models import Classroom, Score, Team
+from api.score_reconcile import reconcile_scores
+from api.submissions import record_submission
+
+from .base import FortressTestCase
+
+
+class ReconcileScoresTests(FortressTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_class = Classroom.objects.create(name='8Б', teacher=cls.teacher, code='EIGHT-B')
+        cls.other_team = Team.objects.create(classroom=cls.other_class, name='Бета')
+
+    def setUp(self):
+        super().setUp()
+        s0, s1, _ = self.students
+        team_task, class_task = self.assign(self.tasks[0]), self.assign(self.tasks[1], classroom=self.classroom)
+        other_task = self.assign(self.tasks[2], team=self.other_team)
+        record_submission(s0.id, team_task, {'answer': '42'})
+        record_submission(s0.id, class_task, {'answer': '42'})
+        record_submission(s1.id, team_task, {'answer': '41'})
+        record_submission(s1.id, other_task, {'answer': '42'})
+        self.correct = self.totals()
+
+    def totals(self):
+        return sorted(
+            (s, c or 0, t or 0, p)
+            for s, c, t, p in Score.objects.values_list('student_id', 'classroom_id', 'team_id', 'total_points')
+        )
+
+    def corrupt(self):
+        """Одна строка с неверной суммой, одна пропавшая, одна лишняя."""
+        s0, s1, s2 = self.students
+        Score.objects.filter(student=s0, classroom=None, team=None).update(total_points=999)
+        Score.objects.filter(student=s0, classroom=self.classroom, team=None).delete()
+        Score.objects.create(student=s2, team=self.team, total_points=5)
+
+    def test_consistent_scores_are_left_alone(self):
+        stats = reconcile_scores()
+        self.assertEqual((stats['updated'], stats['created']), (0, 0))
+        self.assertEqual(stats['students'], 2)
+        self.assertEqual(self.totals(), self.correct)
+
+    def test_repairs_wrong_missing_and_stray_rows(self):
+        self.corrupt()
+
+        stats = reconcile_scores(chunk_size=1)
+
+        self.assertEqual(stats['students'], 3)
+        self.assertEqual((stats['updated'], stats['created']), (2, 1))
+        stray = Score.objects.get(student=self.students[2], team=self.team)
+        self.assertEqual(stray.total_points, 0)
+        self.assertEqual([row for row in self.totals() if row[3]], self.correct)
+
+    def test_dry_run_only_counts(self):
+        self.corrupt()
+        before = self.totals()
+
+        stats = reconcile_scores(dry_run=True)
+
+        self.assertEqual((stats['updated'], stats['created']), (2, 1))
+        self.assertEqual(self.totals(), before)
+
+    def test_team_scope_touches_only_team_context(self):
+        s0 = self.students[0]
+        Score.objects.filter(student=s0, team=self.team).update(total_points=0)
+        Score.objects.filter(student=s0, classroom=None, team=None).update(total_points=999)
+
+        reconcile_scores(team_id=self.team.id)
+
+        self.assertEqual(Score.objects.get(student=s0, team=self.team).total_points, 10)
+        self.assertEqual(Score.objects.get(student=s0, classroom=None, team=None).total_points, 999)
+
+    def test_class_scope_includes_its_teams_but_not_global(self):
+        s0, s1, _ = self.students
+        Score.objects.filter(student=s0, team=self.team).update(total_points=0)
+        Score.objects.filter(student=s1, team=self.other_team).update(total_points=0)
+        Score.objects.filter(student=s0, classroom=None, team=None).update(total_points=999)
+
+        reconcile_scores(classroom_id=self.classroom.id)
+
+        self.assertEqual(Score.objects.get(student=s0, team=self.team).total_points, 10)
+        self.assertEqual(Score.objects.get(student=s1, team=self.other_team).total_points, 0)
+        self.assertEqual(Score.objects.get(student=s0, classroom=None, team=None).total_points, 999)
+
+    def test_command(self):
+        self.corrupt()
+        out = StringIO()
+
+        call_command('rebuild_scores', '--chunk-size', '2', stdout=out)
+
+        self.assertIn('2/3 студентов', out.getvalue())
+        self.assertIn('расхождений 2, недостающих 1', out.getvalue())
+        self.assertEqual([row for row in self.totals() if row[3]], self.correct)
+
+    def test_command_rejects_both_scopes(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_scores', class_id=self.classroom.id, team_id=self.team.id, stdout=StringIO())
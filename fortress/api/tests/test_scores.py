@@ -0,0 +1,55 @@
+from api.models import Score, User
+
+from .base import PASSWORD, FortressTestCase
+
+SCORES_URL = '/api/scores/'
+
+
+class ScoreListTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.teacher)
+        self.global_ids = []
+        for i in range(7):
+            student = User.objects.create_user(f'scored{i}', password=PASSWORD, role=User.Role.STUDENT)
+            # Равные очки у соседей: курсор должен различать их по id
+            self.global_ids.append(Score.objects.create(student=student, total_points=100 - 10 * (i // 2)).id)
+        self.class_score = Score.objects.create(student=self.students[0], classroom=self.classroom, total_points=5)
+        self.team_score = Score.objects.create(student=self.students[0], team=self.team, total_points=3)
+
+    def collect(self, params):
+        """Пройти все страницы по ссылкам next; вернуть id по порядку."""
+        ids, response = [], self.client.get(SCORES_URL, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_filters_by_context(self):
+        self.assertEqual(self.collect({'classId': self.classroom.id})[0], [self.class_score.id])
+        self.assertEqual(self.collect({'teamId': self.team.id})[0], [self.team_score.id])
+        ids, _ = self.collect({'context': 'global', 'pageSize': 100, 'count': 'false'})
+        self.assertEqual(set(ids), set(self.global_ids))
+
+    def test_keyset_pages_cover_the_ranking_in_order(self):
+        expected = list(
+            Score.objects.filter(classroom=None, team=None).order_by('-total_points', '-id').values_list('id', flat=True)
+        )
+        ids, last = self.collect({'mode': 'leaderboard', 'pageSize': 3})
+        self.assertEqual(ids, expected)
+        self.assertNotIn('count', last.data)
+
+        back = self.client.get(last.data['previous'])
+        self.assertEqual([row['id'] for row in back.data['results']], expected[3:6])
+
+    def test_no_count_pages(self):
+        response = self.client.get(SCORES_URL, {'context': 'global', 'count': 'false', 'pageSize': 5})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(SCORES_URL, {'classId': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(SCORES_URL, {'mode': 'leaderboard', 'cursor': '!!'}).status_code, 404)
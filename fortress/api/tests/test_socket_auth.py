@@ -0,0 +1,89 @@
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+
+from api.models import Battle, Classroom, Team, User
+from battles.middleware import _resolve, _token_from_scope
+from fortress.routing import application
+
+from .base import PASSWORD, FortressTestCase, FortressTransactionTestCase, access_token
+
+
+class TokenFromScopeTests(FortressTestCase):
+    def test_sources(self):
+        self.assertEqual(_token_from_scope({'query_string': b'token=abc'}), ('abc', None))
+        self.assertEqual(_token_from_scope({'query_string': b'access_token=abc'}), ('abc', None))
+        self.assertEqual(_token_from_scope({'subprotocols': ['bearer', 'xyz'], 'query_string': b'token=abc'}),
+                         ('xyz', 'bearer'))
+        self.assertEqual(_token_from_scope({'subprotocols': ['bearer']}), (None, None))
+        self.assertEqual(_token_from_scope({}), (None, None))
+
+    def test_resolve_is_one_query(self):
+        token = access_token(self.students[0])
+        with self.assertNumQueries(1):  # пользователь из claims, запрос — только команды
+            user, team_ids = _resolve(token)
+        self.assertEqual((user.id, team_ids), (self.students[0].id, frozenset({self.team.id})))
+
+    def test_resolve_by_role(self):
+        staff = User.objects.create_user('admin', password=PASSWORD, role=User.Role.TEACHER, is_staff=True)
+        other_class = Classroom.objects.create(name='8Б', teacher=staff, code='EIGHT-B')
+        other_team = Team.objects.create(classroom=other_class, name='Бета')
+
+        self.assertEqual(_resolve(access_token(self.teacher))[1], frozenset({self.team.id}))
+        self.assertEqual(_resolve(access_token(staff))[1], frozenset({other_team.id}))
+        user, team_ids = _resolve('not-a-token')
+        self.assertIsInstance(user, AnonymousUser)
+        self.assertEqual(team_ids, frozenset())
+
+
+class SocketAuthTests(FortressTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.battle = Battle.objects.create(team=self.team, started_by=self.teacher)
+
+    def connect(self, path=None, subprotocols=None):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, path or f'/ws/battle/{self.battle.id}/',
+                                                 subprotocols=subprotocols)
+            connected, detail = await communicator.connect()
+            first = await communicator.receive_json_from() if connected else None
+            await communicator.disconnect()
+            return connected, detail, first
+
+        return async_to_sync(scenario)()
+
+    def test_member_and_teacher_connect(self):
+        for user in (self.students[0], self.teacher):
+            with self.subTest(user=user.username):
+                connected, _, first = self.connect(f'/ws/battle/{self.battle.id}/?token={access_token(user)}')
+                self.assertTrue(connected)
+                self.assertEqual(first['type'], 'connection_success')
+
+    def test_bearer_subprotocol(self):
+        connected, subprotocol, _ = self.connect(subprotocols=['bearer', access_token(self.students[0])])
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'bearer')
+
+    def test_unauthenticated_is_closed_with_4401(self):
+        blocked = self.students[1]
+        token = access_token(blocked)
+        blocked.is_active = False
+        blocked.save()
+        for path in (f'/ws/battle/{self.battle.id}/',
+                     f'/ws/battle/{self.battle.id}/?token=garbage',
+                     f'/ws/battle/{self.battle.id}/?token={token}'):
+            with self.subTest(path=path[:40]):
+                self.assertEqual(self.connect(path)[:2], (False, 4401))
+
+    def test_foreign_or_missing_battle_is_closed_with_4403(self):
+        outsider = User.objects.create_user('outsider', password=PASSWORD, role=User.Role.STUDENT)
+        other_teacher = User.objects.create_user('teacher2', password=PASSWORD, role=User.Role.TEACHER)
+        cases = [
+            (outsider, self.battle.id),
+            (other_teacher, self.battle.id),
+            (self.students[0], 10 ** 6),
+        ]
+        for user, battle_id in cases:
+            with self.subTest(user=user.username, battle=battle_id):
+                path = f'/ws/battle/{battle_id}/?token={access_token(user)}'
+                self.assertEqual(self.connect(path)[:2], (False, 4403))
@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.grading_pool import grading_executor
+from api.models import Battle, Score, Submission
+from api.submissions import record_submission
+
+from .base import FortressTestCase, FortressTransactionTestCase
+
+BATCH_URL = '/api/submissions/batch/'
+
+
+class SubmissionBatchTests(FortressTestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = self.students[0]
+        self.client = self.client_for(self.student)
+        self.assignments = [self.assign(task) for task in self.tasks]
+
+    def post_batch(self, items):
+        return self.client.post(BATCH_URL, {'submissions': items}, format='json')
+
+    def items(self, *answers):
+        return [
+            {'assignment': a.id, 'answer_payload': {'answer': answer}}
+            for a, answer in zip(self.assignments, answers)
+        ]
+
+    def test_grades_every_item_and_credits_scores_once_per_context(self):
+        response = self.post_batch(self.items('42', '41', ' 42 '))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['is_correct'] for row in response.data], [True, False, True])
+        self.assertEqual(Submission.objects.filter(student=self.student, checked_at__isnull=False).count(), 3)
+
+        totals = dict(
+            ((s.classroom_id, s.team_id), s.total_points) for s in Score.objects.filter(student=self.student)
+        )
+        points = sum(row['points_awarded'] for row in response.data)
+        self.assertGreater(points, 0)
+        self.assertEqual(totals, {
+            (None, self.team.id): points,
+            (self.classroom.id, None): points,
+            (None, None): points,
+        })
+
+    def test_accepts_bare_list(self):
+        response = self.client.post(BATCH_URL, self.items('42'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 1)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post_batch(self.items('42')).status_code, 201)
+        more = [self.assign(self.tasks[i % 3]) for i in range(9)]
+        items = [{'assignment': a.id, 'answer_payload': {'answer': str(i)}} for i, a in enumerate(more)]
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post_batch(items).status_code, 201)
+        self.assertLessEqual(len(large), len(small))
+
+    def test_unknown_assignment_rejects_whole_batch(self):
+        items = self.items('42') + [{'assignment': 999999, 'answer_payload': {'answer': '42'}}]
+        response = self.post_batch(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['assignments'], [999999])
+        self.assertFalse(Submission.objects.exists())
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post_batch([]).status_code, 400)
+        with override_settings(SUBMISSION_BATCH_MAX=2):
+            self.assertEqual(self.post_batch(self.items('1', '2', '3')).status_code, 400)
+        self.assertFalse(Submission.objects.exists())
+
+    def test_invalid_item_is_rejected(self):
+        response = self.post_batch([{'assignment': 'abc', 'answer_payload': {'answer': '42'}}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_students_can_submit(self):
+        response = self.client_for(self.teacher).post(BATCH_URL, {'submissions': self.items('42')}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class GradingOutsideTransactionTests(FortressTransactionTestCase):
+    """Ответ проверяется до транзакции: строка битвы не заблокирована на время проверки."""
+
+    def setUp(self):
+        super().setUp()
+        battle = Battle.objects.create(team=self.team, started_by=self.teacher)
+        self.assignment = self.assign(battle=battle)
+
+    def outside_transaction(self, grade):
+        def check(*args):
+            self.assertFalse(connection.in_atomic_block)
+            return grade(*args)
+        return mock.patch.object(grading_executor, grade.__name__, side_effect=check)
+
+    def test_batch(self):
+        with self.outside_transaction(grading_executor.grade_many) as grade_many:
+            response = self.client_for(self.students[0]).post(BATCH_URL, {'submissions': [
+                {'assignment': self.assignment.id, 'answer_payload': {'answer': '42'}},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(grade_many.call_count, 1)
+        self.assertTrue(Submission.objects.get().is_correct)
+
+    def test_single_submission(self):
+        with self.outside_transaction(grading_executor.grade) as grade:
+            submission = record_submission(self.students[0].id, self.assignment, {'answer': '42'})
+
+        self.assertEqual(grade.call_count, 1)
+        self.assertTrue(submission.is_correct)
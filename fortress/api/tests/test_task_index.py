@@ -0,0 +1,59 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from api.models import Task, level_from_tags, levels_from_tags
+from api.task_index import task_index
+
+from .base import FortressTestCase
+
+task_level_migration = import_module('api.migrations.0003_task_level')
+
+
+class LevelTagTests(SimpleTestCase):
+    def test_levels_from_tags(self):
+        self.assertEqual(levels_from_tags(['algebra', 'L3', ' l5 ', 'L3', 'Lx']), [3, 5])
+        self.assertEqual(levels_from_tags(None), [])
+        self.assertEqual(level_from_tags(['geometry', 'L2', 'L4']), 2)
+        self.assertIsNone(level_from_tags(['geometry']))
+
+
+class TaskLevelTests(FortressTestCase):
+    def test_level_column_follows_tags(self):
+        task = self.tasks[0]
+        self.assertEqual(task.level, 1)
+        task.tags = ['L7']
+        task.save(update_fields=['tags'])
+        self.assertEqual(Task.objects.get(id=task.id).level, 7)
+
+    def test_migration_backfills_level_from_first_tag(self):
+        Task.objects.create(title='Две', body_md='-', tags=['x', 'L4', 'L6'])
+        Task.objects.update(level=None)
+        task_level_migration.fill_task_level(apps, None)
+        self.assertEqual(sorted(Task.objects.values_list('level', flat=True)), [1, 2, 3, 4])
+
+
+class TaskLevelIndexTests(FortressTestCase):
+    def test_picks_newest_task_of_level(self):
+        newer = Task.objects.create(title='Новее', body_md='-', tags=['L2'])
+        self.assertEqual(task_index.pick(2), newer.id)
+        self.assertEqual(task_index.pick(1), self.tasks[0].id)
+
+    def test_task_is_available_at_each_of_its_levels(self):
+        multi = Task.objects.create(title='L5 и L8', body_md='-', tags=['L5', 'L8'])
+        self.assertEqual(task_index.pick(5), multi.id)
+        self.assertEqual(task_index.pick(8), multi.id)
+
+    def test_falls_back_to_neighbour_levels_then_difficulty(self):
+        self.assertEqual(task_index.pick(4), self.tasks[2].id)    # L4 нет → L5? нет → L3
+        self.assertEqual(task_index.pick(6), self.tasks[2].id)    # в радиусе 3
+        hard = Task.objects.create(title='Без уровня', body_md='-', difficulty=Task.Difficulty.HARD)
+        self.assertEqual(task_index.pick(20), hard.id)
+
+    def test_saving_a_task_invalidates_index(self):
+        self.assertEqual(task_index.pick(9), None)
+        task = self.tasks[0]
+        task.tags = ['L9']
+        task.save()
+        self.assertEqual(task_index.pick(9), task.id)
@@ -0,0 +1,75 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.checkers import ExactChecker
+from api.grading import VERDICT_CACHE_MAX_ANSWER, GradeResult, VerdictCache, grade_answer, verdict_cache
+from api.models import Task
+
+from .base import FortressTestCase
+
+CORRECT = GradeResult(True, 'Верно!', 10)
+
+
+class VerdictCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.task = Task(pk=1, title='Задача', expected_answer='42')
+        self.cache = VerdictCache(maxsize=2)
+
+    def test_key_normalizes_payload_and_whitespace(self):
+        self.cache.put(self.task, {'answer': ' 42 '}, CORRECT)
+        self.assertEqual(self.cache.get(self.task, '42'), CORRECT)
+        self.assertIsNone(self.cache.get(self.task, {'answer': 42}))  # другое значение в JSON
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_unsaved_task_and_long_answers_are_not_cached(self):
+        unsaved = Task(title='Черновик', expected_answer='42')
+        self.cache.put(unsaved, '42', CORRECT)
+        long_answer = 'x' * (VERDICT_CACHE_MAX_ANSWER + 1)
+        self.cache.put(self.task, long_answer, CORRECT)
+        self.assertIsNone(self.cache.get(unsaved, '42'))
+        self.assertIsNone(self.cache.get(self.task, long_answer))
+
+    def test_lru_eviction(self):
+        self.cache.put(self.task, 'a', CORRECT)
+        self.cache.put(self.task, 'b', CORRECT)
+        self.cache.get(self.task, 'a')
+        self.cache.put(self.task, 'c', CORRECT)
+        self.assertIsNotNone(self.cache.get(self.task, 'a'))
+        self.assertIsNone(self.cache.get(self.task, 'b'))
+
+    def test_invalidate_drops_only_that_task(self):
+        other = Task(pk=2, title='Другая', expected_answer='42')
+        self.cache.put(self.task, '42', CORRECT)
+        self.cache.put(other, '42', CORRECT)
+        self.cache.invalidate(self.task.pk)
+        self.assertIsNone(self.cache.get(self.task, '42'))
+        self.assertEqual(self.cache.get(other, '42'), CORRECT)
+
+
+class GradeAnswerMemoTests(FortressTestCase):
+    def test_repeated_answer_skips_checker(self):
+        task = self.tasks[0]
+        with mock.patch.object(ExactChecker, 'check', autospec=True, return_value=True) as check:
+            first = grade_answer(task, {'answer': '42'})
+            second = grade_answer(task, {'answer': '42 '})
+        self.assertEqual(first, second)
+        self.assertEqual(check.call_count, 1)
+
+    def test_task_save_invalidates_verdicts(self):
+        task = self.tasks[0]
+        self.assertTrue(grade_answer(task, '42').is_correct)
+
+        task.expected_answer = '43'
+        task.save()
+
+        self.assertIsNone(verdict_cache.get(task, '42'))
+        self.assertFalse(grade_answer(task, '42').is_correct)
+
+    def test_new_task_version_misses_even_without_signal(self):
+        task = self.tasks[0]
+        grade_answer(task, '42')
+        # update() не шлёт post_save: спасает только новый updated_at в ключе
+        Task.objects.filter(pk=task.pk).update(expected_answer='43', updated_at=task.updated_at.replace(year=2100))
+        task.refresh_from_db()
+        self.assertFalse(grade_answer(task, '42').is_correct)
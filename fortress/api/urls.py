@@ -1,15 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .report_views import ClassOverviewReportView, StudentReportView, ReportExportView
+from .report_views import (
+    ClassOverviewReportView, StudentReportView, ReportExportView, ExportJobView, ExportJobDownloadView,
+    DataExportView,
+)
 
+from .metrics import metrics_view
 from .views import (
     RegisterViewSet,
     ClassroomViewSet, TeamViewSet,
     TaskViewSet, AssignmentViewSet,
     SubmissionViewSet, ScoreViewSet,
-    BattleView
+    BattleView, BattleDetailView, BattleCloseView, LeaderboardView
 )
+from .models import Battle
 
 router = DefaultRouter()
 # Регистрация
@@ -35,7 +40,19 @@ urlpatterns = [
 
     # Запуск битвы (массовая выдача задач)
     path('battles/launch', BattleView.as_view(), name='battle_launch'),
+    path('battles/<int:battle_id>', BattleDetailView.as_view(), name='battle_detail'),
+    path('battles/<int:battle_id>/finish', BattleCloseView.as_view(target_status=Battle.Status.FINISHED),
+         name='battle_finish'),
+    path('battles/<int:battle_id>/cancel', BattleCloseView.as_view(target_status=Battle.Status.CANCELLED),
+         name='battle_cancel'),
+    path('leaderboard', LeaderboardView.as_view(), name='leaderboard'),
     path('reports/class/<int:class_id>/overview', ClassOverviewReportView.as_view(), name='report_class_overview'),
     path('reports/student/<int:student_id>', StudentReportView.as_view(), name='report_student'),
     path('reports/export', ReportExportView.as_view(), name='report_export'),
+    path('reports/export/jobs/<int:job_id>', ExportJobView.as_view(), name='report_export_job'),
+    path('reports/export/jobs/<int:job_id>/download', ExportJobDownloadView.as_view(), name='report_export_download'),
+    path('exports/<str:dataset>', DataExportView.as_view(), name='data_export'),
+
+    # Метрики процесса в формате Prometheus (api/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
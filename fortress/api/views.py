@@ -1,19 +1,20 @@
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from typing import Optional, List
-from django.db import transaction, models
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from collections import defaultdict
+from typing import Optional, List, Dict, Tuple
+from django.conf import settings
+from django.db import IntegrityError, transaction, models
 from rest_framework.views import APIView
 
 from .models import (
     Classroom, ClassMembership,
     Team, TeamMembership,
-    Task, Assignment,
+    Task, Assignment, Battle,
     Submission, Score
 )
 from .serializers import (
@@ -21,9 +22,18 @@ from .serializers import (
     ClassroomSerializer, ClassMembershipSerializer,
     TeamSerializer, TeamMembershipSerializer,
     TaskSerializer, AssignmentSerializer,
-    SubmissionSerializer, ScoreSerializer
+    SubmissionSerializer, SubmissionBatchItemSerializer, ScoreSerializer
 )
+from .pagination import ScoreKeysetPagination, NoCountPageNumberPagination
 from .permissions import IsTeacher, IsStudent
+from .grading_pool import grading_executor
+from .battle_state import BattleStateError, check_accepts_answers, close_battle, live_battles, publish_graded
+from .submissions import record_submission
+from .score_ledger import credit_submissions
+from .report_stats import record_graded
+from .task_index import task_index
+from .leaderboard import leaderboard
+from .data_version import TASKS_KEY, bump_classes, make_etag, not_modified, versions, with_etag
 
 User = get_user_model()
 
@@ -178,6 +188,7 @@ class TeamViewSet(viewsets.ModelViewSet):
             role = 'CAPTAIN' if (captain_id and sid == int(captain_id)) else 'MEMBER'
             members_to_create.append(TeamMembership(team=team, student_id=sid, role_in_team=role))
         TeamMembership.objects.bulk_create(members_to_create)
+        bump_classes([team.classroom_id])
 
         return Response({'detail': 'Состав обновлён', 'count': len(members_to_create)}, status=200)
 
@@ -204,6 +215,21 @@ class TaskViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return [IsAuthenticated(), IsTeacher()]
 
+    # Чтение с ETag от версии банка задач (api/data_version.py): пока задачи
+    # не менялись, клиент получает 304 без запроса к таблице задач
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, lambda: super(TaskViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, lambda: super(TaskViewSet, self).retrieve(request, *args, **kwargs))
+
+    def _conditional(self, request, render):
+        etag = make_etag('tasks', versions([TASKS_KEY])[TASKS_KEY], request.build_absolute_uri())
+        response = not_modified(request, etag) or render()
+        if response.status_code in (200, 304):
+            with_etag(response, etag)
+        return response
+
 
 class AssignmentViewSet(viewsets.ModelViewSet):
     """
@@ -215,17 +241,6 @@ class AssignmentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsTeacher]
 
 
-class ScoreViewSet(mixins.ListModelMixin,
-                   mixins.RetrieveModelMixin,
-                   viewsets.GenericViewSet):
-    """
-    Просмотр очков (по умолчанию — сортировка по убыванию total_points).
-    """
-    queryset = Score.objects.select_related('student', 'team', 'classroom').all().order_by('-total_points')
-    serializer_class = ScoreSerializer
-    permission_classes = [IsAuthenticated]
-
-
 
 # -----------------------------
 # Отправка решения и начисление очков
@@ -256,111 +271,94 @@ class SubmissionViewSet(mixins.CreateModelMixin,
             return [IsAuthenticated(), IsStudent()]
         return super().get_permissions()
 
-    @transaction.atomic
     def perform_create(self, serializer):
-        # 1) Сохраняем отправку
-        submission: Submission = serializer.save()
+        data = serializer.validated_data
 
-        # 2) Безопасность: студент может отправлять ответы ТОЛЬКО за себя
-        if submission.student_id != self.request.user.id:
+        # Безопасность: студент может отправлять ответы ТОЛЬКО за себя
+        if data['student'].id != self.request.user.id:
             # можно ещё строго запретить передачу student в body и подставлять request.user
-            raise PermissionError("Нельзя отправлять ответ от имени другого пользователя")
-
-        # 3) Простейшая проверка (замените на ваш чекер)
-        task = submission.assignment.task
-        expected = (task.expected_answer or '').strip()
-
-        payload = submission.answer_payload
-        if isinstance(payload, dict) and 'answer' in payload:
-            value = str(payload['answer']).strip()
-        else:
-            value = str(payload).strip()
+            raise PermissionDenied("Нельзя отправлять ответ от имени другого пользователя")
+
+        # Проверка, начисление очков и рассылка — в api/submissions.py (общий код с сокетом битвы).
+        # Дорогие проверки не ждём: вердикт допишется в Submission после проверки в пуле процессов
+        serializer.instance = record_submission(
+            student_id=self.request.user.id,
+            assignment=data['assignment'],
+            answer_payload=data.get('answer_payload', {}),
+            attempt_no=data.get('attempt_no', 1),
+            defer=True,
+        )
 
-        is_correct = False
-        feedback = ''
-        points = 0
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if response.data.get('checked_at') is None:
+            # Ответ принят, проверка ещё идёт: результат — GET /api/submissions/{id}
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
 
-        if expected:
-            is_correct = (value == expected)
-            feedback = 'Верно!' if is_correct else f'Неверно. Ожидается: {expected}'
-        else:
-            # Если solution_spec, тут может быть сложная проверка
-            feedback = 'Ответ принят. Настроек проверки нет (expected_answer пуст).'
-
-        if is_correct:
-            # Базовое начисление: максимум из задачи
-            # Можно модифицировать формулой (за попытки/скорость/стрейки и т.д.)
-            points = int(task.max_points)
-
-        # 4) Обновляем сам Submission
-        submission.is_correct = is_correct
-        submission.feedback = feedback
-        submission.checked_at = timezone.now()
-        submission.points_awarded = points
-        submission.save(update_fields=['is_correct', 'feedback', 'checked_at', 'points_awarded'])
-
-        # 5) Начисляем очки студенту в контексте команды (и/или класса/глобально)
-        self._bump_score(student_id=submission.student_id,
-                         classroom_id=submission.assignment.classroom_id,
-                         team_id=submission.assignment.team_id,
-                         delta_points=points)
-
-        # --- Отправка обновления через сокеты ---
-        # Получаем battle_id (если есть связь с битвой)
-        # В данной структуре Assignment не содержит battle, поэтому используем team_id как идентификатор битвы
-        battle_id = submission.assignment.team_id
-        if battle_id:
-            channel_layer = get_channel_layer()
-            payload = {
-                "type": "battle.update",
-                "message": {
-                    "student_id": submission.student_id,
-                    "points": points,
-                    "is_correct": is_correct,
-                    "feedback": feedback
-                }
-            }
-            async_to_sync(channel_layer.group_send)(f"battle_{battle_id}", payload)
-
-    # --- helpers ---
-
-    def _bump_score(self, student_id: int, classroom_id: Optional[int], team_id: Optional[int], delta_points: int):
+    @action(methods=['post'], detail=False, url_path='batch', permission_classes=[IsAuthenticated, IsStudent])
+    def batch(self, request):
         """
-        Обновляет агрегат Score. Используем UPDATE с F-выражением для атомарности.
-        (Если записи нет — создаём с нулём, затем инкрементим.)
+        POST /api/submissions/batch
+        {
+          "submissions": [
+            {"assignment": 1001, "answer_payload": {"answer": "42"}, "attempt_no": 1},
+            ...
+          ]
+        }
+        Пакетная отправка для битв: ответы проверяются сразу (дорогие — параллельно в пуле процессов),
+        пишутся одним bulk_create, очки по всем контекстам начисляются
+        одним upsert, а обновления битв уходят в outbox одной пачкой на группу.
+        Проверка идёт до транзакции: строки битв блокируются только на запись.
         """
-        if delta_points == 0:
-            return
-
-        # Пробуем обновить существующую
-        updated = Score.objects.filter(
-            student_id=student_id,
-            classroom_id=classroom_id,
-            team_id=team_id
-        ).update(
-            total_points=models.F('total_points') + delta_points,
-            last_update=timezone.now()
+        items = request.data.get('submissions') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Требуется непустой список submissions'}, status=400)
+
+        max_items = getattr(settings, 'SUBMISSION_BATCH_MAX', 500)
+        if len(items) > max_items:
+            return Response({'detail': f'Не больше {max_items} ответов за раз'}, status=400)
+
+        serializer = SubmissionBatchItemSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+
+        # Все задания (вместе с задачами) — одним запросом
+        assignment_ids = {r['assignment'] for r in rows}
+        assignments = Assignment.objects.select_related('task', 'team').in_bulk(assignment_ids)
+        missing = sorted(assignment_ids - set(assignments))
+        if missing:
+            return Response({'detail': 'Задания не найдены', 'assignments': missing}, status=400)
+
+        # Дешёвые проверки — сразу, дорогие — параллельно в пуле процессов
+        results = grading_executor.grade_many(
+            [(assignments[row['assignment']].task, row['answer_payload']) for row in rows]
         )
 
-        if updated == 0:
-            # Создадим запись, затем ещё раз инкрементим, чтобы не потерять очки в гонке
-            Score.objects.create(
-                student_id=student_id,
-                classroom_id=classroom_id,
-                team_id=team_id,
-                total_points=0,
-                last_update=timezone.now()
-            )
-            Score.objects.filter(
+        student_id = request.user.id
+        now = timezone.now()
+        submissions: List[Submission] = []
+        for row, (is_correct, feedback, points) in zip(rows, results):
+            assignment = assignments[row['assignment']]
+            submissions.append(Submission(
+                assignment=assignment,
                 student_id=student_id,
-                classroom_id=classroom_id,
-                team_id=team_id
-            ).update(
-                total_points=models.F('total_points') + delta_points,
-                last_update=timezone.now()
-            )
-
-
+                answer_payload=row['answer_payload'],
+                attempt_no=row['attempt_no'],
+                is_correct=is_correct,
+                feedback=feedback,
+                checked_at=now,
+                points_awarded=points,
+            ))
+
+        with transaction.atomic():
+            check_accepts_answers(assignments.values())
+            Submission.objects.bulk_create(submissions)
+            record_graded(submissions)
+            credit_submissions(submissions)
+            publish_graded(submissions)
+
+        return Response(SubmissionSerializer(submissions, many=True).data, status=status.HTTP_201_CREATED)
 
 # -----------------------------
 # Счета (только просмотр)
@@ -368,90 +366,331 @@ class SubmissionViewSet(mixins.CreateModelMixin,
 class ScoreViewSet(mixins.ListModelMixin,
                    mixins.RetrieveModelMixin,
                    viewsets.GenericViewSet):
-    queryset = Score.objects.select_related('student', 'classroom', 'team').all().order_by('-total_points')
+    """
+    Просмотр очков (сортировка по убыванию total_points, затем id).
+    GET /api/scores?classId=45 — рейтинг класса (team=NULL)
+    GET /api/scores?teamId=123 — рейтинг команды
+    GET /api/scores?context=global — глобальный рейтинг (класс и команда пустые)
+    Режим рейтинга: ?mode=leaderboard — keyset-пагинация по курсору (next/previous),
+      без COUNT(*) и OFFSET; без фильтров — глобальный контекст.
+    ?count=false — обычные страницы, но без подсчёта общего числа строк.
+    """
+    queryset = Score.objects.select_related('student', 'classroom', 'team').all().order_by('-total_points', '-id')
     serializer_class = ScoreSerializer
     permission_classes = [IsAuthenticated]
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('mode') == 'leaderboard':
+                self._paginator = ScoreKeysetPagination()
+            elif params.get('count') in ('false', '0'):
+                self._paginator = NoCountPageNumberPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action != 'list':
+            return qs
+        params = self.request.query_params
+        try:
+            class_id = _int_or_none(params.get('classId'))
+            team_id = _int_or_none(params.get('teamId'))
+        except ValueError:
+            raise ValidationError({'detail': 'classId и teamId должны быть целыми числами'})
+
+        if team_id is not None:
+            qs = qs.filter(team_id=team_id)
+            if class_id is not None:
+                qs = qs.filter(classroom_id=class_id)
+        elif class_id is not None:
+            qs = qs.filter(classroom_id=class_id, team__isnull=True)
+        elif params.get('context') == 'global' or params.get('mode') == 'leaderboard':
+            qs = qs.filter(classroom__isnull=True, team__isnull=True)
+        return qs
+
+
+# -----------------------------
+# Рейтинг: топ и соседи по месту
+# -----------------------------
+class LeaderboardView(APIView):
+    """
+    GET /api/leaderboard?classId=45[&teamId=123][&top=10][&around=7&radius=2]
+    Без classId/teamId — глобальный рейтинг.
+    → {"top": [{"rank", "studentId", "username", "points"}],
+       "me": {"studentId", "rank"}, "around": [...]}
+    Студент видит рейтинг своего класса/команды, учитель — своих классов.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            class_id = _int_or_none(request.query_params.get('classId'))
+            team_id = _int_or_none(request.query_params.get('teamId'))
+            top_k = min(int(request.query_params.get('top', 10)), 100)
+            radius = min(int(request.query_params.get('radius', 2)), 50)
+            around_id = _int_or_none(request.query_params.get('around'))
+        except ValueError:
+            return Response({'detail': 'Параметры должны быть целыми числами'}, status=400)
+
+        if team_id:
+            team = Team.objects.select_related('classroom').filter(id=team_id).first()
+            if not team:
+                return Response({'detail': 'Команда не найдена'}, status=404)
+            allowed = team.classroom.teacher_id == request.user.id \
+                or TeamMembership.objects.filter(team=team, student=request.user).exists()
+            ctx = (class_id, team.id)
+        elif class_id:
+            classroom = Classroom.objects.filter(id=class_id).first()
+            if not classroom:
+                return Response({'detail': 'Класс не найден'}, status=404)
+            allowed = classroom.teacher_id == request.user.id \
+                or classroom.memberships.filter(student=request.user).exists() \
+                or TeamMembership.objects.filter(team__classroom=classroom, student=request.user).exists()
+            ctx = (classroom.id, None)
+        else:
+            allowed = True
+            ctx = (None, None)
+        if not allowed:
+            return Response({'detail': 'Доступ запрещён'}, status=403)
+
+        # Студент по умолчанию смотрит соседей вокруг себя
+        if around_id is None and request.user.role == 'STUDENT':
+            around_id = request.user.id
+
+        data = {'top': [(i, sid, pts) for i, (sid, pts) in enumerate(leaderboard.top(ctx, top_k), start=1)]}
+        if around_id is not None:
+            data['me'] = {'studentId': around_id, 'rank': leaderboard.rank(ctx, around_id)}
+            data['around'] = leaderboard.around(ctx, around_id, radius)
+
+        # Имена — одним запросом на все упомянутые id
+        ids = {sid for rows in (data['top'], data.get('around', [])) for _, sid, _ in rows}
+        names = dict(User.objects.filter(id__in=ids).values_list('id', 'username'))
+        for key in ('top', 'around'):
+            if key in data:
+                data[key] = [{'rank': rank, 'studentId': sid, 'username': names.get(sid), 'points': pts}
+                             for rank, sid, pts in data[key]]
+        return Response(data, status=200)
+
+
+def _int_or_none(value) -> Optional[int]:
+    return int(value) if value not in (None, '') else None
+
+
 class BattleView(APIView):
     """
     POST /api/battles/launch
     Body: {"teamId": 123, "dueAt": "2025-09-30T18:00:00Z" (optional)}
-    Доступ: учитель класса.
-    Эффект: для каждого участника команды создаётся Assignment с задачей, подобранной под его "уровень".
+      или {"teamIds": [123, 124]} — несколько команд сразу,
+      или {"classId": 45} — все команды класса (общешкольные события).
+    Доступ: учитель класса (всех затронутых классов).
+    Эффект: для каждой команды создаётся Battle (LIVE; 409, если битва команды уже идёт),
+    для каждого участника — Assignment этой битвы с задачей, подобранной под его "уровень".
+    Всё делается пакетно: участники и очки — по одному запросу, задачи — из индекса
+    в памяти, выдачи — одним bulk_create.
     """
     permission_classes = [IsAuthenticated, IsTeacher]
 
     @transaction.atomic
     def post(self, request):
         team_id = request.data.get('teamId')
+        team_ids = request.data.get('teamIds')
+        class_id = request.data.get('classId')
         due_at = request.data.get('dueAt')  # строка ISO или None
 
-        if not team_id:
-            return Response({'detail': 'Требуется teamId'}, status=400)
-
         try:
-            team = Team.objects.select_related('classroom').get(id=team_id)
-        except Team.DoesNotExist:
-            return Response({'detail': 'Команда не найдена'}, status=404)
+            team_id = _int_or_none(team_id)
+            class_id = _int_or_none(class_id)
+            if team_ids is not None and not isinstance(team_ids, list):
+                raise TypeError
+            team_ids = {int(tid) for tid in team_ids} if team_ids else None
+        except (TypeError, ValueError):
+            return Response({'detail': 'teamId, teamIds и classId должны быть целыми числами (teamIds — списком)'},
+                            status=400)
+
+        teams_qs = Team.objects.select_related('classroom')
+        if team_id:
+            teams = list(teams_qs.filter(id=team_id))
+            if not teams:
+                return Response({'detail': 'Команда не найдена'}, status=404)
+        elif team_ids:
+            teams = list(teams_qs.filter(id__in=team_ids))
+            missing = sorted(team_ids - {t.id for t in teams})
+            if missing:
+                return Response({'detail': 'Команды не найдены', 'teamIds': missing}, status=404)
+        elif class_id:
+            teams = list(teams_qs.filter(classroom_id=class_id))
+            if not teams:
+                return Response({'detail': 'В классе нет команд'}, status=404)
+        else:
+            return Response({'detail': 'Требуется teamId, teamIds или classId'}, status=400)
 
-        # Проверка, что текущий пользователь — учитель этого класса
-        if team.classroom.teacher_id != request.user.id:
+        # Проверка, что текущий пользователь — учитель всех этих классов
+        if any(t.classroom.teacher_id != request.user.id for t in teams):
             return Response({'detail': 'Доступ запрещён: вы не учитель этого класса'}, status=403)
 
-        # Получаем участников команды
-        member_ids: List[int] = list(
-            TeamMembership.objects.filter(team=team).values_list('student_id', flat=True)
-        )
-        if not member_ids:
+        # Участники всех команд — одним запросом
+        members: Dict[int, List[int]] = defaultdict(list)
+        for tid, student_id in TeamMembership.objects.filter(team__in=teams).values_list('team_id', 'student_id'):
+            members[tid].append(student_id)
+        if team_id and not members:
             return Response({'detail': 'В команде нет участников'}, status=400)
-
-        # Подбор задач и создание персональных Assignment
-        created = []
-        for student_id in member_ids:
-            # 1) Определим «очки» в контексте команды/класса/глобально
-            pts = _get_student_points(student_id, team.classroom_id, team.id)
-
-            # 2) Вычислим «уровень»
-            level = _points_to_level(pts)
-
-            # 3) Найдём подходящую задачу по тегу L{level}
-            task = _pick_task_for_level(level)
-            if not task:
-                return Response({'detail': f'Нет подходящих задач для уровня {level}'}, status=409)
-
-            # 4) Создадим персонифицированную выдачу
-            a = Assignment.objects.create(
-                task=task,
-                classroom=None,          # битва конкретной команды
+        if not members:
+            return Response({'detail': 'В командах нет участников'}, status=400)
+
+        # У команды не больше одной идущей битвы
+        running = dict(Battle.objects.filter(team__in=teams, status=Battle.Status.LIVE).values_list('team_id', 'id'))
+        if running:
+            return Response({'detail': 'У команд уже идёт битва', 'battles': running}, status=409)
+
+        # Очки всех участников во всех контекстах — одним запросом
+        points = _get_points_for_members(teams, members)
+
+        # Подбор задач (в памяти) — до создания битв: при отказе в БД ничего не остаётся
+        picked: List[tuple] = []
+        for team in teams:
+            for student_id in members.get(team.id, []):
+                # 1) «Уровень» из очков в контексте команды/класса/глобально
+                level = _points_to_level(points(student_id, team))
+
+                # 2) Подходящая задача по уровню
+                task_id = _pick_task_for_level(level)
+                if not task_id:
+                    return Response({'detail': f'Нет подходящих задач для уровня {level}'}, status=409)
+                picked.append((team, task_id))
+
+        # Битвы команд с участниками — одним bulk_create (id нужны для выдач)
+        try:
+            with transaction.atomic():
+                battles = {b.team_id: b for b in Battle.objects.bulk_create([
+                    Battle(team=team, started_by=request.user, ends_at=due_at)
+                    for team in teams if members.get(team.id)
+                ])}
+        except IntegrityError:
+            # Параллельный запуск успел раньше
+            return Response({'detail': 'У команд уже идёт битва'}, status=409)
+
+        # 3) Персонифицированные выдачи (битва конкретной команды)
+        to_create = [
+            Assignment(
+                task_id=task_id,
+                classroom=None,
                 team=team,
+                battle=battles[team.id],
                 assigned_by=request.user,
                 due_at=due_at
             )
-            created.append(a.id)
+            for team, task_id in picked
+        ]
+
+        created = Assignment.objects.bulk_create(to_create)
+        bump_classes(t.classroom_id for t in teams)
+
+        by_team: Dict[int, List[int]] = defaultdict(list)
+        for a in created:
+            by_team[a.team_id].append(a.id)
+        return Response({
+            'detail': 'Битва запущена',
+            'assignments': [a.id for a in created],
+            'teams': by_team,
+            'battles': {team_id: b.id for team_id, b in battles.items()},
+        }, status=201)
+
+
+class BattleDetailView(APIView):
+    """
+    GET /api/battles/{id} — состояние битвы и таблица: живая (из памяти, см.
+    api/battle_state.py) для идущей, сохранённая итоговая — для закрытой.
+    Доступ: учитель класса и участники команды.
+    """
+    permission_classes = [IsAuthenticated]
 
-        return Response({'detail': 'Битва запущена', 'assignments': created}, status=201)
+    def get(self, request, battle_id: int):
+        battle = Battle.objects.select_related('team__classroom').filter(id=battle_id).first()
+        if battle is None:
+            return Response({'detail': 'Битва не найдена'}, status=404)
+        allowed = battle.team.classroom.teacher_id == request.user.id \
+            or TeamMembership.objects.filter(team_id=battle.team_id, student=request.user).exists()
+        if not allowed:
+            return Response({'detail': 'Доступ запрещён'}, status=403)
+        snapshot = live_battles.snapshot(battle)
+        return Response({
+            'id': battle.id,
+            'teamId': battle.team_id,
+            'status': battle.status,
+            'startedAt': battle.started_at,
+            'endsAt': battle.ends_at,
+            'finishedAt': battle.finished_at,
+            'version': snapshot['version'],
+            'standings': snapshot['standings'],
+        }, status=200)
+
+
+class BattleCloseView(APIView):
+    """
+    POST /api/battles/{id}/finish | /api/battles/{id}/cancel
+    Закрыть идущую битву: ответы больше не принимаются, итоговая таблица
+    сохраняется в битве, участники получают battle_closed.
+    Доступ: учитель класса. 409 — битва уже закрыта.
+    """
+    permission_classes = [IsAuthenticated, IsTeacher]
+    target_status = Battle.Status.FINISHED
+
+    def post(self, request, battle_id: int):
+        battle = Battle.objects.select_related('team__classroom').filter(id=battle_id).first()
+        if battle is None:
+            return Response({'detail': 'Битва не найдена'}, status=404)
+        if battle.team.classroom.teacher_id != request.user.id:
+            return Response({'detail': 'Доступ запрещён: вы не учитель этого класса'}, status=403)
+        try:
+            battle = close_battle(battle.id, self.target_status)
+        except BattleStateError as e:
+            return Response({'detail': str(e)}, status=409)
+        return Response({
+            'id': battle.id,
+            'status': battle.status,
+            'finishedAt': battle.finished_at,
+            'standings': battle.standings,
+        }, status=200)
 
 
 # ---- Вспомогательные функции подбора ----
 
-def _get_student_points(student_id: int, classroom_id: int, team_id: int) -> int:
+def _get_points_for_members(teams: List[Team], members: Dict[int, List[int]]):
     """
-    Возвращает текущие очки студента: сперва смотрим Score по team,
+    Загружает Score всех участников одним запросом и возвращает функцию
+    points(student_id, team) с прежним порядком поиска: сперва Score по team,
     затем по classroom, затем глобально (оба None).
     """
-    # team-контекст
-    sc = Score.objects.filter(student_id=student_id, team_id=team_id).first()
-    if sc:
-        return sc.total_points
+    student_ids = {sid for ids in members.values() for sid in ids}
+    rows = Score.objects.filter(student_id__in=student_ids).filter(
+        models.Q(team_id__in=[t.id for t in teams])
+        | models.Q(classroom_id__in={t.classroom_id for t in teams}, team__isnull=True)
+        | models.Q(classroom__isnull=True, team__isnull=True)
+    ).values_list('student_id', 'classroom_id', 'team_id', 'total_points')
+
+    by_team: Dict[Tuple[int, int], int] = {}
+    by_class: Dict[Tuple[int, int], int] = {}
+    by_global: Dict[int, int] = {}
+    for student_id, classroom_id, team_id, total in rows:
+        if team_id is not None:
+            by_team.setdefault((student_id, team_id), total)
+        elif classroom_id is not None:
+            by_class[(student_id, classroom_id)] = total
+        else:
+            by_global[student_id] = total
 
-    # class-контекст
-    sc = Score.objects.filter(student_id=student_id, classroom_id=classroom_id, team__isnull=True).first()
-    if sc:
-        return sc.total_points
+    def points(student_id: int, team: Team) -> int:
+        if (student_id, team.id) in by_team:
+            return by_team[(student_id, team.id)]
+        if (student_id, team.classroom_id) in by_class:
+            return by_class[(student_id, team.classroom_id)]
+        return by_global.get(student_id, 0)
 
-    # глобальный (ни team, ни classroom)
-    sc = Score.objects.filter(student_id=student_id, classroom__isnull=True, team__isnull=True).first()
-    return sc.total_points if sc else 0
+    return points
 
 
 def _points_to_level(points: int) -> int:
@@ -462,29 +701,10 @@ def _points_to_level(points: int) -> int:
     return max(1, 1 + (points // 100))
 
 
-def _pick_task_for_level(level: int) -> Optional[Task]:
+def _pick_task_for_level(level: int) -> Optional[int]:
     """
-    Ищем задачу по тегу 'L{level}'. Если не нашли — мягкие фоллбеки:
-    - L{level+1}, L{level-1}, ... в радиусе 3
-    - иначе берём по сложности (EASY/MEDIUM/HARD) как эвристика
+    id задачи для уровня 'L{level}' с мягкими фоллбеками (соседние уровни
+    в радиусе 3, затем сложность). Ищем во внутрипроцессном индексе
+    (api/task_index.py), а не запросами к JSON-тегам.
     """
-    tag = f"L{level}"
-    task = Task.objects.filter(tags__contains=[tag]).order_by('-created_at').first()
-    if task:
-        return task
-
-    # Радиус поиска по соседним уровням
-    for delta in [1, -1, 2, -2, 3, -3]:
-        t = Task.objects.filter(tags__contains=[f"L{level+delta}"]).order_by('-created_at').first()
-        if t:
-            return t
-
-    # Fallback: по сложности — чем выше уровень, тем сложнее
-    if level <= 2:
-        diff = 'EASY'
-    elif level <= 5:
-        diff = 'MEDIUM'
-    else:
-        diff = 'HARD'
-    return Task.objects.filter(difficulty=diff).order_by('-created_at').first()
-
+    return task_index.pick(level)
@@ -1,38 +1,206 @@
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from collections import OrderedDict
+from django.conf import settings
+import asyncio
+import itertools
 import json
 
-class BattleConsumer(WebsocketConsumer):
-    def connect(self):
+from api.battle_state import BattleClosed, live_battles
+from api.broadcast import battle_group
+from api.models import Assignment, Battle
+from api.grading_pool import grading_executor
+from api.metrics import metrics
+from api.submissions import load_assignment, record_submission
+
+_socket_config = getattr(settings, 'BATTLE_SOCKET', {})
+
+# Работа с БД — в пуле потоков, не в event loop; thread_sensitive=False, чтобы
+# ответы разных сокетов проверялись параллельно, а не в одном общем потоке
+_load_assignment = database_sync_to_async(load_assignment, thread_sensitive=False)
+_record_submission = database_sync_to_async(record_submission, thread_sensitive=False)
+_snapshot = database_sync_to_async(live_battles.snapshot, thread_sensitive=False)
+
+
+@database_sync_to_async
+def _load_battle(battle_id):
+    try:
+        return Battle.objects.filter(id=int(battle_id)).first()
+    except (TypeError, ValueError):
+        return None
+
+
+class BattleConsumer(AsyncWebsocketConsumer):
+    """
+    Сокет битвы: ws/battle/{battle_id}/ (id модели Battle)
+
+    После подключения клиент получает снимок счёта (battle_snapshot), затем —
+    события ответов, дельты счёта (battle_standing) и battle_closed при
+    закрытии битвы (api/battle_state.py).
+
+    События группы не отправляются клиенту по одному: они копятся в буфере
+    сокета и раз в flush_interval уходят одним кадром battle_batch.
+    Кадры приходят уже сериализованными (см. api/broadcast.py), поэтому здесь
+    только склеиваем строки. Буфер ограничен: кадры-состояния с одинаковым
+    ключом заменяют друг друга, а при переполнении отбрасываются самые старые —
+    медленный клиент не копит очередь без предела.
+    """
+    flush_interval = _socket_config.get('FLUSH_INTERVAL_MS', 100) / 1000
+    max_buffer = _socket_config.get('MAX_BUFFER', 200)
+
+    async def connect(self):
         # Извлекаем battle_id из URL маршрута (self.scope['url_route']['kwargs'])
         self.battle_id = self.scope['url_route']['kwargs'].get('battle_id')
-        self.group_name = f"battle_{self.battle_id}"
-        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
-        self.accept()
-        self.send(text_data=json.dumps({
+        self.group_name = battle_group(self.battle_id)
+        self._buffer = OrderedDict()
+        self._seq = itertools.count()
+        self._dropped = 0
+        self._flush_task = None
+        self._joined = False
+
+        # Пользователь и его команды уже определены JWTAuthMiddleware (battles/middleware.py):
+        # чужой сокет отклоняем до входа в группу рассылки
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.battle = await _load_battle(self.battle_id)
+        if self.battle is None or self.battle.team_id not in self.scope.get("team_ids", ()):
+            await self.close(code=4403)
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self._joined = True
+        await self.accept(subprotocol=self.scope.get("subprotocol"))
+        await self.send(text_data=json.dumps({
             "type": "connection_success",
             "message": f"Подключение к битве {self.battle_id} успешно"
         }))
+        # Снимок — уже после входа в группу: дельты новее него придут следом,
+        # а более старые клиент отбросит по version
+        snapshot = await _snapshot(self.battle)
+        await self.send(text_data=json.dumps(snapshot))
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(self.group_name, self.channel_name)
+    async def disconnect(self, close_code):
+        if self._flush_task:
+            self._flush_task.cancel()
+        if self._joined:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data)
+        except (TypeError, ValueError):
+            await self._send_error("Некорректный JSON")
+            return
 
-    def receive(self, text_data):
-        data = json.loads(text_data)
-        # Пример обработки действия submit_answer
         action = data.get("action")
         if action == "submit_answer":
-            answer = data.get("answer")
-            # Здесь можно добавить обработку ответа
-            self.send(text_data=json.dumps({
-                "type": "answer_received",
-                "message": f"Ответ '{answer}' получен"
-            }))
+            # SQL-запросы и длительность обработки — в метриках, как у HTTP (api/metrics.py)
+            with metrics.track("BattleConsumer.submit_answer"):
+                await self.submit_answer(data)
         # Можно добавить другие действия
 
-    def battle_update(self, event):
-        # Отправка обновления всем участникам группы
-        self.send(text_data=json.dumps({
-            "type": event.get("type", "battle_update"),
-            "message": event.get("message", "")
+    async def submit_answer(self, data):
+        """
+        {"action": "submit_answer", "assignment": 1001, "answer": "42",
+         "attempt_no": 1, "requestId": "..."}
+        Ответ проверяется тем же кодом, что и POST /api/submissions
+        (api/submissions.py), вердикт возвращается в этот же сокет.
+        """
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated or user.role != "STUDENT":
+            await self._send_error("Отправлять ответы может только авторизованный ученик", data)
+            return
+
+        try:
+            assignment_id = int(data.get("assignment"))
+            attempt_no = int(data.get("attempt_no", 1))
+        except (TypeError, ValueError):
+            await self._send_error("Требуется assignment", data)
+            return
+        payload = data.get("answer_payload")
+        if payload is None:
+            payload = {"answer": data.get("answer")}
+
+        try:
+            assignment = await _load_assignment(assignment_id)
+        except Assignment.DoesNotExist:
+            await self._send_error("Задание не найдено", data)
+            return
+        if assignment.battle_id != self.battle.id:
+            await self._send_error("Задание не из этой битвы", data)
+            return
+
+        # Дорогая проверка уходит в пул процессов; ждём её, не занимая поток
+        result = await grading_executor.grade_async(assignment.task, payload)
+        try:
+            submission = await _record_submission(user.id, assignment, payload, attempt_no, result=result)
+        except BattleClosed as e:
+            await self._send_error(str(e.detail), data)
+            return
+
+        await self.send(text_data=json.dumps({
+            "type": "answer_result",
+            "requestId": data.get("requestId"),
+            "submissionId": submission.id,
+            "is_correct": submission.is_correct,
+            "feedback": submission.feedback,
+            "points": submission.points_awarded,
+        }))
+
+    async def _send_error(self, message: str, data=None):
+        await self.send(text_data=json.dumps({
+            "type": "error",
+            "requestId": (data or {}).get("requestId"),
+            "message": message,
         }))
+
+    # --- события группы ---
+
+    async def battle_frames(self, event):
+        # Готовые JSON-кадры от outbox'а: [[key | None, "<json>"], ...]
+        for key, frame in event.get("frames", []):
+            self._push(key, frame)
+
+    async def battle_update(self, event):
+        self._push(None, json.dumps(event.get("message", "")))
+
+    async def battle_batch(self, event):
+        for message in event.get("messages", []):
+            self._push(None, json.dumps(message))
+
+    # --- буфер сокета ---
+
+    def _push(self, key, frame: str):
+        if key is None:
+            key = f"#{next(self._seq)}"
+        else:
+            # Более свежее состояние заменяет неотправленное старое
+            self._buffer.pop(key, None)
+        self._buffer[key] = frame
+
+        while len(self._buffer) > self.max_buffer:
+            self._buffer.popitem(last=False)
+            self._dropped += 1
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Пока шла отправка, могли накопиться новые кадры — отправляем и их
+        while self._buffer:
+            frames = list(self._buffer.values())
+            self._buffer.clear()
+            dropped, self._dropped = self._dropped, 0
+            await self.send(text_data=self._pack(frames, dropped))
+
+    @staticmethod
+    def _pack(frames, dropped: int) -> str:
+        if len(frames) == 1 and not dropped:
+            return '{"type": "battle.update", "message": ' + frames[0] + '}'
+        return (
+            '{"type": "battle_batch", "dropped": ' + str(dropped)
+            + ', "messages": [' + ', '.join(frames) + ']}'
+        )
@@ -0,0 +1,68 @@
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+from urllib.parse import parse_qs
+
+from api.authentication import get_token_user
+from api.models import Team
+
+# Браузерный WebSocket не умеет слать заголовок Authorization: токен передаётся
+# в строке запроса (?token=...) или подпротоколом: new WebSocket(url, ["bearer", token])
+TOKEN_QUERY_PARAMS = ("token", "access_token")
+BEARER_SUBPROTOCOL = "bearer"
+
+
+def _token_from_scope(scope):
+    """(токен, подпротокол для accept) из подпротоколов или строки запроса."""
+    subprotocols = scope.get("subprotocols") or []
+    if BEARER_SUBPROTOCOL in subprotocols:
+        i = subprotocols.index(BEARER_SUBPROTOCOL)
+        if i + 1 < len(subprotocols):
+            return subprotocols[i + 1], BEARER_SUBPROTOCOL
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    for name in TOKEN_QUERY_PARAMS:
+        if query.get(name):
+            return query[name][0], None
+    return None, None
+
+
+def _resolve(raw_token):
+    """Пользователь токена и id команд, битвы которых ему доступны, — один запрос к БД."""
+    try:
+        user = get_token_user(AccessToken(raw_token))
+    except (TokenError, AuthenticationFailed):
+        return AnonymousUser(), frozenset()
+    if user.role == "STUDENT":
+        teams = Team.objects.filter(memberships__student_id=user.id)
+    elif user.role == "TEACHER":
+        teams = Team.objects.filter(classroom__teacher_id=user.id)
+    elif user.is_staff:
+        teams = Team.objects.all()
+    else:
+        teams = Team.objects.none()
+    return user, frozenset(teams.values_list("id", flat=True))
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Аутентификация сокета по access-токену (api/authentication.py) вместо сессий.
+
+    Один раз на подключение кладёт в scope:
+      user         — пользователь токена или AnonymousUser;
+      team_ids     — frozenset команд, в битвы которых ему можно войти;
+      subprotocol  — подпротокол, которым подтвердить рукопожатие (или None).
+    Дальше consumer проверяет права по этим данным, без запросов к БД.
+    Истечение токена посреди соединения не отслеживается: сокет живёт до отключения.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw_token, subprotocol = _token_from_scope(scope)
+        if raw_token:
+            user, team_ids = await database_sync_to_async(_resolve)(raw_token)
+        else:
+            user, team_ids = AnonymousUser(), frozenset()
+        scope = dict(scope, user=user, team_ids=team_ids, subprotocol=subprotocol)
+        return await super().__call__(scope, receive, send)
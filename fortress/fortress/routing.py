@@ -1,17 +1,21 @@
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 
-from battles import consumers
+# Django-приложение создаём до импорта consumers: они используют модели
+django_asgi_app = get_asgi_application()
+
+from battles import consumers  # noqa: E402
+from battles.middleware import JWTAuthMiddleware  # noqa: E402
 
 websocket_urlpatterns = [
     re_path(r"ws/battle/(?P<battle_id>\w+)/$", consumers.BattleConsumer.as_asgi()),
 ]
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    # Сокеты аутентифицируются по JWT (?token=... или подпротокол "bearer"), как и API
+    "websocket": JWTAuthMiddleware(
         URLRouter(websocket_urlpatterns)
     ),
 })
@@ -28,6 +28,7 @@ AUTH_USER_MODEL = 'api.User'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.MetricsMiddleware',  # SQL-запросы и длительность по эндпоинтам (api/metrics.py)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,6 +56,49 @@ TEMPLATES = [
 WSGI_APPLICATION = 'fortress.wsgi.application'
 ASGI_APPLICATION = 'fortress.asgi.application'
 
+# Channels: Redis, если задан REDIS_URL (нужен пакет channels_redis),
+# иначе — внутрипроцессный слой (один процесс, удобно для разработки и тестов)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'api.channel_layers.LocalChannelLayer'},
+    }
+
+# Рассылка обновлений битв (api/broadcast.py): окно склейки событий и размер пачки
+BATTLE_BROADCAST = {
+    'FLUSH_INTERVAL_MS': int(os.getenv('BATTLE_BROADCAST_FLUSH_MS', '50')),
+    'MAX_BATCH': 200,
+}
+
+# Сокет битвы (battles/consumers.py): как часто отдавать клиенту пачку и сколько кадров держать в буфере
+BATTLE_SOCKET = {
+    'FLUSH_INTERVAL_MS': int(os.getenv('BATTLE_SOCKET_FLUSH_MS', '100')),
+    'MAX_BUFFER': 200,
+}
+
+# Живой счёт битв в памяти (api/battle_state.py): через сколько секунд перечитывать его из БД
+# (страховка от ответов, принятых другими процессами)
+BATTLE_LIVE = {
+    'MAX_AGE': float(os.getenv('BATTLE_LIVE_MAX_AGE', '300')),
+}
+
+# Начисление очков (api/score_ledger.py):
+# 'sync' — Score обновляется в транзакции отправки;
+# 'write_behind' — приращения копятся в памяти процесса и пишутся пачкой раз в FLUSH_INTERVAL_MS
+# (или при MAX_PENDING ключах); при падении процесса Score восстанавливается командой rebuild_scores
+SCORE_LEDGER = {
+    'MODE': os.getenv('SCORE_LEDGER_MODE', 'sync'),
+    'FLUSH_INTERVAL_MS': int(os.getenv('SCORE_LEDGER_FLUSH_MS', '200')),
+    'MAX_PENDING': 5000,
+}
+
 # SQLite для демо; для продакшена используйте PostgreSQL
 DATABASES = {
     'default': {
@@ -88,7 +132,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # DRF + JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # JWT
+        'api.authentication.ClaimsJWTAuthentication',  # JWT, пользователь из claims (api/authentication.py)
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',  # по умолчанию требуем аутентификацию
@@ -103,4 +147,88 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=14),
     'ROTATE_REFRESH_TOKENS': False,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # В токены кладём role/username/is_staff — запросы обходятся без SELECT пользователя
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
+}
+
+# Пользователь из JWT (api/authentication.py): TRUST_CLAIMS — строить его из claims токена;
+# USER_CACHE_TTL — сколько секунд держать в памяти пользователя, прочитанного из БД (0 — не кэшировать)
+JWT_AUTH = {
+    'TRUST_CLAIMS': os.getenv('JWT_TRUST_CLAIMS', '1') == '1',
+    'USER_CACHE_TTL': float(os.getenv('JWT_USER_CACHE_TTL', '30')),
+}
+
+# Пакетная отправка ответов (POST /api/submissions/batch)
+SUBMISSION_BATCH_MAX = int(os.getenv('SUBMISSION_BATCH_MAX', '500'))
+
+# Источник данных для отчётов класса (api/report_queries.py):
+# 'materialized' — агрегаты, обновляемые при проверке; 'sql' — GROUP BY по Submission
+REPORT_AGGREGATION = os.getenv('REPORT_AGGREGATION', 'materialized')
+
+# Кэш посчитанных отчётов по версии данных класса (api/data_version.py), сек:
+# ключ меняется с версией, таймаут лишь ограничивает память кэша
+REPORT_CACHE_TIMEOUT = int(os.getenv('REPORT_CACHE_TIMEOUT', '600'))
+
+# Excel-экспорт (api/report_export.py): до этого размера, МБ, файл собирается в памяти, дальше — во временном файле
+REPORT_EXPORT_SPOOL_MB = int(os.getenv('REPORT_EXPORT_SPOOL_MB', '8'))
+
+# Фоновый экспорт отчётов (api/export_jobs.py): очередь — таблица ExportJob, готовые файлы — в DIR.
+# IN_PROCESS=False — потоки в веб-процессах не запускаются, заявки выполняет manage.py run_export_worker
+REPORT_EXPORT_JOBS = {
+    'DIR': os.getenv('REPORT_EXPORT_DIR', str(BASE_DIR / 'var' / 'exports')),
+    'WORKERS': int(os.getenv('REPORT_EXPORT_WORKERS', '2')),
+    'POLL_INTERVAL': float(os.getenv('REPORT_EXPORT_POLL_INTERVAL', '2')),
+    'STALE_AFTER': float(os.getenv('REPORT_EXPORT_STALE_AFTER', '600')),
+    'IN_PROCESS': os.getenv('REPORT_EXPORT_IN_PROCESS', '1') == '1',
+}
+
+# Индекс задач по уровням для запуска битв (api/task_index.py): страховочный TTL, сек
+TASK_INDEX_TTL = float(os.getenv('TASK_INDEX_TTL', '60'))
+
+# Рейтинги (api/leaderboard.py): 'memory' — отсортированные списки в процессе,
+# 'sql' — запросы COUNT к Score (несколько процессов без общей памяти)
+LEADERBOARD_BACKEND = os.getenv('LEADERBOARD_BACKEND', 'memory')
+LEADERBOARD_MAX_AGE = float(os.getenv('LEADERBOARD_MAX_AGE', '300'))
+
+# Кэш скомпилированных проверщиков ответов (api/checkers.py): сколько задач держать в LRU
+CHECKER_CACHE_SIZE = int(os.getenv('CHECKER_CACHE_SIZE', '2048'))
+
+# LRU вердиктов по (задача, версия задачи, нормализованный ответ) — повторные ответы не проверяются заново
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', '10000'))
+
+# Метрики запросов (api/metrics.py): GET /api/metrics в формате Prometheus.
+# QUERY_BUDGETS — предел SQL-запросов на эндпоинт («Вид.действие»); при превышении
+# BUDGET_ACTION='log' пишет предупреждение, 'raise' роняет запрос (для тестов и CI)
+METRICS = {
+    'ENABLED': os.getenv('METRICS', '1') == '1',
+    'ALLOWED_IPS': os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),
+    'BUDGET_ACTION': os.getenv('METRICS_BUDGET_ACTION', 'log'),
+    'QUERY_BUDGETS': {
+        'SubmissionViewSet.create': 16,
+        'SubmissionViewSet.batch': 40,
+        'BattleConsumer.submit_answer': 16,
+        'BattleView.post': 16,
+        'BattleDetailView.get': 6,
+        'BattleCloseView.post': 10,
+        'LeaderboardView.get': 6,
+        'ScoreViewSet.list': 4,
+        'TaskViewSet.list': 4,
+        'ClassOverviewReportView.get': 12,
+        'StudentReportView.get': 12,
+        'ReportExportView.post': 16,
+    },
+}
+
+# Пул процессов для дорогих проверок ответов (api/grading_pool.py): символьные выражения и т.п.
+# Дешёвые проверки выполняются в потоке запроса; TIMEOUT_MS — лимит на одну проверку,
+# MEMORY_MB — лимит адресного пространства процесса проверки; STALE_AFTER — через сколько
+# секунд отправка без вердикта считается брошенной и допроверяется (manage.py regrade_pending)
+GRADING_POOL = {
+    'ENABLED': os.getenv('GRADING_POOL', '1') == '1',
+    'MAX_WORKERS': int(os.getenv('GRADING_POOL_WORKERS', '2')),
+    'TIMEOUT_MS': int(os.getenv('GRADING_TIMEOUT_MS', '2000')),
+    'MEMORY_MB': int(os.getenv('GRADING_MEMORY_MB', '256')),
+    'START_METHOD': 'spawn',
+    'STALE_AFTER': float(os.getenv('GRADING_STALE_AFTER', '60')),
 }